@@ -19,15 +19,20 @@ import inspect
 import binascii
 import json
 import logging
+import os
 import re
+import threading
 import time
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from functools import partial
 from typing import Any, Union, Tuple
 
+import xxhash
+
 from agent.component import component_class
-from agent.component.base import ComponentBase
+from agent.component.base import ComponentBase, ComponentParamBase, _IS_CHECKED
 from api.db.services.file_service import FileService
 from api.db.services.llm_service import LLMBundle
 from api.db.services.task_service import has_canceled
@@ -37,6 +42,58 @@ from common.exceptions import TaskCanceledException
 from rag.prompts.generator import chunks_format
 from rag.utils.redis_conn import REDIS_CONN
 
+# With CANVAS_NATIVE_ASYNC, components implementing `_invoke_async` without blocking the event loop
+# (`native_async_safe()`) are awaited on the request loop and the others run on one executor of
+# CANVAS_MAX_WORKERS threads shared by all canvases.
+CANVAS_NATIVE_ASYNC = int(os.environ.get("CANVAS_NATIVE_ASYNC", "0"))
+CANVAS_MAX_WORKERS = int(os.environ.get("CANVAS_MAX_WORKERS", "32"))
+_sync_component_pool = ThreadPoolExecutor(max_workers=CANVAS_MAX_WORKERS, thread_name_prefix="canvas_cpn")
+
+
+def _run_async_in_thread(coro_func, **call_kwargs):
+    return asyncio.run(coro_func(**call_kwargs))
+
+
+def _has_native_async(cpn) -> bool:
+    native_async_safe = getattr(cpn, "native_async_safe", None)
+    if not native_async_safe or not native_async_safe():
+        return False
+    return asyncio.iscoroutinefunction(getattr(cpn, "_invoke_async", None)) or asyncio.iscoroutinefunction(cpn._invoke)
+
+
+# Component params are validated once per distinct configuration; later loads of the same agent,
+# e.g. every message of a session, copy the checked template and only apply the run-time fields.
+CANVAS_PARAM_CACHE_SIZE = int(os.environ.get("CANVAS_PARAM_CACHE_SIZE", "1024"))
+_RUNTIME_PARAMS = ("inputs", "outputs", "debug_inputs")
+_compiled_params = OrderedDict()
+_compiled_params_lock = threading.Lock()
+
+
+def _compiled_param(component_name, params) -> ComponentParamBase:
+    static = {k: v for k, v in params.items() if k not in _RUNTIME_PARAMS}
+    key = (component_name, xxhash.xxh128_hexdigest(json.dumps(static, ensure_ascii=False, sort_keys=True).encode("utf-8")))
+    with _compiled_params_lock:
+        template = _compiled_params.get(key)
+        if template is not None:
+            _compiled_params.move_to_end(key)
+    if template is None:
+        template = component_class(component_name + "Param")()
+        template.update(static)
+        template.check()
+        setattr(template, _IS_CHECKED, True)
+        if CANVAS_PARAM_CACHE_SIZE > 0:
+            with _compiled_params_lock:
+                _compiled_params[key] = template
+                while len(_compiled_params) > CANVAS_PARAM_CACHE_SIZE:
+                    _compiled_params.popitem(last=False)
+
+    param = deepcopy(template)
+    runtime = {k: params[k] for k in _RUNTIME_PARAMS if k in params}
+    if runtime:
+        param.update(runtime)
+    return param
+
+
 class Graph:
     """
         dsl = {
@@ -93,10 +150,8 @@ class Graph:
         cpn_nms = set([])
         for k, cpn in self.components.items():
             cpn_nms.add(cpn["obj"]["component_name"])
-            param = component_class(cpn["obj"]["component_name"] + "Param")()
-            param.update(cpn["obj"]["params"])
             try:
-                param.check()
+                param = _compiled_param(cpn["obj"]["component_name"], cpn["obj"]["params"])
             except Exception as e:
                 raise ValueError(self.get_component_name(k) + f": {e}")
 
@@ -110,19 +165,20 @@ class Graph:
         dsl = {
             "components": {}
         }
+        # Serialized right away, so nothing needs copying.
         for k in self.dsl.keys():
             if k in ["components"]:
                 continue
-            dsl[k] = deepcopy(self.dsl[k])
+            dsl[k] = self.dsl[k]
 
         for k, cpn in self.components.items():
             if k not in dsl["components"]:
                 dsl["components"][k] = {}
             for c in cpn.keys():
                 if c == "obj":
-                    dsl["components"][k][c] = json.loads(str(cpn["obj"]))
+                    dsl["components"][k][c] = {"component_name": cpn["obj"].component_name, "params": cpn["obj"]._param.as_dict()}
                     continue
-                dsl["components"][k][c] = deepcopy(cpn[c])
+                dsl["components"][k][c] = cpn[c]
         return json.dumps(dsl, ensure_ascii=False)
 
     def reset(self):
@@ -278,7 +334,8 @@ class Graph:
 
 class Canvas(Graph):
 
-    def __init__(self, dsl: str, tenant_id=None, task_id=None, canvas_id=None):
+    def __init__(self, dsl: str, tenant_id=None, task_id=None, canvas_id=None, native_async: bool | None = None):
+        self.native_async = bool(CANVAS_NATIVE_ASYNC) if native_async is None else native_async
         self.globals = {
             "sys.query": "",
             "sys.user_id": tenant_id,
@@ -420,9 +477,6 @@ class Canvas(Graph):
             loop = asyncio.get_running_loop()
             tasks = []
 
-            def _run_async_in_thread(coro_func, **call_kwargs):
-                return asyncio.run(coro_func(**call_kwargs))
-
             i = f
             while i < t:
                 cpn = self.get_component_obj(self.path[i])
@@ -447,11 +501,7 @@ class Canvas(Graph):
                 if task_fn is None:
                     continue
 
-                invoke_async = getattr(cpn, "invoke_async", None)
-                if invoke_async and asyncio.iscoroutinefunction(invoke_async):
-                    tasks.append(loop.run_in_executor(self._thread_pool, partial(_run_async_in_thread, invoke_async, **(call_kwargs or {}))))
-                else:
-                    tasks.append(loop.run_in_executor(self._thread_pool, partial(task_fn, **(call_kwargs or {}))))
+                tasks.append(self._dispatch_component(loop, cpn, task_fn, call_kwargs or {}))
 
             if tasks:
                 await asyncio.gather(*tasks)
@@ -749,6 +799,18 @@ class Canvas(Graph):
             tasks.append(loop.run_in_executor(self._thread_pool, FileService.parse, file["name"], FileService.get_blob(file["created_by"], file["id"]), True, file["created_by"]))
         return await asyncio.gather(*tasks)
 
+    def _dispatch_component(self, loop, cpn, task_fn, call_kwargs: dict):
+        """Awaitable running one component of a batch."""
+        if self.native_async:
+            if _has_native_async(cpn):
+                return cpn.invoke_async(**call_kwargs)
+            return loop.run_in_executor(_sync_component_pool, partial(task_fn, **call_kwargs))
+
+        invoke_async = getattr(cpn, "invoke_async", None)
+        if invoke_async and asyncio.iscoroutinefunction(invoke_async):
+            return loop.run_in_executor(self._thread_pool, partial(_run_async_in_thread, invoke_async, **call_kwargs))
+        return loop.run_in_executor(self._thread_pool, partial(task_fn, **call_kwargs))
+
     def get_files(self, files: Union[None, list[dict]]) -> list[str]:
         """
         Synchronous wrapper for get_files_async, used by sync component invoke paths.
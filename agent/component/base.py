@@ -31,6 +31,7 @@ _FEEDED_DEPRECATED_PARAMS = "_feeded_deprecated_params"
 _DEPRECATED_PARAMS = "_deprecated_params"
 _USER_FEEDED_PARAMS = "_user_feeded_params"
 _IS_RAW_CONF = "_is_raw_conf"
+_IS_CHECKED = "_is_checked"
 
 
 class ComponentParamBase(ABC):
@@ -104,7 +105,7 @@ class ComponentParamBase(ABC):
                 return ret_dict
 
             for attr_name in list(obj.__dict__):
-                if attr_name in [_FEEDED_DEPRECATED_PARAMS, _DEPRECATED_PARAMS, _USER_FEEDED_PARAMS, _IS_RAW_CONF]:
+                if attr_name in [_FEEDED_DEPRECATED_PARAMS, _DEPRECATED_PARAMS, _USER_FEEDED_PARAMS, _IS_RAW_CONF, _IS_CHECKED]:
                     continue
                 # get attr
                 attr = getattr(obj, attr_name)
@@ -383,7 +384,15 @@ class ComponentBase(ABC):
         self._canvas = canvas
         self._id = id
         self._param = param
-        self._param.check()
+        if not getattr(param, _IS_CHECKED, False):
+            self._param.check()
+
+    def native_async_safe(self) -> bool:
+        """
+        Whether `_invoke_async` keeps its blocking DB, doc store and model calls off the event loop,
+        so that Canvas may await it on the request loop. Components opt in once verified.
+        """
+        return False
 
     def is_canceled(self) -> bool:
         return self._canvas.is_canceled()
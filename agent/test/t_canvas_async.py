@@ -0,0 +1,101 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Agent throughput with many concurrent sessions, dispatching component batches the way
+Canvas.run does, with the thread-per-component event loops and with native async execution.
+Components simulate LLM/tool calls: async ones await, sync ones block a thread.
+
+    python -m agent.test.t_canvas_async --sessions 200 --batches 4 --width 3
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.canvas import Canvas
+
+
+class AsyncComponent:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def _invoke(self, **kwargs):
+        time.sleep(self.latency)
+
+    async def _invoke_async(self, **kwargs):
+        await asyncio.sleep(self.latency)
+
+    def native_async_safe(self):
+        return True
+
+    def invoke(self, **kwargs):
+        self._invoke(**kwargs)
+
+    async def invoke_async(self, **kwargs):
+        await self._invoke_async(**kwargs)
+
+
+class SyncComponent:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def _invoke(self, **kwargs):
+        time.sleep(self.latency)
+
+    def invoke(self, **kwargs):
+        self._invoke(**kwargs)
+
+
+def session(native_async):
+    canvas = Canvas.__new__(Canvas)
+    canvas.native_async = native_async
+    canvas._thread_pool = ThreadPoolExecutor(max_workers=5)
+    return canvas
+
+
+async def run_session(canvas, args):
+    loop = asyncio.get_running_loop()
+    for b in range(args.batches):
+        cpns = [AsyncComponent(args.latency) if (b + i) % args.sync_every else SyncComponent(args.latency) for i in range(args.width)]
+        await asyncio.gather(*[canvas._dispatch_component(loop, c, c.invoke, {}) for c in cpns])
+
+
+async def bench(native_async, args):
+    sessions = [session(native_async) for _ in range(args.sessions)]
+    st = time.perf_counter()
+    await asyncio.gather(*[run_session(s, args) for s in sessions])
+    elapsed = time.perf_counter() - st
+    for s in sessions:
+        s._thread_pool.shutdown()
+    return elapsed
+
+
+def main(args):
+    for native_async in [False, True]:
+        elapsed = asyncio.run(bench(native_async, args))
+        mode = "native async" if native_async else "thread per component"
+        print(f"{mode}: {args.sessions} sessions in {elapsed:.2f}s, {args.sessions / elapsed:.1f} sessions/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", help="Concurrent agent sessions. Default: 200", type=int, default=200)
+    parser.add_argument("--batches", help="Component batches per session. Default: 4", type=int, default=4)
+    parser.add_argument("--width", help="Components per batch. Default: 3", type=int, default=3)
+    parser.add_argument("--latency", help="Seconds spent per component. Default: 0.05", type=float, default=0.05)
+    parser.add_argument("--sync_every", help="Every n-th component only has a sync implementation. Default: 4", type=int, default=4)
+    main(parser.parse_args())
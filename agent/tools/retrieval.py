@@ -94,17 +94,17 @@ class Retrieval(ToolBase, ABC):
             # if kb_nm is a list
             kb_nm_list = kb_nm if isinstance(kb_nm, list) else [kb_nm]
             for nm_or_id in kb_nm_list:
-                e, kb = KnowledgebaseService.get_by_name(nm_or_id,
-                                                         self._canvas._tenant_id)
+                e, kb = await asyncio.to_thread(KnowledgebaseService.get_by_name, nm_or_id,
+                                                self._canvas._tenant_id)
                 if not e:
-                    e, kb = KnowledgebaseService.get_by_id(nm_or_id)
+                    e, kb = await asyncio.to_thread(KnowledgebaseService.get_by_id, nm_or_id)
                     if not e:
                         raise Exception(f"Dataset({nm_or_id}) does not exist.")
                 kb_ids.append(kb.id)
 
         filtered_kb_ids: list[str] = list(set([kb_id for kb_id in kb_ids if kb_id]))
 
-        kbs = KnowledgebaseService.get_by_ids(filtered_kb_ids)
+        kbs = await asyncio.to_thread(KnowledgebaseService.get_by_ids, filtered_kb_ids)
         if not kbs:
             raise Exception("No dataset is selected.")
 
@@ -113,11 +113,11 @@ class Retrieval(ToolBase, ABC):
 
         embd_mdl = None
         if embd_nms:
-            embd_mdl = LLMBundle(self._canvas.get_tenant_id(), LLMType.EMBEDDING, embd_nms[0])
+            embd_mdl = await asyncio.to_thread(LLMBundle, self._canvas.get_tenant_id(), LLMType.EMBEDDING, embd_nms[0])
 
         rerank_mdl = None
         if self._param.rerank_id:
-            rerank_mdl = LLMBundle(kbs[0].tenant_id, LLMType.RERANK, self._param.rerank_id)
+            rerank_mdl = await asyncio.to_thread(LLMBundle, kbs[0].tenant_id, LLMType.RERANK, self._param.rerank_id)
 
         vars = self.get_input_elements_from_text(query_text)
         vars = {k: o["value"] for k, o in vars.items()}
@@ -125,7 +125,7 @@ class Retrieval(ToolBase, ABC):
 
         doc_ids = []
         if self._param.meta_data_filter != {}:
-            metas = DocumentService.get_meta_by_kbs(kb_ids)
+            metas = await asyncio.to_thread(DocumentService.get_meta_by_kbs, kb_ids)
 
             def _resolve_manual_filter(flt: dict) -> dict:
                 pat = re.compile(self.variable_ref_patt)
@@ -158,7 +158,7 @@ class Retrieval(ToolBase, ABC):
 
             chat_mdl = None
             if self._param.meta_data_filter.get("method") in ["auto", "semi_auto"]:
-                chat_mdl = LLMBundle(self._canvas.get_tenant_id(), LLMType.CHAT)
+                chat_mdl = await asyncio.to_thread(LLMBundle, self._canvas.get_tenant_id(), LLMType.CHAT)
 
             doc_ids = await apply_meta_data_filter(
                 self._param.meta_data_filter,
@@ -174,6 +174,7 @@ class Retrieval(ToolBase, ABC):
 
         if kbs:
             query = re.sub(r"^user[:：\s]*", "", query, flags=re.IGNORECASE)
+            rank_feature = await asyncio.to_thread(label_question, query, kbs)
             kbinfos = await settings.retriever.retrieval(
                 query,
                 embd_mdl,
@@ -186,7 +187,7 @@ class Retrieval(ToolBase, ABC):
                 doc_ids=doc_ids,
                 aggs=False,
                 rerank_mdl=rerank_mdl,
-                rank_feature=label_question(query, kbs),
+                rank_feature=rank_feature,
             )
             if self.check_if_canceled("Retrieval processing"):
                 return
@@ -199,8 +200,8 @@ class Retrieval(ToolBase, ABC):
                     return
                 if cks:
                     kbinfos["chunks"] = cks
-            kbinfos["chunks"] = settings.retriever.retrieval_by_children(kbinfos["chunks"],
-                                                                         [kb.tenant_id for kb in kbs])
+            kbinfos["chunks"] = await asyncio.to_thread(settings.retriever.retrieval_by_children, kbinfos["chunks"],
+                                                        [kb.tenant_id for kb in kbs])
             if self._param.use_kg:
                 ck = await settings.kg_retriever.retrieval(query,
                                                      [kb.tenant_id for kb in kbs],
@@ -248,7 +249,7 @@ class Retrieval(ToolBase, ABC):
 
     async def _retrieve_memory(self, query_text: str):
         memory_ids: list[str] = [memory_id for memory_id in self._param.memory_ids]
-        memory_list = MemoryService.get_by_ids(memory_ids)
+        memory_list = await asyncio.to_thread(MemoryService.get_by_ids, memory_ids)
         if not memory_list:
             raise Exception("No memory is selected.")
 
@@ -259,7 +260,7 @@ class Retrieval(ToolBase, ABC):
         vars = {k: o["value"] for k, o in vars.items()}
         query = self.string_format(query_text, vars)
         # query message
-        message_list = memory_message_service.query_message({"memory_id": memory_ids}, {
+        message_list = await asyncio.to_thread(memory_message_service.query_message, {"memory_id": memory_ids}, {
             "query": query,
             "similarity_threshold": self._param.similarity_threshold,
             "keywords_similarity_weight": self._param.keywords_similarity_weight,
@@ -274,6 +275,10 @@ class Retrieval(ToolBase, ABC):
 
         return formated_content
 
+    def native_async_safe(self) -> bool:
+        # Knowledge graph and TOC retrieval still query the doc store on the calling thread.
+        return not (self._param.use_kg or self._param.toc_enhance)
+
     @timeout(int(os.environ.get("COMPONENT_EXEC_TIMEOUT", 12)))
     async def _invoke_async(self, **kwargs):
         if self.check_if_canceled("Retrieval processing"):
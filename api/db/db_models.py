@@ -1123,6 +1123,7 @@ class SyncLogs(DataBaseModel):
     new_docs_indexed = IntegerField(default=0, index=False)
     total_docs_indexed = IntegerField(default=0, index=False)
     docs_removed_from_index = IntegerField(default=0, index=False)
+    docs_skipped = IntegerField(default=0, index=False, help_text="unchanged documents skipped")
     error_msg = TextField(null=False, help_text="process message", default="")
     error_count = IntegerField(default=0, index=False)
     full_exception_trace = TextField(null=True, help_text="process message", default="")
@@ -1324,5 +1325,6 @@ def migrate_db():
     alter_db_add_column(migrator, "conversation", "tts_task_id", CharField(max_length=40, null=False, default="", help_text="TTS task ID", index=True))
     alter_db_add_column(migrator, "conversation", "tts_status", CharField(max_length=32, null=False, default="pending", help_text="TTS task status", index=True))
     alter_db_add_column(migrator, "conversation", "tts_file_url", TextField(null=True, help_text="TTS audio file URL", default=""))
+    alter_db_add_column(migrator, "sync_logs", "docs_skipped", IntegerField(default=0, index=False, help_text="unchanged documents skipped"))
     
     logging.disable(logging.NOTSET)
@@ -245,9 +245,13 @@ async def completion(tenant_id, agent_id, session_id=None, **kwargs):
     conv.message.append({"role": "assistant", "content": txt, "created_at": time.time(), "id": message_id})
     conv.reference = canvas.get_reference()
     conv.errors = canvas.error
-    conv.dsl = str(canvas)
-    conv = conv.to_dict()
-    API4ConversationService.append_message(conv["id"], conv)
+    # Write back only what the turn changed instead of the whole session row.
+    API4ConversationService.append_message(conv.id, {
+        "message": conv.message,
+        "reference": conv.reference,
+        "errors": conv.errors,
+        "dsl": str(canvas)
+    })
 
 
 async def completion_openai(tenant_id, agent_id, question, session_id=None, stream=True, **kwargs):
@@ -14,20 +14,23 @@
 #  limitations under the License.
 #
 import logging
+import threading
 from datetime import datetime
 import os
-from typing import Tuple, List
+from typing import Any, Callable, List, Optional, Tuple
 
 from anthropic import BaseModel
 from peewee import SQL, fn
 
 from api.db import InputType
-from api.db.db_models import Connector, SyncLogs, Connector2Kb, Knowledgebase
+from api.db.db_models import DB, Connector, Document, SyncLogs, Connector2Kb, Knowledgebase
 from api.db.services.common_service import CommonService
 from api.db.services.document_service import DocumentService
 from common.misc_utils import get_uuid
 from common.constants import TaskStatus
 from common.time_utils import current_timestamp, timestamp_to_date
+from api.utils.common import hash128
+from rag.utils.redis_conn import REDIS_CONN
 
 class ConnectorService(CommonService):
     model = Connector
@@ -74,6 +77,7 @@ class ConnectorService(CommonService):
         SyncLogsService.filter_delete([SyncLogs.connector_id==connector_id, SyncLogs.kb_id==kb_id])
         docs = DocumentService.query(source_type=f"{conn.source}/{conn.id}", kb_id=kb_id)
         err = FileService.delete_docs([d.id for d in docs], tenant_id)
+        ConnectorFingerprints.clear(connector_id, kb_id)
         SyncLogsService.schedule(connector_id, kb_id, reindex=True)
         return err
 
@@ -92,6 +96,7 @@ class SyncLogsService(CommonService):
             cls.model.poll_range_end,
             cls.model.new_docs_indexed,
             cls.model.total_docs_indexed,
+            cls.model.docs_skipped,
             cls.model.error_msg,
             cls.model.full_exception_trace,
             cls.model.error_count,
@@ -182,17 +187,20 @@ class SyncLogsService(CommonService):
                 ConnectorService.update_by_id(connector_id, {"status": TaskStatus.SCHEDULE})
 
     @classmethod
-    def increase_docs(cls, id, min_update, max_update, doc_num, err_msg="", error_count=0):
-        cls.model.update(new_docs_indexed=cls.model.new_docs_indexed + doc_num,
-                         total_docs_indexed=cls.model.total_docs_indexed + doc_num,
-                         poll_range_start=fn.COALESCE(fn.LEAST(cls.model.poll_range_start,min_update), min_update),
-                         poll_range_end=fn.COALESCE(fn.GREATEST(cls.model.poll_range_end, max_update), max_update),
-                         error_msg=cls.model.error_msg + err_msg,
-                         error_count=cls.model.error_count + error_count,
-                         update_time=current_timestamp(),
-                         update_date=timestamp_to_date(current_timestamp())
-                         )\
-            .where(cls.model.id == id).execute()
+    def increase_docs(cls, id, min_update, max_update, doc_num, err_msg="", error_count=0, skipped_num=0):
+        """`doc_num` changed documents were indexed and `skipped_num` unchanged ones skipped."""
+        updates = dict(new_docs_indexed=cls.model.new_docs_indexed + doc_num,
+                       total_docs_indexed=cls.model.total_docs_indexed + doc_num,
+                       docs_skipped=cls.model.docs_skipped + skipped_num,
+                       error_msg=cls.model.error_msg + err_msg,
+                       error_count=cls.model.error_count + error_count,
+                       update_time=current_timestamp(),
+                       update_date=timestamp_to_date(current_timestamp())
+                       )
+        if min_update is not None and max_update is not None:
+            updates["poll_range_start"] = fn.COALESCE(fn.LEAST(cls.model.poll_range_start, min_update), min_update)
+            updates["poll_range_end"] = fn.COALESCE(fn.GREATEST(cls.model.poll_range_end, max_update), max_update)
+        cls.model.update(**updates).where(cls.model.id == id).execute()
 
     @classmethod
     def duplicate_and_parse(cls, kb, docs, tenant_id, src, auto_parse=True):
@@ -204,12 +212,19 @@ class SyncLogsService(CommonService):
             id: str
             filename: str
             blob: bytes
+            open_blob: Optional[Callable[[], Any]] = None
 
             def read(self) -> bytes:
+                if self.open_blob:
+                    stream = self.open_blob()
+                    try:
+                        return stream.read()
+                    finally:
+                        stream.close()
                 return self.blob
 
         errs = []
-        files = [FileObj(id=d["id"], filename=d["semantic_identifier"]+(f"{d['extension']}" if d["semantic_identifier"][::-1].find(d['extension'][::-1])<0 else ""), blob=d["blob"]) for d in docs]
+        files = [FileObj(id=d["id"], filename=d["semantic_identifier"]+(f"{d['extension']}" if d["semantic_identifier"][::-1].find(d['extension'][::-1])<0 else ""), blob=d["blob"], open_blob=d.get("open_blob")) for d in docs]
         doc_ids = []
         err, doc_blob_pairs = FileService.upload_document(kb, files, tenant_id, src)
         errs.extend(err)
@@ -243,6 +258,60 @@ class SyncLogsService(CommonService):
         ).order_by(cls.model.update_time.desc()).first()
 
 
+class ConnectorFingerprints:
+    """
+    Fingerprints (etag/size/mtime or content hash) of the source documents a connector synchronized
+    into a knowledge base, keyed by document id in a Redis hash. Connectors ask `unchanged()` before
+    fetching a document; a fingerprint is trusted only while its document still exists.
+    """
+
+    def __init__(self, connector_id, kb_id, source_type):
+        self.key = self._key(connector_id, kb_id)
+        self.kb_id = kb_id
+        self.source_type = source_type
+        self._doc_ids = None
+        self._skipped = 0
+        self.total_skipped = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(connector_id, kb_id):
+        return f"connector_fp:{connector_id}:{kb_id}"
+
+    @classmethod
+    def clear(cls, connector_id, kb_id):
+        REDIS_CONN.delete(cls._key(connector_id, kb_id))
+
+    @DB.connection_context()
+    def _existing_doc_ids(self):
+        if self._doc_ids is None:
+            self._doc_ids = {d.id for d in Document.select(Document.id).where(Document.kb_id == self.kb_id, Document.source_type == self.source_type)}
+        return self._doc_ids
+
+    def unchanged(self, source_id, fingerprint):
+        """Whether the document with `source_id` was synchronized with this fingerprint; counts the skips."""
+        if not fingerprint:
+            return False
+        doc_id = hash128(source_id)
+        if doc_id not in self._existing_doc_ids() or REDIS_CONN.hget(self.key, doc_id) != fingerprint:
+            return False
+        with self._lock:
+            self._skipped += 1
+            self.total_skipped += 1
+        return True
+
+    def save(self, fingerprints: dict):
+        """Record {source id: fingerprint} of documents synchronized successfully."""
+        fingerprints = {hash128(sid): fp for sid, fp in fingerprints.items() if fp}
+        if fingerprints:
+            REDIS_CONN.hset(self.key, fingerprints)
+
+    def take_skipped(self):
+        with self._lock:
+            skipped, self._skipped = self._skipped, 0
+        return skipped
+
+
 class Connector2KbService(CommonService):
     model = Connector2Kb
 
@@ -16,6 +16,7 @@
 import asyncio
 import binascii
 import logging
+import os
 import re
 import time
 from copy import deepcopy
@@ -40,6 +41,7 @@ from rag.advanced_rag import DeepResearcher
 from rag.app.resume import forbidden_select_fields4resume
 from rag.app.tag import label_question
 from rag.nlp.search import index_name
+from rag.nlp.query_vector_cache import QUERY_VECTOR_CACHE
 from rag.prompts.generator import chunks_format, citation_prompt, cross_languages, full_question, kb_prompt, keyword_extraction, message_fit_in, \
     PROMPT_JINJA_ENV, ASK_SUMMARY
 from common.token_utils import num_tokens_from_string
@@ -48,6 +50,12 @@ from common.string_utils import remove_redundant_spaces
 from common import settings
 
 
+TAG_LABEL_TIMEOUT = float(os.environ.get("TAG_LABEL_TIMEOUT", "10"))
+TOC_RETRIEVAL_TIMEOUT = float(os.environ.get("TOC_RETRIEVAL_TIMEOUT", "60"))
+WEB_SEARCH_TIMEOUT = float(os.environ.get("WEB_SEARCH_TIMEOUT", "20"))
+KG_RETRIEVAL_TIMEOUT = float(os.environ.get("KG_RETRIEVAL_TIMEOUT", "60"))
+
+
 class DialogService(CommonService):
     model = Dialog
 
@@ -273,6 +281,30 @@ def repair_bad_citation_formats(answer: str, kbinfos: dict, idx: set):
     return answer, idx
 
 
+_NO_FALLBACK = object()
+
+
+async def _retrieval_stage(name, coro, timings, timeout=None, fallback=_NO_FALLBACK):
+    """
+    Awaits one pre-generation stage and records its time in `timings`.
+    Optional stages return `fallback` when they fail or take longer than `timeout` seconds.
+    """
+    st = timer()
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except Exception as e:
+        if fallback is _NO_FALLBACK:
+            raise
+        logging.warning(f"Chat stage {name} is skipped: {e!r}")
+        return fallback
+    finally:
+        timings[name] = (timer() - st) * 1000
+
+
+def _stage_time_costs(timings):
+    return "".join(f"    - {name}: {cost:.1f}ms\n" for name, cost in timings.items())
+
+
 async def async_chat(dialog, messages, stream=True, **kwargs):
     assert messages[-1]["role"] == "user", "The last content of this conversation is not from user."
     if not dialog.kb_ids and not dialog.prompt_config.get("tavily_api_key"):
@@ -347,18 +379,23 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
     if prompt_config.get("cross_languages"):
         questions = [await cross_languages(dialog.tenant_id, dialog.llm_id, questions[0], prompt_config["cross_languages"])]
 
+    # The metadata filter and keyword extraction both work on the refined question, run them together.
+    refine_timings, retrieval_timings = {}, {}
+    refine_stages = {}
     if dialog.meta_data_filter:
-        metas = DocumentService.get_meta_by_kbs(dialog.kb_ids)
-        attachments = await apply_meta_data_filter(
-            dialog.meta_data_filter,
-            metas,
-            questions[-1],
-            chat_mdl,
-            attachments,
-        )
+        async def meta_filter(question):
+            metas = await asyncio.to_thread(DocumentService.get_meta_by_kbs, dialog.kb_ids)
+            return await apply_meta_data_filter(dialog.meta_data_filter, metas, question, chat_mdl, attachments)
 
+        refine_stages["metadata_filter"] = meta_filter(questions[-1])
     if prompt_config.get("keyword", False):
-        questions[-1] += await keyword_extraction(chat_mdl, questions[-1])
+        refine_stages["keyword_extraction"] = keyword_extraction(chat_mdl, questions[-1])
+    refined = await asyncio.gather(*[_retrieval_stage(k, c, refine_timings) for k, c in refine_stages.items()])
+    refined = dict(zip(refine_stages.keys(), refined))
+    if "metadata_filter" in refined:
+        attachments = refined["metadata_filter"]
+    if "keyword_extraction" in refined:
+        questions[-1] += refined["keyword_extraction"]
 
     refine_question_ts = timer()
 
@@ -405,9 +442,18 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
             await task
 
         else:
-            if embd_mdl:
-                kbinfos = await retriever.retrieval(
-                    " ".join(questions),
+            query = " ".join(questions)
+
+            async def kb_retrieval():
+                # Tag labelling and the query embedding are independent, the retrieval then reuses the cached vector.
+                stages = [_retrieval_stage("tag_labelling", asyncio.to_thread(label_question, query, kbs),
+                                           retrieval_timings, TAG_LABEL_TIMEOUT, None)]
+                if QUERY_VECTOR_CACHE.capacity > 0 and QUERY_VECTOR_CACHE.normalize(query):
+                    stages.append(_retrieval_stage("query_embedding", asyncio.to_thread(QUERY_VECTOR_CACHE.encode_query, embd_mdl, query),
+                                                   retrieval_timings, fallback=None))
+                rank_feature = (await asyncio.gather(*stages))[0]
+                res = await _retrieval_stage("retrieval", retriever.retrieval(
+                    query,
                     embd_mdl,
                     tenant_ids,
                     dialog.kb_ids,
@@ -419,23 +465,44 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
                     top=dialog.top_k,
                     aggs=True,
                     rerank_mdl=rerank_mdl,
-                    rank_feature=label_question(" ".join(questions), kbs),
-                )
+                    rank_feature=rank_feature,
+                ), retrieval_timings)
                 if prompt_config.get("toc_enhance"):
-                    cks = await retriever.retrieval_by_toc(" ".join(questions), kbinfos["chunks"], tenant_ids, chat_mdl, dialog.top_n)
+                    cks = await _retrieval_stage("toc_retrieval", retriever.retrieval_by_toc(query, res["chunks"], tenant_ids, chat_mdl, dialog.top_n),
+                                                 retrieval_timings, TOC_RETRIEVAL_TIMEOUT, None)
                     if cks:
-                        kbinfos["chunks"] = cks
-                kbinfos["chunks"] = retriever.retrieval_by_children(kbinfos["chunks"], tenant_ids)
+                        res["chunks"] = cks
+                res["chunks"] = retriever.retrieval_by_children(res["chunks"], tenant_ids)
+                return res
+
+            async def kg_retrieval():
+                return await settings.kg_retriever.retrieval(query, tenant_ids, dialog.kb_ids, embd_mdl,
+                                                             LLMBundle(dialog.tenant_id, LLMType.CHAT))
+
+            # Web search and knowledge graph retrieval are optional: they run next to the dataset retrieval
+            # and are left out of the answer if they fail or miss their deadline.
+            web_task, kg_task = None, None
             if prompt_config.get("tavily_api_key"):
-                tav = Tavily(prompt_config["tavily_api_key"])
-                tav_res = tav.retrieve_chunks(" ".join(questions))
+                web_task = asyncio.create_task(_retrieval_stage(
+                    "web_search", asyncio.to_thread(lambda: Tavily(prompt_config["tavily_api_key"]).retrieve_chunks(query)),
+                    retrieval_timings, WEB_SEARCH_TIMEOUT, None))
+            if prompt_config.get("use_kg"):
+                kg_task = asyncio.create_task(_retrieval_stage("kg_retrieval", kg_retrieval(), retrieval_timings, KG_RETRIEVAL_TIMEOUT, None))
+            try:
+                if embd_mdl:
+                    kbinfos = await kb_retrieval()
+                tav_res = await web_task if web_task else None
+                ck = await kg_task if kg_task else None
+            except BaseException:
+                for t in [web_task, kg_task]:
+                    if t:
+                        t.cancel()
+                raise
+            if tav_res:
                 kbinfos["chunks"].extend(tav_res["chunks"])
                 kbinfos["doc_aggs"].extend(tav_res["doc_aggs"])
-            if prompt_config.get("use_kg"):
-                ck = await settings.kg_retriever.retrieval(" ".join(questions), tenant_ids, dialog.kb_ids, embd_mdl,
-                                                       LLMBundle(dialog.tenant_id, LLMType.CHAT))
-                if ck["content_with_weight"]:
-                    kbinfos["chunks"].insert(0, ck)
+            if ck and ck["content_with_weight"]:
+                kbinfos["chunks"].insert(0, ck)
 
     knowledges = kb_prompt(kbinfos, max_tokens)
     logging.debug("{}->{}".format(" ".join(questions), "\n->".join(knowledges)))
@@ -524,7 +591,9 @@ async def async_chat(dialog, messages, stream=True, **kwargs):
             f"  - Check Langfuse tracer: {check_langfuse_tracer_cost:.1f}ms\n"
             f"  - Bind models: {bind_embedding_time_cost:.1f}ms\n"
             f"  - Query refinement(LLM): {refine_question_time_cost:.1f}ms\n"
+            f"{_stage_time_costs(refine_timings)}"
             f"  - Retrieval: {retrieval_time_cost:.1f}ms\n"
+            f"{_stage_time_costs(retrieval_timings)}"
             f"  - Generate answer: {generate_result_time_cost:.1f}ms\n\n"
             "## Token usage:\n"
             f"  - Generated tokens(approximately): {tk_num}\n"
@@ -0,0 +1,147 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Cached inverted index of document metadata, per knowledge base.
+
+Every knowledge base has a version counter in Redis, bumped whenever one of its
+documents gets, changes or loses metadata. The (doc_id, meta_fields) rows of a
+knowledge base are shared through Redis under that version, and every process
+keeps the inverted maps (metadata key -> value -> doc ids) built from them until
+the version moves, so chat turns don't scan the document table.
+
+A version bump lost to a Redis outage would leave other processes on stale maps,
+so local entries also expire after DOC_META_LOCAL_TTL seconds, and nothing is
+cached while the versions can't be read.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from api.db.db_models import DB, Document
+from rag.utils.redis_conn import REDIS_CONN
+
+DOC_META_CACHE_TTL = int(os.environ.get("DOC_META_CACHE_TTL", 3600))
+DOC_META_CACHE_KBS = int(os.environ.get("DOC_META_CACHE_KBS", 128))
+DOC_META_LOCAL_TTL = int(os.environ.get("DOC_META_LOCAL_TTL", 60))
+
+
+class DocMetaIndex:
+    def __init__(self, capacity=128):
+        self.capacity = capacity
+        # kb_id -> (version, rows, {map name: inverted map}, loaded at)
+        self._kbs = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version_key(kb_id):
+        return f"doc_meta_ver:{kb_id}"
+
+    @staticmethod
+    def _rows_key(kb_id, version):
+        return f"doc_meta:{kb_id}:{version}"
+
+    def invalidate(self, kb_ids):
+        for kb_id in set(kb_ids):
+            if not kb_id:
+                continue
+            with self._lock:
+                self._kbs.pop(kb_id, None)
+            try:
+                REDIS_CONN.incrby(self._version_key(kb_id), 1)
+            except Exception as e:
+                logging.warning(f"DocMetaIndex: fail to bump the metadata version of {kb_id}: {e}")
+
+    def _versions(self, kb_ids):
+        """Metadata versions of `kb_ids`, None for all of them if Redis can't be read."""
+        if not kb_ids:
+            return []
+        try:
+            return [int(v) if v else 0 for v in REDIS_CONN.REDIS.mget([self._version_key(kb_id) for kb_id in kb_ids])]
+        except Exception as e:
+            logging.warning(f"DocMetaIndex: fail to read the metadata versions, not caching: {e}")
+            return [None] * len(kb_ids)
+
+    @staticmethod
+    @DB.connection_context()
+    def _query_rows(kb_id):
+        return [[r.id, r.meta_fields] for r in Document.select(Document.id, Document.meta_fields).where(Document.kb_id == kb_id) if r.meta_fields]
+
+    def _load_rows(self, kb_id, version):
+        key = self._rows_key(kb_id, version)
+        try:
+            cached = REDIS_CONN.get_bin(key)
+            if cached:
+                return json.loads(zlib.decompress(cached))
+        except Exception as e:
+            logging.warning(f"DocMetaIndex: fail to read {key}: {e}")
+
+        rows = self._query_rows(kb_id)
+        REDIS_CONN.set_bin(key, zlib.compress(json.dumps(rows, ensure_ascii=False).encode("utf-8")), DOC_META_CACHE_TTL)
+        return rows
+
+    def _fresh(self, ent, version):
+        return ent and ent[0] == version and time.monotonic() - ent[3] < DOC_META_LOCAL_TTL
+
+    def _kb_map(self, kb_id, version, name, build):
+        if version is None:
+            return build(self._query_rows(kb_id))
+        with self._lock:
+            ent = self._kbs.get(kb_id)
+            if self._fresh(ent, version):
+                self._kbs.move_to_end(kb_id)
+                if name in ent[2]:
+                    return ent[2][name]
+                rows = ent[1]
+            else:
+                rows = None
+        if rows is None:
+            rows = self._load_rows(kb_id, version)
+        m = build(rows)
+        with self._lock:
+            ent = self._kbs.get(kb_id)
+            if not self._fresh(ent, version):
+                ent = (version, rows, {}, time.monotonic())
+            ent[2][name] = m
+            self._kbs[kb_id] = ent
+            self._kbs.move_to_end(kb_id)
+            while len(self._kbs) > self.capacity:
+                self._kbs.popitem(last=False)
+        return m
+
+    def get(self, kb_ids, name, build):
+        """
+        Inverted metadata map over `kb_ids`. `build(rows)` turns the (doc_id, meta_fields) rows of one
+        knowledge base into {key: {value: [doc_id]}}; its result is cached under `name` per knowledge base.
+        """
+        kb_ids = list(dict.fromkeys(kb_ids or []))
+        meta = {}
+        for kb_id, version in zip(kb_ids, self._versions(kb_ids)):
+            for k, v2docs in self._kb_map(kb_id, version, name, build).items():
+                if k not in meta:
+                    meta[k] = {}
+                for v, doc_ids in v2docs.items():
+                    if v not in meta[k]:
+                        meta[k][v] = []
+                    meta[k][v].extend(doc_ids)
+        return meta
+
+
+DOC_META_INDEX = DocMetaIndex(DOC_META_CACHE_KBS)
@@ -32,6 +32,7 @@ from api.db.db_models import DB, Document, Knowledgebase, Task, Tenant, UserTena
     User
 from api.db.db_utils import bulk_insert_into_db
 from api.db.services.common_service import CommonService
+from api.db.services.doc_meta_index import DOC_META_INDEX
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from common.metadata_utils import dedupe_list
 from common.misc_utils import get_uuid
@@ -335,10 +336,24 @@ class DocumentService(CommonService):
     def insert(cls, doc):
         if not cls.save(**doc):
             raise RuntimeError("Database error (Document)!")
+        if doc.get("meta_fields"):
+            DOC_META_INDEX.invalidate([doc["kb_id"]])
         if not KnowledgebaseService.atomic_increase_doc_num_by_id(doc["kb_id"]):
             raise RuntimeError("Database error (Knowledgebase)!")
         return Document(**doc)
 
+    @classmethod
+    def update_by_id(cls, pid, data):
+        kb_ids = []
+        if "meta_fields" in data or "kb_id" in data:
+            kb_ids = [d.kb_id for d in cls.get_by_ids([pid], [cls.model.kb_id])]
+            if data.get("kb_id"):
+                kb_ids.append(data["kb_id"])
+        num = super().update_by_id(pid, data)
+        if kb_ids:
+            DOC_META_INDEX.invalidate(kb_ids)
+        return num
+
     @classmethod
     @DB.connection_context()
     def remove_document(cls, doc, tenant_id):
@@ -371,6 +386,13 @@ class DocumentService(CommonService):
         except Exception as e:
             logging.error(f"Failed to delete chunks from doc store for document {doc.id}: {e}")
 
+        # Delete the RAPTOR tree of incremental runs (non-critical, log and continue)
+        try:
+            from api.db.services.task_service import raptor_tree_id
+            settings.docStoreConn.delete({"id": raptor_tree_id(doc.id)}, search.index_name(tenant_id), doc.kb_id)
+        except Exception as e:
+            logging.warning(f"Failed to delete the RAPTOR tree of document {doc.id}: {e}")
+
         # Cleanup knowledge graph references (non-critical, log and continue)
         try:
             graph_source = settings.docStoreConn.get_fields(
@@ -388,7 +410,10 @@ class DocumentService(CommonService):
         except Exception as e:
             logging.warning(f"Failed to cleanup knowledge graph for document {doc.id}: {e}")
 
-        return cls.delete_by_id(doc.id)
+        num = cls.delete_by_id(doc.id)
+        if doc.meta_fields:
+            DOC_META_INDEX.invalidate([doc.kb_id])
+        return num
 
     @classmethod
     @DB.connection_context()
@@ -711,7 +736,6 @@ class DocumentService(CommonService):
         return cls.update_by_id(doc_id, {"meta_fields": meta_fields})
 
     @classmethod
-    @DB.connection_context()
     def get_meta_by_kbs(cls, kb_ids):
         """
         Legacy metadata aggregator (backward-compatible).
@@ -719,29 +743,29 @@ class DocumentService(CommonService):
           Example: {"tags": ["foo","bar"]} -> meta["tags"]["['foo', 'bar']"] = [doc_id]
         - Expects meta_fields is a dict.
         Use when existing callers rely on the old list-as-string semantics.
+        Served from DOC_META_INDEX.
         """
-        fields = [
-            cls.model.id,
-            cls.model.meta_fields,
-        ]
-        meta = {}
-        for r in cls.model.select(*fields).where(cls.model.kb_id.in_(kb_ids)):
-            doc_id = r.id
-            for k,v in r.meta_fields.items():
-                if k not in meta:
-                    meta[k] = {}
-                if not isinstance(v, list):
-                    v = [v]
-                for vv in v:
-                    if vv not in meta[k]:
-                        if isinstance(vv, list) or isinstance(vv, dict):
-                            continue
-                        meta[k][vv] = []
-                    meta[k][vv].append(doc_id)
-        return meta
+        def build(rows):
+            meta = {}
+            for doc_id, meta_fields in rows:
+                if not isinstance(meta_fields, dict):
+                    continue
+                for k, v in meta_fields.items():
+                    if k not in meta:
+                        meta[k] = {}
+                    if not isinstance(v, list):
+                        v = [v]
+                    for vv in v:
+                        if vv not in meta[k]:
+                            if isinstance(vv, list) or isinstance(vv, dict):
+                                continue
+                            meta[k][vv] = []
+                        meta[k][vv].append(doc_id)
+            return meta
+
+        return DOC_META_INDEX.get(kb_ids, "legacy", build)
 
     @classmethod
-    @DB.connection_context()
     def get_flatted_meta_by_kbs(cls, kb_ids):
         """
         - Parses stringified JSON meta_fields when possible and skips non-dict or unparsable values.
@@ -749,34 +773,33 @@ class DocumentService(CommonService):
           Example: {"tags": ["foo","bar"], "author": "alice"} ->
             meta["tags"]["foo"] = [doc_id], meta["tags"]["bar"] = [doc_id], meta["author"]["alice"] = [doc_id]
         Prefer for metadata_condition filtering and scenarios that must respect list semantics.
+        Served from DOC_META_INDEX.
         """
-        fields = [
-            cls.model.id,
-            cls.model.meta_fields,
-        ]
-        meta = {}
-        for r in cls.model.select(*fields).where(cls.model.kb_id.in_(kb_ids)):
-            doc_id = r.id
-            meta_fields = r.meta_fields or {}
-            if isinstance(meta_fields, str):
-                try:
-                    meta_fields = json.loads(meta_fields)
-                except Exception:
-                    continue
-            if not isinstance(meta_fields, dict):
-                continue
-            for k, v in meta_fields.items():
-                if k not in meta:
-                    meta[k] = {}
-                values = v if isinstance(v, list) else [v]
-                for vv in values:
-                    if vv is None:
+        def build(rows):
+            meta = {}
+            for doc_id, meta_fields in rows:
+                meta_fields = meta_fields or {}
+                if isinstance(meta_fields, str):
+                    try:
+                        meta_fields = json.loads(meta_fields)
+                    except Exception:
                         continue
-                    sv = str(vv)
-                    if sv not in meta[k]:
-                        meta[k][sv] = []
-                    meta[k][sv].append(doc_id)
-        return meta
+                if not isinstance(meta_fields, dict):
+                    continue
+                for k, v in meta_fields.items():
+                    if k not in meta:
+                        meta[k] = {}
+                    values = v if isinstance(v, list) else [v]
+                    for vv in values:
+                        if vv is None:
+                            continue
+                        sv = str(vv)
+                        if sv not in meta[k]:
+                            meta[k][sv] = []
+                        meta[k][sv].append(doc_id)
+            return meta
+
+        return DOC_META_INDEX.get(kb_ids, "flatted", build)
 
     @classmethod
     @DB.connection_context()
@@ -906,6 +929,8 @@ class DocumentService(CommonService):
                         update_date=get_format_time()
                     ).where(cls.model.id == r.id).execute()
                     updated_docs += 1
+        if updated_docs:
+            DOC_META_INDEX.invalidate([kb_id])
         return updated_docs
 
     @classmethod
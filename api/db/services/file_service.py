@@ -16,6 +16,7 @@
 import asyncio
 import base64
 import logging
+import os
 import re
 import sys
 import time
@@ -23,6 +24,7 @@ from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Union
 
+import xxhash
 from peewee import fn
 
 from api.db import KNOWLEDGEBASE_FOLDER_NAME, FileType
@@ -34,10 +36,14 @@ from api.db.services.file2document_service import File2DocumentService
 from common.misc_utils import get_uuid
 from common.constants import TaskStatus, FileSource, ParserType
 from api.db.services.knowledgebase_service import KnowledgebaseService
-from api.db.services.task_service import TaskService
-from api.utils.file_utils import filename_type, read_potential_broken_pdf, thumbnail_img, sanitize_path
+from api.db.services.task_service import TaskService, INCREMENTAL_REINDEX
+from api.utils.file_utils import filename_type, read_potential_broken_pdf, thumbnail_img, sanitize_path, HashingReader
 from rag.llm.cv_model import GptV4
 from common import settings
+from rag.utils.redis_conn import REDIS_CONN
+
+# Seconds the content hash of a stored document is remembered to tell unchanged re-uploads apart.
+DOC_CONTENT_HASH_TTL = int(os.environ.get("DOC_CONTENT_HASH_TTL", 30 * 24 * 3600))
 
 
 class FileService(CommonService):
@@ -442,11 +448,13 @@ class FileService(CommonService):
             doc_id = file.id if hasattr(file, "id") else get_uuid()
             e, doc = DocumentService.get_by_id(doc_id)
             if e:
-                blob = file.read()
-                settings.STORAGE_IMPL.put(kb.id, doc.location, blob, kb.tenant_id)
-                doc.size = len(blob)
+                blob, doc.size, content_hash = self.store_file(kb.id, doc.location, file, kb.tenant_id)
                 doc = doc.to_dict()
                 DocumentService.update_by_id(doc["id"], doc)
+                if INCREMENTAL_REINDEX and self.content_changed(doc["id"], content_hash):
+                    # Parsed again, only the chunks that changed get indexed.
+                    doc["content_changed"] = True
+                    files.append((doc, blob))
                 continue
             try:
                 DocumentService.check_doc_health(kb.tenant_id, file.filename)
@@ -459,13 +467,18 @@ class FileService(CommonService):
                 while settings.STORAGE_IMPL.obj_exist(kb.id, location):
                     location += "_"
 
-                blob = file.read()
-                if filetype == FileType.PDF.value:
-                    blob = read_potential_broken_pdf(blob)
-                settings.STORAGE_IMPL.put(kb.id, location, blob)
-
-
-                img = thumbnail_img(filename, blob)
+                if getattr(file, "open_blob", None):
+                    # Streamed as it is: no broken PDF repair and no thumbnail, which need it in memory.
+                    blob, size, content_hash = self.store_file(kb.id, location, file)
+                else:
+                    blob = file.read()
+                    if filetype == FileType.PDF.value:
+                        blob = read_potential_broken_pdf(blob)
+                    settings.STORAGE_IMPL.put(kb.id, location, blob)
+                    size, content_hash = len(blob), xxhash.xxh128_hexdigest(blob)
+                self.content_changed(doc_id, content_hash)
+
+                img = thumbnail_img(filename, blob) if blob is not None else None
                 thumbnail_location = ""
                 if img is not None:
                     thumbnail_location = f"thumbnail_{doc_id}.png"
@@ -483,7 +496,7 @@ class FileService(CommonService):
                     "source_type": src,
                     "suffix": Path(filename).suffix.lstrip("."),
                     "location": location,
-                    "size": len(blob),
+                    "size": size,
                     "thumbnail": thumbnail_location,
                 }
                 DocumentService.insert(doc)
@@ -495,6 +508,48 @@ class FileService(CommonService):
 
         return err, files
 
+    @staticmethod
+    def store_file(bucket, location, file, tenant_id=None):
+        """
+        Write `file` to storage and return (blob, size, content hash). Files with an `open_blob()`
+        opening their content are streamed and hashed on the fly, and their blob is None.
+        """
+        open_blob = getattr(file, "open_blob", None)
+        if not open_blob:
+            blob = file.read()
+            settings.STORAGE_IMPL.put(bucket, location, blob, tenant_id)
+            return blob, len(blob), xxhash.xxh128_hexdigest(blob)
+
+        readers = []
+
+        def open_stream():
+            readers.append(HashingReader(open_blob()))
+            return readers[-1]
+
+        if hasattr(settings.STORAGE_IMPL, "put_stream"):
+            settings.STORAGE_IMPL.put_stream(bucket, location, open_stream, tenant_id)
+            return None, readers[-1].size, readers[-1].hexdigest()
+        # The storage can't take a stream, e.g. when it encrypts objects.
+        reader = open_stream()
+        try:
+            blob = reader.read()
+        finally:
+            reader.close()
+        settings.STORAGE_IMPL.put(bucket, location, blob, tenant_id)
+        return blob, reader.size, reader.hexdigest()
+
+    @staticmethod
+    def content_changed(doc_id, content_hash):
+        """Record the content hash of a document and tell whether it differs from the previous one."""
+        key = f"doc_content_hash:{doc_id}"
+        try:
+            if REDIS_CONN.get(key) == content_hash:
+                return False
+            REDIS_CONN.set(key, content_hash, DOC_CONTENT_HASH_TTL)
+        except Exception as e:
+            logging.warning(f"FileService: fail to record the content hash of {doc_id}: {e}")
+        return True
+
     @classmethod
     @DB.connection_context()
     def list_all_files_by_parent_id(cls, parent_id):
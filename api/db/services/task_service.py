@@ -16,12 +16,15 @@
 import logging
 import os
 import random
+import threading
+import time
 import xxhash
+from collections import OrderedDict
 from datetime import datetime
 
 from api.db.db_utils import bulk_insert_into_db
 from deepdoc.parser import PdfParser
-from peewee import JOIN
+from peewee import JOIN, fn
 from api.db.db_models import DB, File2Document, File
 from api.db import FileType
 from api.db.db_models import Task, Document, Knowledgebase, Tenant
@@ -37,6 +40,18 @@ from rag.nlp import search
 
 CANVAS_DEBUG_DOC_ID = "dataflow_x"
 GRAPH_RAPTOR_FAKE_DOC_ID = "graph_raptor_x"
+# RAPTOR trees are stored as chunks of their own fake document, out of the chunk lists of real documents.
+RAPTOR_TREE_DOC_ID = "raptor_tree_x"
+
+# A document parsed again by a single task only indexes the chunks whose content changed:
+# the task gets the chunk ids of the previous version instead of having them deleted here.
+INCREMENTAL_REINDEX = int(os.environ.get("INCREMENTAL_REINDEX", 0))
+
+
+def raptor_tree_id(doc_id):
+    """Chunk id of the RAPTOR tree of a document, or of a dataset for GRAPH_RAPTOR_FAKE_DOC_ID."""
+    return xxhash.xxh64(("raptor_tree" + doc_id).encode("utf-8")).hexdigest()
+
 
 def trim_header_by_lines(text: str, max_length) -> str:
     # Trim header text to maximum length while preserving line breaks
@@ -96,6 +111,7 @@ class TaskService(CommonService):
             cls.model.from_page,
             cls.model.to_page,
             cls.model.retry_count,
+            cls.model.chunk_ids,
             Document.kb_id,
             Document.parser_id,
             Document.parser_config,
@@ -220,6 +236,23 @@ class TaskService(CommonService):
         """
         cls.model.update(chunk_ids=chunk_ids).where(cls.model.id == id).execute()
 
+    @classmethod
+    @DB.connection_context()
+    def append_chunk_ids(cls, id: str, chunk_ids: list[str]):
+        """Append chunk IDs to those associated with a task.
+
+        Unlike `update_chunk_ids`, only the new identifiers are sent to the database,
+        so recording the chunks of a document batch by batch stays linear in its size.
+
+        Args:
+            id (str): The unique identifier of the task.
+            chunk_ids (list[str]): Chunk identifiers to append.
+        """
+        if not chunk_ids:
+            return
+        cls.model.update(chunk_ids=fn.CONCAT(fn.COALESCE(cls.model.chunk_ids, ""), " " + " ".join(chunk_ids))) \
+            .where(cls.model.id == id).execute()
+
     @classmethod
     @DB.connection_context()
     def get_ongoing_doc_name(cls):
@@ -442,14 +475,22 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
     prev_tasks = TaskService.get_tasks(doc["id"])
     ck_num = 0
     if prev_tasks:
-        for task in parse_task_array:
-            ck_num += reuse_prev_task_chunks(task, prev_tasks, chunking_config)
+        # The chunks of a task only depend on its digest as long as the content of the document is the same.
+        if not doc.get("content_changed"):
+            for task in parse_task_array:
+                ck_num += reuse_prev_task_chunks(task, prev_tasks, chunking_config)
         TaskService.filter_delete([Task.doc_id == doc["id"]])
         pre_chunk_ids = []
         for pre_task in prev_tasks:
             if pre_task["chunk_ids"]:
                 pre_chunk_ids.extend(pre_task["chunk_ids"].split())
-        if pre_chunk_ids:
+        # Stored chunks keep their enrichment, so they are only matched by content if the previous tasks
+        # chunked and enriched the document with the same configuration, i.e. had the same digest.
+        same_config = all(pre_task.get("digest") == parse_task_array[0]["digest"] for pre_task in prev_tasks)
+        if pre_chunk_ids and INCREMENTAL_REINDEX and len(parse_task_array) == 1 and same_config \
+                and parse_task_array[0]["progress"] < 1.0 and not doc["parser_config"].get("toc_extraction", False):
+            parse_task_array[0]["chunk_ids"] = " ".join(pre_chunk_ids)
+        elif pre_chunk_ids:
             settings.docStoreConn.delete({"id": pre_chunk_ids}, search.index_name(chunking_config["tenant_id"]),
                                          chunking_config["kb_id"])
     DocumentService.update_by_id(doc["id"], {"chunk_num": ck_num})
@@ -508,7 +549,7 @@ def reuse_prev_task_chunks(task: dict, prev_tasks: list[dict], chunking_config:
         [datetime.now().strftime("%H:%M:%S"), task["progress_msg"], "Reused previous task's chunks."])
     prev_task["chunk_ids"] = ""
 
-    return len(task["chunk_ids"].split())
+    return len(set(task["chunk_ids"].split()))
 
 
 def cancel_all_task_of(doc_id):
@@ -519,13 +560,30 @@ def cancel_all_task_of(doc_id):
             logging.exception(e)
 
 
+# A task found not canceled is not asked again to Redis for CANCEL_POLL_INTERVAL seconds,
+# so loops checking it per chunk or per LLM call cost one round trip per interval.
+CANCEL_POLL_INTERVAL = float(os.environ.get("CANCEL_POLL_INTERVAL", 1))
+_not_canceled = OrderedDict()
+_not_canceled_lock = threading.Lock()
+
+
 def has_canceled(task_id):
+    now = time.monotonic()
+    with _not_canceled_lock:
+        polled_at = _not_canceled.get(task_id)
+    if polled_at is not None and now - polled_at < CANCEL_POLL_INTERVAL:
+        return False
     try:
         if REDIS_CONN.get(f"{task_id}-cancel"):
             logging.info(f"Task: {task_id} has been canceled")
             return True
     except Exception as e:
         logging.exception(e)
+    with _not_canceled_lock:
+        _not_canceled[task_id] = now
+        _not_canceled.move_to_end(task_id)
+        while len(_not_canceled) > 4096:
+            _not_canceled.popitem(last=False)
     return False
 
 
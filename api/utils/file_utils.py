@@ -26,6 +26,7 @@ import threading
 from io import BytesIO
 
 import pdfplumber
+import xxhash
 from PIL import Image
 
 # Local imports
@@ -166,6 +167,28 @@ def read_potential_broken_pdf(blob):
     return blob
 
 
+class HashingReader:
+    """File-like wrapper counting and hashing the bytes read through it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.hasher = xxhash.xxh128()
+        self.size = 0
+
+    def read(self, n=-1):
+        data = self.stream.read() if n is None or n < 0 else self.stream.read(n)
+        self.hasher.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+    def close(self):
+        if hasattr(self.stream, "close"):
+            self.stream.close()
+
+
 def sanitize_path(raw_path: str | None) -> str:
     """Normalize and sanitize a user-provided path segment.
 
@@ -11,7 +11,7 @@ from common.data_source.utils import (
     extract_size_bytes,
     get_file_ext,
 )
-from common.data_source.config import BlobType, DocumentSource, BLOB_STORAGE_SIZE_THRESHOLD, INDEX_BATCH_SIZE
+from common.data_source.config import BlobType, DocumentSource, BLOB_STORAGE_SIZE_THRESHOLD, BLOB_STREAMING_THRESHOLD, INDEX_BATCH_SIZE
 from common.data_source.exceptions import (
     ConnectorMissingCredentialError,
     ConnectorValidationError,
@@ -42,12 +42,17 @@ class BlobStorageConnector(LoadConnector, PollConnector):
         self.size_threshold: int | None = BLOB_STORAGE_SIZE_THRESHOLD
         self.bucket_region: Optional[str] = None
         self.european_residency: bool = european_residency
+        self.fingerprints: Optional[Any] = None
 
     def set_allow_images(self, allow_images: bool) -> None:
         """Set whether to process images"""
         logging.info(f"Setting allow_images to {allow_images}.")
         self._allow_images = allow_images
 
+    def set_fingerprints(self, fingerprints: Any) -> None:
+        """Set the store telling whether an object is unchanged since it was last synchronized"""
+        self.fingerprints = fingerprints
+
     def load_credentials(self, credentials: dict[str, Any]) -> dict[str, Any] | None:
         """Load credentials"""
         logging.debug(
@@ -153,8 +158,16 @@ class BlobStorageConnector(LoadConnector, PollConnector):
             key = obj["Key"]
 
             size_bytes = extract_size_bytes(obj)
+            doc_id = f"{self.bucket_type}:{self.bucket_name}:{key}"
+            fingerprint = f"{obj.get('ETag', '')}:{size_bytes}:{last_modified.timestamp()}"
+            if self.fingerprints and self.fingerprints.unchanged(doc_id, fingerprint):
+                continue
+
+            # The size threshold bounds the memory of downloaded objects, streamed ones are never held in memory.
+            stream = 0 < BLOB_STREAMING_THRESHOLD <= (size_bytes or 0)
             if (
-                self.size_threshold is not None
+                not stream
+                and self.size_threshold is not None
                 and isinstance(size_bytes, int)
                 and size_bytes > self.size_threshold
             ):
@@ -164,9 +177,13 @@ class BlobStorageConnector(LoadConnector, PollConnector):
                 continue
             
             try:
-                blob = download_object(self.s3_client, self.bucket_name, key, self.size_threshold)
-                if blob is None:
-                    continue
+                if stream:
+                    blob, open_blob = b"", self._opener(key)
+                else:
+                    blob = download_object(self.s3_client, self.bucket_name, key, self.size_threshold)
+                    if blob is None:
+                        continue
+                    open_blob = None
 
                 # Use full path only if filename appears multiple times
                 if filename_counts.get(file_name, 0) > 1:
@@ -179,8 +196,10 @@ class BlobStorageConnector(LoadConnector, PollConnector):
 
                 batch.append(
                     Document(
-                        id=f"{self.bucket_type}:{self.bucket_name}:{key}",
+                        id=doc_id,
                         blob=blob,
+                        open_blob=open_blob,
+                        fingerprint=fingerprint,
                         source=DocumentSource(self.bucket_type.value),
                         semantic_identifier=semantic_id,
                         extension=get_file_ext(file_name),
@@ -198,6 +217,12 @@ class BlobStorageConnector(LoadConnector, PollConnector):
         if batch:
             yield batch
 
+    def _opener(self, key: str):
+        """Opens the object body as a stream, without downloading it."""
+        def open_blob():
+            return self.s3_client.get_object(Bucket=self.bucket_name, Key=key)["Body"]
+        return open_blob
+
     def load_from_state(self) -> GenerateDocumentsOutput:
         """Load documents from state"""
         logging.debug("Loading blob objects")
@@ -100,6 +100,8 @@ _PAGE_EXPANSION_FIELDS = [
 
 # Configuration constants
 BLOB_STORAGE_SIZE_THRESHOLD = 20 * 1024 * 1024  # 20MB
+# Blob storage objects of at least this size are streamed to storage rather than downloaded first; 0 disables it.
+BLOB_STREAMING_THRESHOLD = int(os.environ.get("BLOB_STREAMING_THRESHOLD", 0))
 INDEX_BATCH_SIZE = 2
 SLACK_NUM_THREADS = 4
 ENABLE_EXPENSIVE_EXPERT_CALLS = False
@@ -1,7 +1,8 @@
 """Data model definitions for all connectors"""
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Optional, List, Sequence, NamedTuple
+from io import BytesIO
+from typing import Any, Callable, Optional, List, Sequence, NamedTuple
 from typing_extensions import TypedDict, NotRequired
 from pydantic import BaseModel
 
@@ -98,6 +99,14 @@ class Document(BaseModel):
     primary_owners: Optional[list] = None
     metadata: Optional[dict[str, Any]] = None
     doc_metadata: Optional[dict[str, Any]] = None
+    # Streamed documents leave `blob` empty and open a file-like over their content on each call instead.
+    open_blob: Optional[Callable[[], Any]] = None
+    # Change-detection fingerprint of the source object (etag/size/mtime...), recorded once it's synchronized.
+    fingerprint: Optional[str] = None
+
+    def open(self):
+        """File-like over the document content."""
+        return self.open_blob() if self.open_blob else BytesIO(self.blob)
 
 
 class BasicExpertInfo(BaseModel):
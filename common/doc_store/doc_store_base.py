@@ -13,6 +13,7 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import os
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 import numpy as np
@@ -21,6 +22,14 @@ DEFAULT_MATCH_VECTOR_TOPN = 10
 DEFAULT_MATCH_SPARSE_TOPN = 10
 VEC = list | np.ndarray
 
+# Slim searches: doc stores that can return only the selected fields, read small single-valued fields
+# from doc values, count the hits of relevance searches only as far as the engine's default bound,
+# and compute the vector similarity of hits themselves instead of returning their vectors.
+DOC_STORE_SLIM_SEARCH = int(os.environ.get("DOC_STORE_SLIM_SEARCH", 0))
+# Set in MatchDenseExpr.extra_options to get the cosine similarity of every hit as this field.
+VECTOR_SIMILARITY_FLD = "_vector_similarity"
+
+
 @dataclass
 class SparseVector:
     indices: list[int]
@@ -225,8 +225,12 @@ class ESConnectionBase(DocStoreConnection):
     def _get_source(self, res):
         rr = []
         for d in res["hits"]["hits"]:
+            d.setdefault("_source", {})
             d["_source"]["id"] = d["_id"]
             d["_source"]["_score"] = d["_score"]
+            # Doc value and script fields of slim searches, all single-valued.
+            for k, v in d.get("fields", {}).items():
+                d["_source"][k] = v[0] if isinstance(v, list) and len(v) == 1 else v
             rr.append(d["_source"])
         return rr
 
@@ -47,6 +47,55 @@ LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
 if LOCK_KEY_pdfplumber not in sys.modules:
     sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
 
+# Number of pages rendered ahead of OCR. 0 keeps rendering the whole page range up front.
+PDF_STREAM_WINDOW = int(os.environ.get("PDF_STREAM_WINDOW", "0"))
+
+
+class CompactPageImages:
+    """
+    Page images kept as losslessly compressed PNG once OCR is done with them.
+    Pages are decoded on access and only the most recently used ones stay decoded,
+    which is enough for the mostly page-ordered access of layout, table and crop code.
+    """
+
+    def __init__(self, size, cache_size=3):
+        self._pages = [None] * size
+        self._sizes = [None] * size
+        self._decoded = {}
+        self._cache_size = max(1, cache_size)
+
+    def put(self, idx, img):
+        with BytesIO() as buf:
+            img.save(buf, format="PNG", compress_level=1)
+            self._pages[idx] = buf.getvalue()
+        self._sizes[idx] = img.size
+        self._decoded.pop(idx, None)
+
+    def size_of(self, idx):
+        return self._sizes[idx]
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx in self._decoded:
+            img = self._decoded.pop(idx)
+        else:
+            img = Image.open(BytesIO(self._pages[idx]))
+            img.load()
+        self._decoded[idx] = img
+        while len(self._decoded) > self._cache_size:
+            self._decoded.pop(next(iter(self._decoded)))
+        return img
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
 
 class RAGFlowPdfParser:
     def __init__(self, **kwargs):
@@ -101,6 +150,7 @@ class RAGFlowPdfParser:
 
         self.page_from = 0
         self.column_num = 1
+        self.stream_window = int(kwargs.get("stream_window", PDF_STREAM_WINDOW))
 
     def __char_width(self, c):
         return (c["x1"] - c["x0"]) // max(len(c["text"]), 1)
@@ -247,16 +297,18 @@ class RAGFlowPdfParser:
         spans = gather(r".*spanning")
         clmns = sorted([r for r in self.tb_cpns if re.match(r"table column$", r["label"])], key=lambda x: (x["pn"], x["layoutno"], x["x0"]))
         clmns = Recognizer.layouts_cleanup(self.boxes, clmns, 5, 0.5)
-        for b in self.boxes:
-            if b.get("layout_type", "") != "table":
-                continue
-            ii = Recognizer.find_overlapped_with_threshold(b, rows, thr=0.3)
+        tbl_boxes = [b for b in self.boxes if b.get("layout_type", "") == "table"]
+        row_ii = Recognizer.find_overlapped_with_threshold_batch(tbl_boxes, rows, thr=0.3)
+        header_ii = Recognizer.find_overlapped_with_threshold_batch(tbl_boxes, headers, thr=0.3)
+        span_ii = Recognizer.find_overlapped_with_threshold_batch(tbl_boxes, spans, thr=0.3)
+        for k, b in enumerate(tbl_boxes):
+            ii = row_ii[k]
             if ii is not None:
                 b["R"] = ii
                 b["R_top"] = rows[ii]["top"]
                 b["R_bott"] = rows[ii]["bottom"]
 
-            ii = Recognizer.find_overlapped_with_threshold(b, headers, thr=0.3)
+            ii = header_ii[k]
             if ii is not None:
                 b["H_top"] = headers[ii]["top"]
                 b["H_bott"] = headers[ii]["bottom"]
@@ -270,7 +322,7 @@ class RAGFlowPdfParser:
                 b["C_left"] = clmns[ii]["x0"]
                 b["C_right"] = clmns[ii]["x1"]
 
-            ii = Recognizer.find_overlapped_with_threshold(b, spans, thr=0.3)
+            ii = span_ii[k]
             if ii is not None:
                 b["H_top"] = spans[ii]["top"]
                 b["H_bott"] = spans[ii]["bottom"]
@@ -285,7 +337,7 @@ class RAGFlowPdfParser:
 
         start = timer()
         if not bxs:
-            self.boxes.append([])
+            self.boxes[pagenum - 1] = []
             return
         bxs = [(line[0], line[1][0]) for line in bxs]
         bxs = Recognizer.sort_Y_firstly(
@@ -298,8 +350,7 @@ class RAGFlowPdfParser:
         )
 
         # merge chars in the same rect
-        for c in chars:
-            ii = Recognizer.find_overlapped(c, bxs)
+        for c, ii in zip(chars, Recognizer.find_overlapped_batch(chars, bxs)):
             if ii is None:
                 self.lefted_chars.append(c)
                 continue
@@ -341,7 +392,7 @@ class RAGFlowPdfParser:
         bxs = [b for b in bxs if b["text"]]
         if self.mean_height[pagenum - 1] == 0:
             self.mean_height[pagenum - 1] = np.median([b["bottom"] - b["top"] for b in bxs])
-        self.boxes.append(bxs)
+        self.boxes[pagenum - 1] = bxs
 
     def _layouts_rec(self, ZM, drop=True):
         assert len(self.page_images) == len(self.boxes)
@@ -375,13 +426,7 @@ class RAGFlowPdfParser:
             width = max_x1 - min_x0
 
             INDENT_TOL = width * 0.12
-            x0s = []
-            for x in x0s_raw:
-                if abs(x - min_x0) < INDENT_TOL:
-                    x0s.append([min_x0])
-                else:
-                    x0s.append([x])
-            x0s = np.array(x0s, dtype=float)
+            x0s = np.where(np.abs(x0s_raw - min_x0) < INDENT_TOL, min_x0, x0s_raw).reshape(-1, 1)
 
             max_try = min(4, len(bxs))
             if max_try < 2:
@@ -954,6 +999,12 @@ class RAGFlowPdfParser:
                 return j
         return
 
+    def _page_size(self, idx):
+        """(width, height) of a page image, without decoding it when the pages are kept compressed."""
+        if isinstance(self.page_images, CompactPageImages):
+            return self.page_images.size_of(idx)
+        return self.page_images[idx].size
+
     def _line_tag(self, bx, ZM):
         pn = [bx["page_number"]]
         top = bx["top"] - self.page_cum_height[pn[0] - 1]
@@ -961,8 +1012,8 @@ class RAGFlowPdfParser:
         page_images_cnt = len(self.page_images)
         if pn[-1] - 1 >= page_images_cnt:
             return ""
-        while bott * ZM > self.page_images[pn[-1] - 1].size[1]:
-            bott -= self.page_images[pn[-1] - 1].size[1] / ZM
+        while bott * ZM > self._page_size(pn[-1] - 1)[1]:
+            bott -= self._page_size(pn[-1] - 1)[1] / ZM
             pn.append(pn[-1] + 1)
             if pn[-1] - 1 >= page_images_cnt:
                 return ""
@@ -979,7 +1030,7 @@ class RAGFlowPdfParser:
         def usefull(b):
             if b.get("layout_type"):
                 return True
-            if width(b) > self.page_images[b["page_number"] - 1].size[0] / ZM / 3:
+            if width(b) > self._page_size(b["page_number"] - 1)[0] / ZM / 3:
                 return True
             if b["bottom"] - b["top"] > self.mean_height[b["page_number"] - 1]:
                 return True
@@ -989,7 +1040,7 @@ class RAGFlowPdfParser:
         while boxes:
             lines = []
             widths = []
-            pw = self.page_images[boxes[0]["page_number"] - 1].size[0] / ZM
+            pw = self._page_size(boxes[0]["page_number"] - 1)[0] / ZM
             mh = self.mean_height[boxes[0]["page_number"] - 1]
             mj = self.proj_match(boxes[0]["text"]) or boxes[0].get("layout_type", "") == "title"
 
@@ -1049,6 +1100,8 @@ class RAGFlowPdfParser:
         self.page_cum_height = [0]
         self.page_layout = []
         self.page_from = page_from
+        if self.stream_window > 0:
+            return self.__images_streaming(fnm, zoomin, page_from, page_to, callback)
         start = timer()
         try:
             with sys.modules[LOCK_KEY_pdfplumber]:
@@ -1068,27 +1121,7 @@ class RAGFlowPdfParser:
             logging.exception(f"RAGFlowPdfParser __images__, exception: {e}")
         logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
 
-        self.outlines = []
-        try:
-            with pdf2_read(fnm if isinstance(fnm, str) else BytesIO(fnm)) as pdf:
-                self.pdf = pdf
-
-                outlines = self.pdf.outline
-
-                def dfs(arr, depth):
-                    for a in arr:
-                        if isinstance(a, dict):
-                            self.outlines.append((a["/Title"], depth))
-                            continue
-                        dfs(a, depth + 1)
-
-                dfs(outlines, 0)
-
-        except Exception as e:
-            logging.warning(f"Outlines exception: {e}")
-
-        if not self.outlines:
-            logging.warning("Miss outlines")
+        self.__load_outlines(fnm)
 
         logging.debug("Images converted.")
         self.is_english = [
@@ -1101,16 +1134,7 @@ class RAGFlowPdfParser:
             self.is_english = False
 
         async def __img_ocr(i, id, img, chars, limiter):
-            j = 0
-            while j + 1 < len(chars):
-                if (
-                    chars[j]["text"]
-                    and chars[j + 1]["text"]
-                    and re.match(r"[0-9a-zA-Z,.:;!%]+", chars[j]["text"] + chars[j + 1]["text"])
-                    and chars[j + 1]["x0"] - chars[j]["x1"] >= min(chars[j + 1]["width"], chars[j]["width"]) / 2
-                ):
-                    chars[j]["text"] += " "
-                j += 1
+            self.__merge_char_spaces(chars)
 
             if limiter:
                 async with limiter:
@@ -1165,6 +1189,7 @@ class RAGFlowPdfParser:
 
         start = timer()
 
+        self.boxes = [[] for _ in self.page_images]
         asyncio.run(__img_ocr_launcher())
 
         logging.info(f"__images__ {len(self.page_images)} pages cost {timer() - start}s")
@@ -1180,6 +1205,159 @@ class RAGFlowPdfParser:
         if len(self.boxes) == 0 and zoomin < 9:
             self.__images__(fnm, zoomin * 3, page_from, page_to, callback)
 
+    def __load_outlines(self, fnm):
+        self.outlines = []
+        try:
+            with pdf2_read(fnm if isinstance(fnm, str) else BytesIO(fnm)) as pdf:
+                self.pdf = pdf
+
+                def dfs(arr, depth):
+                    for a in arr:
+                        if isinstance(a, dict):
+                            self.outlines.append((a["/Title"], depth))
+                            continue
+                        dfs(a, depth + 1)
+
+                dfs(self.pdf.outline, 0)
+
+        except Exception as e:
+            logging.warning(f"Outlines exception: {e}")
+
+        if not self.outlines:
+            logging.warning("Miss outlines")
+
+    @staticmethod
+    def __merge_char_spaces(chars):
+        j = 0
+        while j + 1 < len(chars):
+            if (
+                chars[j]["text"]
+                and chars[j + 1]["text"]
+                and re.match(r"[0-9a-zA-Z,.:;!%]+", chars[j]["text"] + chars[j + 1]["text"])
+                and chars[j + 1]["x0"] - chars[j]["x1"] >= min(chars[j + 1]["width"], chars[j]["width"]) / 2
+            ):
+                chars[j]["text"] += " "
+            j += 1
+        return chars
+
+    def __images_streaming(self, fnm, zoomin, page_from, page_to, callback):
+        """
+        Bounded streaming variant of `__images__`.
+
+        Characters of the whole range are extracted first since language detection needs all of them,
+        then pages are rendered at most `stream_window` pages ahead of OCR. Once a page is OCR'd its
+        bitmap is kept compressed in `CompactPageImages`. Pages which come back without any box are
+        re-OCR'd individually at a higher zoom instead of re-rendering the whole range.
+        """
+        start = timer()
+        lock = sys.modules[LOCK_KEY_pdfplumber]
+        try:
+            with lock:
+                pdf = pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))
+        except Exception as e:
+            logging.exception(f"RAGFlowPdfParser __images__, exception: {e}")
+            self.page_images = []
+            self.page_chars = []
+            self.page_cum_height = np.cumsum(self.page_cum_height)
+            return
+
+        with pdf:
+            pages = pdf.pages[page_from:page_to]
+            self.total_page = len(pdf.pages)
+            try:
+                with lock:
+                    self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in pages]
+            except Exception as e:
+                logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
+                self.page_chars = [[] for _ in pages]
+            logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
+
+            self.__load_outlines(fnm)
+            self.is_english = [
+                re.search(r"[ a-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join(random.choices([c["text"] for c in self.page_chars[i]], k=min(100, len(self.page_chars[i])))))
+                for i in range(len(self.page_chars))
+            ]
+            self.is_english = sum([1 if e else 0 for e in self.is_english]) > len(pages) / 2
+
+            page_num = len(pages)
+            self.page_images = CompactPageImages(page_num, cache_size=self.stream_window + 2)
+            self.boxes = [[] for _ in range(page_num)]
+            self.mean_height = [0] * page_num
+            self.mean_width = [8] * page_num
+            page_heights = [0] * page_num
+
+            def render(i, zm):
+                with lock:
+                    return pages[i].to_image(resolution=72 * zm, antialias=True).annotated
+
+            async def producer(queue, n_consumers):
+                try:
+                    for i in range(page_num):
+                        img = await asyncio.to_thread(render, i, zoomin)
+                        await queue.put((i, img))
+                finally:
+                    for _ in range(n_consumers):
+                        await queue.put(None)
+
+            async def consumer(queue, device_id, limiter):
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    i, img = item
+                    chars = self.page_chars[i] if not self.is_english else []
+                    self.mean_height[i] = np.median(sorted([c["height"] for c in chars])) if chars else 0
+                    self.mean_width[i] = np.median(sorted([c["width"] for c in chars])) if chars else 8
+                    page_heights[i] = img.size[1] / zoomin
+                    self.__merge_char_spaces(chars)
+                    if limiter:
+                        async with limiter:
+                            await asyncio.to_thread(self.__ocr, i + 1, img, chars, zoomin, device_id)
+                    else:
+                        await asyncio.to_thread(self.__ocr, i + 1, img, chars, zoomin, device_id)
+                    await asyncio.to_thread(self.page_images.put, i, img)
+                    img.close()
+                    if callback and i % 6 == 5:
+                        callback((i + 1) * 0.6 / page_num)
+
+            async def launcher():
+                n_consumers = settings.PARALLEL_DEVICES if self.parallel_limiter else 1
+                queue = asyncio.Queue(maxsize=self.stream_window)
+                tasks = [asyncio.create_task(producer(queue, n_consumers))]
+                for d in range(n_consumers):
+                    tasks.append(asyncio.create_task(consumer(queue, d, self.parallel_limiter[d] if self.parallel_limiter else None)))
+                try:
+                    await asyncio.gather(*tasks, return_exceptions=False)
+                except Exception as e:
+                    logging.error(f"Error in OCR: {e}")
+                    for t in tasks:
+                        t.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+
+            ocr_start = timer()
+            asyncio.run(launcher())
+
+            # Only pages without any recognized box are retried at a higher resolution.
+            # Their stored image stays at `zoomin` since __ocr maps boxes back to PDF points.
+            zm = zoomin * 3
+            for i in range(page_num):
+                if self.boxes[i] or self.page_chars[i] or zoomin >= 9:
+                    continue
+                img = render(i, zm)
+                self.__ocr(i + 1, img, [], zm, 0)
+                img.close()
+                if self.boxes[i]:
+                    logging.info(f"__images__ page {page_from + i + 1} re-OCR'd at zoom {zm}")
+
+        self.page_cum_height = np.cumsum([0] + page_heights)
+        logging.info(f"__images__ {page_num} pages cost {timer() - ocr_start}s")
+
+        if not self.is_english and not any([c for c in self.page_chars]) and any(self.boxes):
+            bxes = [b for bxs in self.boxes for b in bxs]
+            self.is_english = re.search(r"[ \na-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join([b["text"] for b in random.choices(bxes, k=min(30, len(bxes)))]))
+        logging.debug(f"Is it English: {self.is_english}")
+
     def __call__(self, fnm, need_image=True, zoomin=3, return_html=False):
         self.__images__(fnm, zoomin)
         self._layouts_rec(zoomin)
@@ -1333,7 +1511,7 @@ class RAGFlowPdfParser:
             if need_position:
                 return None, None
             return
-        last_page_height = self.page_images[last_page_idx].size[1] / ZM
+        last_page_height = self._page_size(last_page_idx)[1] / ZM
         poss.append(
             (
                 [last_page_idx],
@@ -1353,7 +1531,7 @@ class RAGFlowPdfParser:
             bottom *= ZM
             for pn in pns[1:]:
                 if 0 <= pn - 1 < page_count:
-                    bottom += self.page_images[pn - 1].size[1]
+                    bottom += self._page_size(pn - 1)[1]
                 else:
                     logging.warning(f"Page index {pn}-1 out of range for {page_count} pages during crop; skipping height accumulation.")
 
@@ -1361,18 +1539,18 @@ class RAGFlowPdfParser:
                 logging.warning(f"Base page index {pns[0]} out of range for {page_count} pages during crop; skipping this segment.")
                 continue
 
-            imgs.append(self.page_images[pns[0]].crop((left * ZM, top * ZM, right * ZM, min(bottom, self.page_images[pns[0]].size[1]))))
+            imgs.append(self.page_images[pns[0]].crop((left * ZM, top * ZM, right * ZM, min(bottom, self._page_size(pns[0])[1]))))
             if 0 < ii < len(poss) - 1:
-                positions.append((pns[0] + self.page_from, left, right, top, min(bottom, self.page_images[pns[0]].size[1]) / ZM))
-            bottom -= self.page_images[pns[0]].size[1]
+                positions.append((pns[0] + self.page_from, left, right, top, min(bottom, self._page_size(pns[0])[1]) / ZM))
+            bottom -= self._page_size(pns[0])[1]
             for pn in pns[1:]:
                 if not (0 <= pn < page_count):
                     logging.warning(f"Page index {pn} out of range for {page_count} pages during crop; skipping this page.")
                     continue
-                imgs.append(self.page_images[pn].crop((left * ZM, 0, right * ZM, min(bottom, self.page_images[pn].size[1]))))
+                imgs.append(self.page_images[pn].crop((left * ZM, 0, right * ZM, min(bottom, self._page_size(pn)[1]))))
                 if 0 < ii < len(poss) - 1:
-                    positions.append((pn + self.page_from, left, right, 0, min(bottom, self.page_images[pn].size[1]) / ZM))
-                bottom -= self.page_images[pn].size[1]
+                    positions.append((pn + self.page_from, left, right, 0, min(bottom, self._page_size(pn)[1]) / ZM))
+                bottom -= self._page_size(pn)[1]
 
         if not imgs:
             if need_position:
@@ -1403,12 +1581,12 @@ class RAGFlowPdfParser:
         pn = bx["page_number"]
         top = bx["top"] - self.page_cum_height[pn - 1]
         bott = bx["bottom"] - self.page_cum_height[pn - 1]
-        poss.append((pn, bx["x0"], bx["x1"], top, min(bott, self.page_images[pn - 1].size[1] / ZM)))
-        while bott * ZM > self.page_images[pn - 1].size[1]:
-            bott -= self.page_images[pn - 1].size[1] / ZM
+        poss.append((pn, bx["x0"], bx["x1"], top, min(bott, self._page_size(pn - 1)[1] / ZM)))
+        while bott * ZM > self._page_size(pn - 1)[1]:
+            bott -= self._page_size(pn - 1)[1] / ZM
             top = 0
             pn += 1
-            poss.append((pn, bx["x0"], bx["x1"], top, min(bott, self.page_images[pn - 1].size[1] / ZM)))
+            poss.append((pn, bx["x0"], bx["x1"], top, min(bott, self._page_size(pn - 1)[1] / ZM)))
         return poss
 
 
@@ -1493,7 +1671,7 @@ class VisionParser(RAGFlowPdfParser):
                 kwargs["callback"](idx * 1.0 / len(self.page_images), f"Processed: {idx + 1}/{len(self.page_images)}")
 
             if text:
-                width, height = self.page_images[idx].size
+                width, height = self._page_size(idx)
                 all_docs.append((
                     text,
                     f"@@{pdf_page_num + 1}\t{0.0:.1f}\t{width / zoomin:.1f}\t{0.0:.1f}\t{height / zoomin:.1f}##"
@@ -75,10 +75,13 @@ class LayoutRecognizer(Recognizer):
         # Tag layout type
         boxes = []
         assert len(image_list) == len(layouts)
+        # Compressed page images know their sizes without being decoded again.
+        page_size = image_list.size_of if hasattr(image_list, "size_of") else lambda i: image_list[i].size
         garbages = {}
         page_layout = []
         for pn, lts in enumerate(layouts):
             bxs = ocr_res[pn]
+            page_height = page_size(pn)[1]
             lts = [
                 {
                     "type": b["type"],
@@ -99,6 +102,7 @@ class LayoutRecognizer(Recognizer):
             def findLayout(ty):
                 nonlocal bxs, lts, self
                 lts_ = [lt for lt in lts if lt["type"] == ty]
+                assigned = self.find_overlapped_with_threshold_batch(bxs, lts_, thr=0.4)
                 i = 0
                 while i < len(bxs):
                     if bxs[i].get("layout_type"):
@@ -106,23 +110,25 @@ class LayoutRecognizer(Recognizer):
                         continue
                     if __is_garbage(bxs[i]):
                         bxs.pop(i)
+                        assigned.pop(i)
                         continue
 
-                    ii = self.find_overlapped_with_threshold(bxs[i], lts_, thr=0.4)
+                    ii = assigned[i]
                     if ii is None:
                         bxs[i]["layout_type"] = ""
                         i += 1
                         continue
                     lts_[ii]["visited"] = True
                     keep_feats = [
-                        lts_[ii]["type"] == "footer" and bxs[i]["bottom"] < image_list[pn].size[1] * 0.9 / scale_factor,
-                        lts_[ii]["type"] == "header" and bxs[i]["top"] > image_list[pn].size[1] * 0.1 / scale_factor,
+                        lts_[ii]["type"] == "footer" and bxs[i]["bottom"] < page_height * 0.9 / scale_factor,
+                        lts_[ii]["type"] == "header" and bxs[i]["top"] > page_height * 0.1 / scale_factor,
                     ]
                     if drop and lts_[ii]["type"] in self.garbage_layouts and not any(keep_feats):
                         if lts_[ii]["type"] not in garbages:
                             garbages[lts_[ii]["type"]] = []
                         garbages[lts_[ii]["type"]].append(bxs[i]["text"])
                         bxs.pop(i)
+                        assigned.pop(i)
                         continue
 
                     bxs[i]["layoutno"] = f"{ty}-{ii}"
@@ -400,6 +406,7 @@ class AscendLayoutRecognizer(Recognizer):
             def _tag_layout(ty):
                 nonlocal bxs, lts
                 lts_of_ty = [lt for lt in lts if lt["type"] == ty]
+                assigned = self.find_overlapped_with_threshold_batch(bxs, lts_of_ty, thr=0.4)
                 i = 0
                 while i < len(bxs):
                     if bxs[i].get("layout_type"):
@@ -407,9 +414,10 @@ class AscendLayoutRecognizer(Recognizer):
                         continue
                     if _is_garbage_text(bxs[i]):
                         bxs.pop(i)
+                        assigned.pop(i)
                         continue
 
-                    ii = self.find_overlapped_with_threshold(bxs[i], lts_of_ty, thr=0.4)
+                    ii = assigned[i]
                     if ii is None:
                         bxs[i]["layout_type"] = ""
                         i += 1
@@ -424,6 +432,7 @@ class AscendLayoutRecognizer(Recognizer):
                     if drop and lts_of_ty[ii]["type"] in self.garbage_layouts and not any(keep_feats):
                         garbages.setdefault(lts_of_ty[ii]["type"], []).append(bxs[i].get("text", ""))
                         bxs.pop(i)
+                        assigned.pop(i)
                         continue
 
                     bxs[i]["layoutno"] = f"{ty}-{ii}"
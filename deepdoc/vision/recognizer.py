@@ -131,6 +131,83 @@ class Recognizer:
             ov /= (x1 - x0) * (btm - tp)
         return ov
 
+    @staticmethod
+    def boxes_to_array(boxes):
+        """(n, 4) array of [x0, x1, top, bottom]."""
+        if isinstance(boxes, np.ndarray):
+            return boxes
+        if not boxes:
+            return np.zeros((0, 4), dtype=np.float64)
+        return np.array([[b["x0"], b["x1"], b["top"], b["bottom"]] for b in boxes], dtype=np.float64)
+
+    @staticmethod
+    def overlapped_area_matrix(a_boxes, b_boxes, ratio=True):
+        """
+        Batched `overlapped_area`: element (i, j) equals overlapped_area(a_boxes[i], b_boxes[j], ratio).
+        Accepts lists of box dicts or arrays from `boxes_to_array`.
+        """
+        a = Recognizer.boxes_to_array(a_boxes)
+        b = Recognizer.boxes_to_array(b_boxes)
+        w = np.minimum(a[:, None, 1], b[None, :, 1]) - np.maximum(a[:, None, 0], b[None, :, 0])
+        h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 2], b[None, :, 2])
+        ov = np.where((w >= 0) & (h >= 0), h * w, 0.)
+        a_w = a[:, 1] - a[:, 0]
+        a_h = a[:, 3] - a[:, 2]
+        a_area = a_w * a_h
+        degenerated = (a_w == 0) | (a_h == 0)
+        ov[degenerated, :] = 0
+        if ratio:
+            ov = np.divide(ov, a_area[:, None], out=np.zeros_like(ov), where=~degenerated[:, None] & (ov > 0))
+        return ov
+
+    @staticmethod
+    def find_overlapped_batch(boxes, boxes_sorted_by_y, block_size=256):
+        """
+        Batched `find_overlapped`: for every box, the index of the candidate it covers the largest
+        ratio of, or None. Boxes are processed in y-sorted blocks, each scored against the candidates
+        intersecting the block's y band only, so every candidate in reach is considered.
+        """
+        res = [None] * len(boxes)
+        if not boxes or not boxes_sorted_by_y:
+            return res
+        cands = Recognizer.boxes_to_array(boxes_sorted_by_y)
+        arr = Recognizer.boxes_to_array(boxes)
+        order = np.argsort(arr[:, 2], kind="stable")
+        for st in range(0, len(order), block_size):
+            idx = order[st: st + block_size]
+            blk = arr[idx]
+            cand_idx = np.nonzero((cands[:, 3] >= blk[:, 2].min()) & (cands[:, 2] <= blk[:, 3].max()))[0]
+            if not len(cand_idx):
+                continue
+            ov = Recognizer.overlapped_area_matrix(cands[cand_idx], blk).T
+            best = np.argmax(ov, axis=1)
+            hit = ov[np.arange(len(best)), best] > 0
+            for i in np.nonzero(hit)[0]:
+                res[idx[i]] = int(cand_idx[best[i]])
+        return res
+
+    @staticmethod
+    def find_overlapped_with_threshold_batch(boxes, candidates, thr=0.3):
+        """Batched `find_overlapped_with_threshold`, with the same tie breaking."""
+        res = [None] * len(boxes)
+        if not boxes or not candidates:
+            return res
+        arr, cands = Recognizer.boxes_to_array(boxes), Recognizer.boxes_to_array(candidates)
+        ov = Recognizer.overlapped_area_matrix(arr, cands)
+        _ov = Recognizer.overlapped_area_matrix(cands, arr).T
+        rev = slice(None, None, -1)
+        for i in range(len(arr)):
+            ok = ov[i] >= thr
+            if not ok.any():
+                continue
+            m = ov[i][ok].max()
+            ok &= ov[i] == m
+            _m = _ov[i][ok].max()
+            ok &= _ov[i] == _m
+            # The scalar version keeps the last of equal candidates.
+            res[i] = len(cands) - 1 - int(np.argmax(ok[rev]))
+        return res
+
     @staticmethod
     def layouts_cleanup(boxes, layouts, far=2, thr=0.7):
         def not_overlapped(a, b):
@@ -139,6 +216,7 @@ class Recognizer:
                         a["bottom"] < b["top"],
                         a["top"] > b["bottom"]])
 
+        boxes_arr = None
         i = 0
         while i + 1 < len(layouts):
             j = i + 1
@@ -161,12 +239,9 @@ class Recognizer:
                     layouts.pop(i)
                 continue
 
-            area_i, area_i_1 = 0, 0
-            for b in boxes:
-                if not not_overlapped(b, layouts[i]):
-                    area_i += Recognizer.overlapped_area(b, layouts[i], False)
-                if not not_overlapped(b, layouts[j]):
-                    area_i_1 += Recognizer.overlapped_area(b, layouts[j], False)
+            if boxes_arr is None:
+                boxes_arr = Recognizer.boxes_to_array(boxes)
+            area_i, area_i_1 = Recognizer.overlapped_area_matrix(boxes_arr, [layouts[i], layouts[j]], False).sum(axis=0)
 
             if area_i > area_i_1:
                 layouts.pop(j)
@@ -414,18 +489,13 @@ class Recognizer:
 
     def __call__(self, image_list, thr=0.7, batch_size=16):
         res = []
-        images = []
-        for i in range(len(image_list)):
-            if not isinstance(image_list[i], np.ndarray):
-                images.append(np.array(image_list[i]))
-            else:
-                images.append(image_list[i])
-
-        batch_loop_cnt = math.ceil(float(len(images)) / batch_size)
+        # Convert to arrays batch by batch so that only one batch of decoded pages is alive at a time.
+        batch_loop_cnt = math.ceil(float(len(image_list)) / batch_size)
         for i in range(batch_loop_cnt):
             start_index = i * batch_size
-            end_index = min((i + 1) * batch_size, len(images))
-            batch_image_list = images[start_index:end_index]
+            end_index = min((i + 1) * batch_size, len(image_list))
+            batch_image_list = [img if isinstance(img, np.ndarray) else np.array(img)
+                                for img in (image_list[j] for j in range(start_index, end_index))]
             inputs = self.preprocess(batch_image_list)
             logging.debug("preprocess")
             for ins in inputs:
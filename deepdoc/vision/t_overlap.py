@@ -0,0 +1,88 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Micro benchmark of char-to-box and box-to-layout assignment on a synthetic dense page,
+comparing the per-item Recognizer lookups with their batched NumPy counterparts.
+
+    python deepdoc/vision/t_overlap.py --chars 8000 --boxes 300
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+from timeit import default_timer as timer
+
+from deepdoc.vision.recognizer import Recognizer
+
+
+def synthetic_page(n_chars, n_boxes, width=600, height=800):
+    line_h = height / n_boxes
+    boxes = []
+    for i in range(n_boxes):
+        x0 = random.uniform(20, 80)
+        boxes.append({"x0": x0, "x1": x0 + random.uniform(300, 500), "top": i * line_h, "bottom": i * line_h + line_h * 0.8})
+    chars = []
+    for _ in range(n_chars):
+        b = random.choice(boxes)
+        x0 = random.uniform(b["x0"] - 5, b["x1"])
+        top = b["top"] + random.uniform(-1, 1)
+        chars.append({"x0": x0, "x1": x0 + 5, "top": top, "bottom": top + (b["bottom"] - b["top"])})
+    return chars, Recognizer.sort_Y_firstly(boxes, line_h / 3)
+
+
+def main(args):
+    random.seed(args.seed)
+    chars, boxes = synthetic_page(args.chars, args.boxes)
+    layouts = [{"x0": 0, "x1": 600, "top": t, "bottom": t + 60} for t in range(0, 800, 40)]
+
+    st = timer()
+    scalar = [Recognizer.find_overlapped(c, boxes) for c in chars]
+    t_scalar = timer() - st
+    st = timer()
+    batched = Recognizer.find_overlapped_batch(chars, boxes)
+    t_batched = timer() - st
+    diff = sum(1 for a, b in zip(scalar, batched) if a != b)
+    print(f"find_overlapped: {len(chars)} chars x {len(boxes)} boxes, "
+          f"scalar {t_scalar * 1000:.1f}ms, batched {t_batched * 1000:.1f}ms, {diff} different assignments")
+
+    st = timer()
+    scalar = [Recognizer.find_overlapped_with_threshold(b, layouts, thr=0.4) for b in boxes]
+    t_scalar = timer() - st
+    st = timer()
+    batched = Recognizer.find_overlapped_with_threshold_batch(boxes, layouts, thr=0.4)
+    t_batched = timer() - st
+    assert scalar == batched, "Batched assignment differs from the scalar one"
+    print(f"find_overlapped_with_threshold: {len(boxes)} boxes x {len(layouts)} layouts, "
+          f"scalar {t_scalar * 1000:.1f}ms, batched {t_batched * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chars', help="Number of chars on the page. Default: 8000", type=int, default=8000)
+    parser.add_argument('--boxes', help="Number of OCR boxes on the page. Default: 300", type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args)
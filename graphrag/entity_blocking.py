@@ -0,0 +1,216 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Candidate pair generation for entity resolution.
+
+`is_similarity` only accepts a pair when:
+  - both names have the same set of 2-grams containing a digit,
+  - for two English names, editdistance(a, b) <= min(len(a), len(b)) // 2,
+    which requires the two character multisets to share at least
+    len(a) - len(a) // 2 characters,
+  - otherwise, the two character sets share at least 2 characters (short names)
+    or 80% of the larger set.
+
+Each of those is turned into an exact filter: names are blocked on their digit
+2-grams, and the overlap bounds drive a prefix-filtering inverted index (tokens
+ordered rarest first, only the first |x| - t + 1 tokens of a name are indexed).
+Two names reaching the overlap bound always share a token of their prefixes, so
+the index yields a superset of the similar pairs, which are then verified with the
+remaining checks of `is_similarity`. The candidate set is identical to checking every
+combination.
+"""
+
+import itertools
+import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import editdistance
+
+from rag.nlp import is_english
+
+
+def digit_2grams(s):
+    return frozenset(s[i:i + 2] for i in range(len(s) - 1) if s[i].isdigit() or s[i + 1].isdigit())
+
+
+def has_digit_in_2gram_diff(a, b):
+    def to_2gram_set(s):
+        return {s[i:i + 2] for i in range(len(s) - 1)}
+
+    diff = to_2gram_set(a) ^ to_2gram_set(b)
+    return any(any(c.isdigit() for c in pair) for pair in diff)
+
+
+def is_similarity(a, b):
+    if has_digit_in_2gram_diff(a, b):
+        return False
+
+    if is_english(a) and is_english(b):
+        if editdistance.eval(a, b) <= min(len(a), len(b)) // 2:
+            return True
+        return False
+
+    a, b = set(a), set(b)
+    max_l = max(len(a), len(b))
+    if max_l < 4:
+        return len(a & b) > 1
+
+    return len(a & b) * 1. / max_l >= 0.8
+
+
+def _char_multiset(s):
+    cnt = Counter()
+    tokens = []
+    for c in s:
+        cnt[c] += 1
+        tokens.append((c, cnt[c]))
+    return tokens
+
+
+def _set_min_overlap(n):
+    # Lower bound of |A & B| for any accepted pair, knowing |A| only. Flooring keeps the bound safe.
+    return 2 if n < 4 else int(n * 0.8)
+
+
+def _eng_min_overlap(n):
+    return n - n // 2
+
+
+class _PrefixIndex:
+    """Inverted index over the rarest-first prefix of each name's tokens."""
+
+    def __init__(self, token_lists, min_overlap):
+        df = Counter(t for tokens in token_lists for t in set(tokens))
+        order = {t: i for i, t in enumerate(sorted(df, key=lambda t: (df[t], repr(t))))}
+        self.prefixes = []
+        for tokens in token_lists:
+            tokens = sorted(set(tokens), key=order.__getitem__)
+            self.prefixes.append(tokens[:max(0, len(tokens) - min_overlap(len(tokens)) + 1)])
+        self.postings = defaultdict(list)
+
+    def add(self, i):
+        for t in self.prefixes[i]:
+            self.postings[t].append(i)
+
+    def probe(self, i):
+        res = set()
+        for t in self.prefixes[i]:
+            res.update(self.postings.get(t, []))
+        res.discard(i)
+        return res
+
+
+def _block_candidates(names, probes):
+    """Unverified candidate index pairs (i < j) for a list of sorted names sharing their digit 2-grams."""
+    eng = [is_english(n) for n in names]
+    pairs = set()
+
+    eng_ids = [i for i, e in enumerate(eng) if e]
+    if len(eng_ids) > 1:
+        idx = _PrefixIndex([_char_multiset(names[i]) if eng[i] else [] for i in range(len(names))], _eng_min_overlap)
+        for i in eng_ids:
+            idx.add(i)
+        for i in probes:
+            if not eng[i]:
+                continue
+            la = len(names[i])
+            for j in idx.probe(i):
+                lb = len(names[j])
+                if abs(la - lb) <= min(la, lb) // 2:
+                    pairs.add((min(i, j), max(i, j)))
+
+    # A pair where at least one of the names is not English goes through the character set comparison.
+    other_ids = [i for i, e in enumerate(eng) if not e]
+    if other_ids:
+        idx = _PrefixIndex([list(n) for n in names], _set_min_overlap)
+        for i in range(len(names)):
+            idx.add(i)
+        for i in probes:
+            for j in idx.probe(i):
+                if eng[i] and eng[j]:
+                    continue
+                pairs.add((min(i, j), max(i, j)))
+    return pairs
+
+
+def _verify(names, pairs):
+    # Names of a block share their digit 2-grams, so only the remaining checks of `is_similarity` are needed.
+    eng = [is_english(n) for n in names]
+    char_sets = [set(n) for n in names]
+    char_counts = [Counter(n) if e else None for n, e in zip(names, eng)]
+    res = []
+    for i, j in pairs:
+        if eng[i] and eng[j]:
+            la, lb = len(names[i]), len(names[j])
+            # editdistance(a, b) >= max(|a|, |b|) - |a & b| for character multisets, a cheap lower bound.
+            if sum((char_counts[i] & char_counts[j]).values()) < max(la, lb) - min(la, lb) // 2:
+                continue
+            if editdistance.eval(names[i], names[j]) <= min(la, lb) // 2:
+                res.append((i, j))
+            continue
+        a, b = char_sets[i], char_sets[j]
+        max_l = max(len(a), len(b))
+        if (len(a & b) > 1) if max_l < 4 else (len(a & b) * 1. / max_l >= 0.8):
+            res.append((i, j))
+    return res
+
+
+def _block_and_verify(args):
+    names, probes = args
+    return names, _verify(names, _block_candidates(names, probes))
+
+
+def candidate_pairs(nodes, subgraph_nodes, workers=0):
+    """
+    Same result as
+        [(a, b) for a, b in itertools.combinations(nodes, 2) if (a in subgraph_nodes or b in subgraph_nodes) and is_similarity(a, b)]
+    for sorted `nodes`, without comparing every pair. Blocks are processed by `workers` processes when it is above 1.
+    """
+    blocks = defaultdict(list)
+    for n in nodes:
+        blocks[digit_2grams(n)].append(n)
+
+    jobs = []
+    for names in blocks.values():
+        if len(names) < 2:
+            continue
+        probes = [i for i, n in enumerate(names) if n in subgraph_nodes]
+        if probes:
+            jobs.append((names, probes))
+
+    if workers > 1 and len(jobs) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_block_and_verify, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+        except Exception as e:
+            logging.warning(f"Entity blocking falls back to a single process: {e}")
+            results = [_block_and_verify(job) for job in jobs]
+    else:
+        results = [_block_and_verify(job) for job in jobs]
+
+    rank = {n: i for i, n in enumerate(nodes)}
+    res = []
+    for names, pairs in results:
+        for i, j in pairs:
+            a, b = names[i], names[j]
+            res.append((a, b) if rank[a] < rank[b] else (b, a))
+    res.sort(key=lambda p: (rank[p[0]], rank[p[1]]))
+    return res
+
+
+def naive_candidate_pairs(nodes, subgraph_nodes):
+    return [(a, b) for a, b in itertools.combinations(nodes, 2) if (a in subgraph_nodes or b in subgraph_nodes) and is_similarity(a, b)]
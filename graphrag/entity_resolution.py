@@ -15,7 +15,6 @@
 #
 import asyncio
 import logging
-import itertools
 import os
 import re
 from dataclasses import dataclass
@@ -24,8 +23,7 @@ from typing import Any, Callable
 import networkx as nx
 
 from graphrag.general.extractor import Extractor
-from rag.nlp import is_english
-import editdistance
+from graphrag.entity_blocking import candidate_pairs, has_digit_in_2gram_diff, is_similarity
 from graphrag.entity_resolution_prompt import ENTITY_RESOLUTION_PROMPT
 from rag.llm.chat_model import Base as CompletionLLM
 from graphrag.utils import perform_variable_replacements, chat_limiter, GraphChange
@@ -35,6 +33,7 @@ from common.exceptions import TaskCanceledException
 DEFAULT_RECORD_DELIMITER = "##"
 DEFAULT_ENTITY_INDEX_DELIMITER = "<|>"
 DEFAULT_RESOLUTION_RESULT_DELIMITER = "&&"
+ENTITY_RESOLUTION_WORKERS = int(os.environ.get("ENTITY_RESOLUTION_WORKERS", "0"))
 
 
 @dataclass
@@ -95,7 +94,7 @@ class EntityResolution(Extractor):
 
         candidate_resolution = {entity_type: [] for entity_type in entity_types}
         for k, v in node_clusters.items():
-            candidate_resolution[k] = [(a, b) for a, b in itertools.combinations(v, 2) if (a in subgraph_nodes or b in subgraph_nodes) and self.is_similarity(a, b)]
+            candidate_resolution[k] = await asyncio.to_thread(candidate_pairs, v, subgraph_nodes, ENTITY_RESOLUTION_WORKERS)
         num_candidates = sum([len(candidates) for _, candidates in candidate_resolution.items()])
         callback(msg=f"Identified {num_candidates} candidate pairs")
         remain_candidates_to_resolve = num_candidates
@@ -268,28 +267,7 @@ class EntityResolution(Extractor):
         return ans_list
 
     def _has_digit_in_2gram_diff(self, a, b):
-        def to_2gram_set(s):
-            return {s[i:i+2] for i in range(len(s) - 1)}
-
-        set_a = to_2gram_set(a)
-        set_b = to_2gram_set(b)
-        diff = set_a ^ set_b
-
-        return any(any(c.isdigit() for c in pair) for pair in diff)
+        return has_digit_in_2gram_diff(a, b)
 
     def is_similarity(self, a, b):
-        if self._has_digit_in_2gram_diff(a, b):
-            return False
-
-        if is_english(a) and is_english(b):
-            if editdistance.eval(a, b) <= min(len(a), len(b)) // 2:
-                return True
-            return False
-
-        a, b = set(a), set(b)
-        max_l = max(len(a), len(b))
-        if max_l < 4:
-            return len(a & b) > 1
-
-        return len(a & b)*1./max_l >= 0.8
-
+        return is_similarity(a, b)
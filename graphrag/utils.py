@@ -13,6 +13,7 @@ import json
 import logging
 import os
 import re
+import struct
 import time
 from collections import defaultdict
 from hashlib import md5
@@ -108,26 +109,61 @@ def set_llm_cache(llmnm, txt, v, history, genconf):
     REDIS_CONN.set(k, v.encode("utf-8"), 24 * 3600)
 
 
-def get_embed_cache(llmnm, txt):
-    hasher = xxhash.xxh64()
-    hasher.update(str(llmnm).encode("utf-8"))
-    hasher.update(str(txt).encode("utf-8"))
+EMBED_CACHE_MAGIC = b"EMB1"
+_EMBED_CACHE_HEADER = struct.Struct("<4sBI")
+_EMBED_CACHE_DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f2")}
+# float16 halves the cache footprint at the cost of ~3 significant digits, which is plenty for cosine similarity.
+EMBED_CACHE_DTYPE = 1 if os.environ.get("EMBED_CACHE_DTYPE", "float32").lower() == "float16" else 0
+EMBED_CACHE_BATCH_SIZE = 512
 
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
+
+def encode_embed_cache(arr, dtype_code=None) -> bytes:
+    """Little-endian float32/float16 vector prefixed by a header of magic, dtype code and dimension."""
+    dtype_code = EMBED_CACHE_DTYPE if dtype_code is None else dtype_code
+    arr = np.asarray(arr).reshape(-1).astype(_EMBED_CACHE_DTYPES[dtype_code])
+    return _EMBED_CACHE_HEADER.pack(EMBED_CACHE_MAGIC, dtype_code, arr.shape[0]) + arr.tobytes()
+
+
+def decode_embed_cache(bin):
     if not bin:
         return
+    if isinstance(bin, bytes) and bin[:len(EMBED_CACHE_MAGIC)] == EMBED_CACHE_MAGIC:
+        _, dtype_code, dim = _EMBED_CACHE_HEADER.unpack_from(bin)
+        arr = np.frombuffer(bin, dtype=_EMBED_CACHE_DTYPES[dtype_code], count=dim, offset=_EMBED_CACHE_HEADER.size)
+        return arr.astype(np.float32)
+    # Entries written before the binary format are JSON lists.
     return np.array(json.loads(bin))
 
 
-def set_embed_cache(llmnm, txt, arr):
+def _embed_cache_key(llmnm, txt):
     hasher = xxhash.xxh64()
     hasher.update(str(llmnm).encode("utf-8"))
     hasher.update(str(txt).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def get_embed_cache(llmnm, txt):
+    return decode_embed_cache(REDIS_CONN.get_bin(_embed_cache_key(llmnm, txt)))
+
+
+def set_embed_cache(llmnm, txt, arr):
+    REDIS_CONN.set_bin(_embed_cache_key(llmnm, txt), encode_embed_cache(arr), 24 * 3600)
+
+
+def get_embed_cache_batch(llmnm, txts) -> list:
+    """One MGET round trip per EMBED_CACHE_BATCH_SIZE texts. Misses are None."""
+    res = []
+    for b in range(0, len(txts), EMBED_CACHE_BATCH_SIZE):
+        keys = [_embed_cache_key(llmnm, t) for t in txts[b:b + EMBED_CACHE_BATCH_SIZE]]
+        res.extend([decode_embed_cache(v) for v in REDIS_CONN.mget_bin(keys)])
+    return res
 
-    k = hasher.hexdigest()
-    arr = json.dumps(arr.tolist() if isinstance(arr, np.ndarray) else arr)
-    REDIS_CONN.set(k, arr.encode("utf-8"), 24 * 3600)
+
+def set_embed_cache_batch(llmnm, txts, arrs):
+    for b in range(0, len(txts), EMBED_CACHE_BATCH_SIZE):
+        REDIS_CONN.mset_bin({_embed_cache_key(llmnm, t): encode_embed_cache(a)
+                             for t, a in zip(txts[b:b + EMBED_CACHE_BATCH_SIZE], arrs[b:b + EMBED_CACHE_BATCH_SIZE])},
+                            24 * 3600)
 
 
 def get_tags_from_cache(kb_ids):
@@ -294,7 +330,7 @@ def chunk_id(chunk):
     return xxhash.xxh64((chunk["content_with_weight"] + chunk["kb_id"]).encode("utf-8")).hexdigest()
 
 
-async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
+async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks, ebd=None):
     global chat_limiter
     enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
     chunk = {
@@ -311,7 +347,8 @@ async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
         "available_int": 0,
     }
     chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(chunk["content_ltks"])
-    ebd = get_embed_cache(embd_mdl.llm_name, ent_name)
+    if ebd is None:
+        ebd = get_embed_cache(embd_mdl.llm_name, ent_name)
     if ebd is None:
         async with chat_limiter:
             timeout = 3 if enable_timeout_assertion else 30000000
@@ -348,7 +385,7 @@ async def get_relation(tenant_id, kb_id, from_ent_name, to_ent_name, size=1):
     return res
 
 
-async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta, chunks):
+async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta, chunks, ebd=None):
     enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
     chunk = {
         "id": get_uuid(),
@@ -365,7 +402,8 @@ async def graph_edge_to_chunk(kb_id, embd_mdl, from_ent_name, to_ent_name, meta,
     }
     chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(chunk["content_ltks"])
     txt = f"{from_ent_name}->{to_ent_name}"
-    ebd = get_embed_cache(embd_mdl.llm_name, txt)
+    if ebd is None:
+        ebd = get_embed_cache(embd_mdl.llm_name, txt)
     if ebd is None:
         async with chat_limiter:
             timeout = 3 if enable_timeout_assertion else 300000000
@@ -510,11 +548,13 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
             }
         )
 
+    nodes = list(change.added_updated_nodes)
+    cached_ebds = await asyncio.to_thread(get_embed_cache_batch, embd_mdl.llm_name, nodes)
     tasks = []
-    for ii, node in enumerate(change.added_updated_nodes):
+    for ii, node in enumerate(nodes):
         node_attrs = graph.nodes[node]
         tasks.append(asyncio.create_task(
-            graph_node_to_chunk(kb_id, embd_mdl, node, node_attrs, chunks)
+            graph_node_to_chunk(kb_id, embd_mdl, node, node_attrs, chunks, cached_ebds[ii])
         ))
         if ii % 100 == 9 and callback:
             callback(msg=f"Get embedding of nodes: {ii}/{len(change.added_updated_nodes)}")
@@ -527,13 +567,15 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
         await asyncio.gather(*tasks, return_exceptions=True)
         raise
 
+    edges = list(change.added_updated_edges)
+    cached_ebds = await asyncio.to_thread(get_embed_cache_batch, embd_mdl.llm_name, [f"{f}->{t}" for f, t in edges])
     tasks = []
-    for ii, (from_node, to_node) in enumerate(change.added_updated_edges):
+    for ii, (from_node, to_node) in enumerate(edges):
         edge_attrs = graph.get_edge_data(from_node, to_node)
         if not edge_attrs:
             continue
         tasks.append(asyncio.create_task(
-            graph_edge_to_chunk(kb_id, embd_mdl, from_node, to_node, edge_attrs, chunks)
+            graph_edge_to_chunk(kb_id, embd_mdl, from_node, to_node, edge_attrs, chunks, cached_ebds[ii])
         ))
         if ii % 100 == 9 and callback:
             callback(msg=f"Get embedding of edges: {ii}/{len(change.added_updated_edges)}")
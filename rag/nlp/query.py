@@ -173,29 +173,56 @@ class FulltextQueryer(QueryBase):
             ), keywords
         return None, keywords
 
-    def hybrid_similarity(self, avec, bvecs, atks, btkss, tkweight=0.3, vtweight=0.7):
+    def hybrid_similarity(self, avec, bvecs, atks, btkss, tkweight=0.3, vtweight=0.7, sims=None):
+        """`sims` are the vector similarities of `bvecs` when the doc store already computed them."""
         from sklearn.metrics.pairwise import cosine_similarity
         import numpy as np
 
-        sims = cosine_similarity([avec], bvecs)
+        if sims is not None:
+            sims = np.array([sims], dtype=np.float64)
+        else:
+            sims = cosine_similarity([avec], bvecs)
         tksim = self.token_similarity(atks, btkss)
         if np.sum(sims[0]) == 0:
             return np.array(tksim), tksim, sims[0]
         return np.array(sims[0]) * vtweight + np.array(tksim) * tkweight, tksim, sims[0]
 
     def token_similarity(self, atks, btkss):
-        def to_dict(tks):
+        """
+        Scores every candidate of `btkss` against `atks` as `similarity` does on their weighted tokens.
+        `similarity` only checks which query tokens a candidate contains, so candidate tokens are
+        interned against the query vocabulary instead of being weighted, and all candidates are
+        scored at once.
+        """
+        import numpy as np
+
+        if isinstance(atks, str):
+            atks = atks.split()
+        qtwt = defaultdict(int)
+        for t, c in self.tw.weights(atks, preprocess=False):
+            qtwt[t] += c
+        vocab = {t: i for i, t in enumerate(qtwt.keys())}
+        qwts = list(qtwt.values())
+
+        rows, cols = [], []
+        for r, tks in enumerate(btkss):
             if isinstance(tks, str):
                 tks = tks.split()
-            d = defaultdict(int)
-            wts = self.tw.weights(tks, preprocess=False)
-            for i, (t, c) in enumerate(wts):
-                d[t] += c
-            return d
-
-        atks = to_dict(atks)
-        btkss = [to_dict(tks) for tks in btkss]
-        return [self.similarity(atks, btks) for btks in btkss]
+            for t in tks:
+                i = vocab.get(t)
+                if i is not None:
+                    rows.append(r)
+                    cols.append(i)
+        hits = np.zeros((len(btkss), len(qwts)), dtype=bool)
+        hits[np.array(rows, dtype=int), np.array(cols, dtype=int)] = True
+
+        # Accumulate column by column, in the order `similarity` adds the weights, to get the same floats.
+        s = np.full(len(btkss), 1e-9)
+        q = 1e-9
+        for i, w in enumerate(qwts):
+            s[hits[:, i]] += w
+            q += w
+        return list(s / q)
 
     def similarity(self, qtwt, dtwt):
         if isinstance(dtwt, type("")):
@@ -0,0 +1,92 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Query embeddings may differ from document embeddings of the same text (instruction prefixes),
+# so they live under their own namespace of the shared Redis embedding cache.
+QUERY_NAMESPACE = "#query"
+
+
+class QueryVectorCache:
+    """
+    Process-local LRU of query embeddings keyed on (embedding model, normalized query),
+    backed by the Redis embedding cache shared across processes.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(txt):
+        return re.sub(r"\s+", " ", str(txt)).strip()
+
+    def _get_local(self, key):
+        with self._lock:
+            v = self._lru.get(key)
+            if v is not None:
+                self._lru.move_to_end(key)
+            return v
+
+    def _put_local(self, key, v):
+        with self._lock:
+            self._lru[key] = v
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.capacity:
+                self._lru.popitem(last=False)
+
+    def encode_query(self, emb_mdl, txt):
+        """Same contract as `emb_mdl.encode_queries(txt)[0]`, served from cache when possible."""
+        from graphrag.utils import get_embed_cache, set_embed_cache
+
+        mdl_name = str(getattr(emb_mdl, "llm_name", "")) + QUERY_NAMESPACE
+        qry = self.normalize(txt)
+        key = (mdl_name, qry)
+        if self.capacity <= 0 or not qry:
+            qv, _ = emb_mdl.encode_queries(txt)
+            return qv
+
+        qv = self._get_local(key)
+        if qv is not None:
+            return qv
+
+        try:
+            qv = get_embed_cache(mdl_name, qry)
+        except Exception as e:
+            logging.warning(f"QueryVectorCache: fail to read the embedding cache: {e}")
+            qv = None
+        if qv is None:
+            qv, _ = emb_mdl.encode_queries(qry)
+            qv = np.asarray(qv, dtype=np.float32)
+            if qv.ndim != 1:
+                return qv
+            try:
+                set_embed_cache(mdl_name, qry, qv)
+            except Exception as e:
+                logging.warning(f"QueryVectorCache: fail to write the embedding cache: {e}")
+        self._put_local(key, qv)
+        return qv
+
+
+QUERY_VECTOR_CACHE = QueryVectorCache(int(os.environ.get("QUERY_EMBED_CACHE_SIZE", 1024)))
@@ -18,13 +18,16 @@ import json
 import logging
 import re
 import math
-from collections import OrderedDict, defaultdict
+from collections import defaultdict
 from dataclasses import dataclass
 
 from rag.prompts.generator import relevant_chunks_with_toc
 from rag.nlp import rag_tokenizer, query
+from rag.nlp.query_vector_cache import QUERY_VECTOR_CACHE
+from rag.nlp.tag_vocabulary import TAG_VOCABULARIES, query_terms, tag_feature_scores
 import numpy as np
-from common.doc_store.doc_store_base import MatchDenseExpr, FusionExpr, OrderByExpr, DocStoreConnection
+from common.doc_store.doc_store_base import MatchDenseExpr, FusionExpr, OrderByExpr, DocStoreConnection, \
+    DOC_STORE_SLIM_SEARCH, VECTOR_SIMILARITY_FLD
 from common.string_utils import remove_redundant_spaces
 from common.float_utils import get_float
 from common.constants import PAGERANK_FLD, TAG_FLD
@@ -51,7 +54,7 @@ class Dealer:
         group_docs: list[list] | None = None
 
     async def get_vector(self, txt, emb_mdl, topk=10, similarity=0.1):
-        qv, _ = await asyncio.to_thread(emb_mdl.encode_queries, txt)
+        qv = await asyncio.to_thread(QUERY_VECTOR_CACHE.encode_query, emb_mdl, txt)
         shape = np.array(qv).shape
         if len(shape) > 1:
             raise Exception(
@@ -122,7 +125,11 @@ class Dealer:
             else:
                 matchDense = await self.get_vector(qst, emb_mdl, topk, req.get("similarity", 0.1))
                 q_vec = matchDense.embedding_data
-                if not settings.DOC_ENGINE_INFINITY:
+                if DOC_STORE_SLIM_SEARCH and settings.DOC_ENGINE.lower() == "elasticsearch":
+                    # Let the doc store score the vectors instead of returning them.
+                    matchDense.extra_options[VECTOR_SIMILARITY_FLD] = True
+                    src.append(VECTOR_SIMILARITY_FLD)
+                elif not settings.DOC_ENGINE_INFINITY:
                     src.append(f"q_{len(q_vec)}_vec")
 
                 fusionExpr = FusionExpr("weighted_sum", topk, {"weights": "0.05,0.95"})
@@ -267,7 +274,6 @@ class Dealer:
 
     def _rank_feature_scores(self, query_rfea, search_res):
         ## For rank feature(tag_fea) scores.
-        rank_fea = []
         pageranks = []
         for chunk_id in search_res.ids:
             pageranks.append(search_res.field[chunk_id].get(PAGERANK_FLD, 0))
@@ -276,49 +282,40 @@ class Dealer:
         if not query_rfea:
             return np.array([0 for _ in range(len(search_res.ids))]) + pageranks
 
-        q_denor = np.sqrt(np.sum([s * s for t, s in query_rfea.items() if t != PAGERANK_FLD]))
-        for i in search_res.ids:
-            nor, denor = 0, 0
-            if not search_res.field[i].get(TAG_FLD):
-                rank_fea.append(0)
-                continue
-            for t, sc in eval(search_res.field[i].get(TAG_FLD, "{}")).items():
-                if t in query_rfea:
-                    nor += query_rfea[t] * sc
-                denor += sc * sc
-            if denor == 0:
-                rank_fea.append(0)
-            else:
-                rank_fea.append(nor / np.sqrt(denor) / q_denor)
-        return np.array(rank_fea) * 10. + pageranks
+        query_rfea = {t: s for t, s in query_rfea.items() if t != PAGERANK_FLD}
+        rank_fea = tag_feature_scores(query_rfea, [search_res.field[i].get(TAG_FLD) for i in search_res.ids])
+        return rank_fea * 10. + pageranks
 
     def rerank(self, sres, query, tkweight=0.3,
                vtweight=0.7, cfield="content_ltks",
                rank_feature: dict | None = None
                ):
         _, keywords = self.qryr.question(query)
+        if not sres.ids:
+            return [], [], []
         vector_size = len(sres.query_vector)
         vector_column = f"q_{vector_size}_vec"
         zero_vector = [0.0] * vector_size
-        ins_embd = []
-        for chunk_id in sres.ids:
-            vector = sres.field[chunk_id].get(vector_column, zero_vector)
-            if isinstance(vector, str):
-                vector = [get_float(v) for v in vector.split("\t")]
-            ins_embd.append(vector)
-        if not ins_embd:
-            return [], [], []
+        ins_embd, vsims = [], None
+        if all(VECTOR_SIMILARITY_FLD in sres.field[chunk_id] for chunk_id in sres.ids):
+            vsims = [get_float(sres.field[chunk_id][VECTOR_SIMILARITY_FLD]) for chunk_id in sres.ids]
+        else:
+            for chunk_id in sres.ids:
+                vector = sres.field[chunk_id].get(vector_column, zero_vector)
+                if isinstance(vector, str):
+                    vector = [get_float(v) for v in vector.split("\t")]
+                ins_embd.append(vector)
 
         for i in sres.ids:
             if isinstance(sres.field[i].get("important_kwd", []), str):
                 sres.field[i]["important_kwd"] = [sres.field[i]["important_kwd"]]
+        # Token similarity only checks which query tokens a chunk contains, a token set per chunk is enough.
         ins_tw = []
         for i in sres.ids:
-            content_ltks = list(OrderedDict.fromkeys(sres.field[i][cfield].split()))
-            title_tks = [t for t in sres.field[i].get("title_tks", "").split() if t]
-            question_tks = [t for t in sres.field[i].get("question_tks", "").split() if t]
-            important_kwd = sres.field[i].get("important_kwd", [])
-            tks = content_ltks + title_tks * 2 + important_kwd * 5 + question_tks * 6
+            tks = set(sres.field[i][cfield].split())
+            tks.update(sres.field[i].get("title_tks", "").split())
+            tks.update(sres.field[i].get("question_tks", "").split())
+            tks.update(sres.field[i].get("important_kwd", []))
             ins_tw.append(tks)
 
         ## For rank feature(tag_fea) scores.
@@ -327,7 +324,7 @@ class Dealer:
         sim, tksim, vtsim = self.qryr.hybrid_similarity(sres.query_vector,
                                                         ins_embd,
                                                         keywords,
-                                                        ins_tw, tkweight, vtweight)
+                                                        ins_tw, tkweight, vtweight, sims=vsims)
 
         return sim + rank_fea, tksim, vtsim
 
@@ -403,7 +400,8 @@ class Dealer:
                            rank_feature=rank_feature)
 
         if rerank_mdl and sres.total > 0:
-            sim, tsim, vsim = self.rerank_by_model(
+            sim, tsim, vsim = await asyncio.to_thread(
+                self.rerank_by_model,
                 rerank_mdl,
                 sres,
                 question,
@@ -452,6 +450,15 @@ class Dealer:
         dim = len(sres.query_vector)
         vector_column = f"q_{dim}_vec"
         zero_vector = [0.0] * dim
+        page_ids = [sres.ids[i] for i in page_idx]
+        if DOC_STORE_SLIM_SEARCH and settings.DOC_ENGINE.lower() == "elasticsearch" and page_ids:
+            # Slim searches don't return vectors, fetch them for the returned page only.
+            idx_names = [index_name(tid) for tid in tenant_ids]
+            res = await asyncio.to_thread(self.dataStore.search, [vector_column], [], {"id": page_ids}, [], OrderByExpr(), 0,
+                                          len(page_ids), idx_names, kb_ids)
+            for id, d in self.dataStore.get_fields(res, [vector_column]).items():
+                if id in sres.field:
+                    sres.field[id][vector_column] = d[vector_column]
 
         for i in page_idx:
             id = sres.ids[i]
@@ -590,6 +597,16 @@ class Dealer:
                          key=lambda x: x[1] * -1)[:topn_tags]
         return {a.replace(".", "_"): max(1, c) for a, c in tag_fea}
 
+    def tag_query_by_vocabulary(self, question: str, tenant_ids: str | list[str], kb_ids: list[str], topn_tags=3, S=1000):
+        """`tag_query` over the precomputed vocabulary of `kb_ids`, or None if they have none."""
+        if isinstance(tenant_ids, str):
+            tenant_ids = [tenant_ids]
+        vocab = TAG_VOCABULARIES.get(self.dataStore, [index_name(tid) for tid in tenant_ids], kb_ids)
+        if vocab is None:
+            return None
+        _, keywords = self.qryr.question(question, min_match=0.0)
+        return vocab.label(query_terms(keywords), topn_tags, S)
+
     async def retrieval_by_toc(self, query: str, chunks: list[dict], tenant_ids: list[str], chat_mdl, topn: int = 6):
         if not chunks:
             return []
@@ -0,0 +1,235 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Precomputed tag vocabularies and sparse tag features.
+
+A tag vocabulary holds, for a set of tag knowledge bases, the tags with their
+document-frequency prior (the portion `Dealer.all_tags_in_portion` computes, the
+inverse of which weights tags like an IDF), the tag ids of every tag chunk and
+an inverted index from the terms of the fields the full-text query matches to
+chunks. Labelling a question with it counts the tags of the chunks sharing a term
+with the question's keywords and their synonyms. This approximates the aggregation
+search of `Dealer.tag_query` without a doc store round trip: the doc store analyzes
+fields with its own tokenizer and matches important_kwd as whole keywords, so a
+few chunks may be counted differently.
+Vocabularies are built per process for tag knowledge bases of at most
+TAG_VOCAB_MAX_ROWS chunks (0 disables them, capped below the doc store's result
+window) and rebuilt after TAG_VOCAB_TTL seconds. Knowledge bases that are too
+large or fail to load fall back to the aggregation search until then.
+
+The tag features of retrieved chunks are decoded once per distinct stored value
+into (tags, weights, norm) and scored against the query tags as a sparse dot product.
+"""
+
+import ast
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from common.doc_store.doc_store_base import OrderByExpr
+from rag.nlp import rag_tokenizer
+
+# Doc stores page at most this deep into the results (Elasticsearch's default index.max_result_window).
+MAX_RESULT_WINDOW = 10000
+TAG_VOCAB_MAX_ROWS = min(int(os.environ.get("TAG_VOCAB_MAX_ROWS", 0)), MAX_RESULT_WINDOW - 1)
+TAG_VOCAB_TTL = int(os.environ.get("TAG_VOCAB_TTL", 600))
+TAG_FEATURE_CACHE_SIZE = int(os.environ.get("TAG_FEATURE_CACHE_SIZE", 65536))
+
+# The fields `FulltextQueryer.question` matches.
+TERM_FIELDS = ["title_tks", "title_sm_tks", "important_kwd", "important_tks", "question_tks", "content_ltks",
+               "content_sm_ltks"]
+
+
+def query_terms(keywords):
+    terms = set()
+    for kwd in keywords:
+        tks = rag_tokenizer.tokenize(kwd)
+        terms.update(tks.split())
+        terms.update(rag_tokenizer.fine_grained_tokenize(tks).split())
+    return terms
+
+
+def _field_text(v):
+    if not v:
+        return ""
+    if isinstance(v, list):
+        return " ".join(str(t) for t in v)
+    return str(v)
+
+
+class TagVocabulary:
+    def __init__(self, rows):
+        """`rows` are (term string, tag list) of the tag chunks."""
+        self.tags = []
+        tag_ids = {}
+        entry_rows, entry_tags = [], []
+        postings = {}
+        for i, (txt, tags) in enumerate(rows):
+            for t in set(tags):
+                if t not in tag_ids:
+                    tag_ids[t] = len(self.tags)
+                    self.tags.append(t)
+                entry_rows.append(i)
+                entry_tags.append(tag_ids[t])
+            for tk in set(txt.split()):
+                postings.setdefault(tk, []).append(i)
+        self.n_rows = len(rows)
+        self.entry_rows = np.array(entry_rows, dtype=np.int64)
+        self.entry_tags = np.array(entry_tags, dtype=np.int64)
+        self.postings = {tk: np.array(ids, dtype=np.int64) for tk, ids in postings.items()}
+        self.counts = np.bincount(self.entry_tags, minlength=len(self.tags))
+
+    def prior(self, S=1000):
+        return (self.counts + 1) / (self.counts.sum() + S)
+
+    def tag_counts(self, terms):
+        """How many tag chunks sharing a term with `terms` carry each tag."""
+        hits = [self.postings[tk] for tk in terms if tk in self.postings]
+        if not hits:
+            return np.zeros(len(self.tags), dtype=np.int64)
+        matched = np.zeros(self.n_rows, dtype=bool)
+        matched[np.concatenate(hits)] = True
+        return np.bincount(self.entry_tags[matched[self.entry_rows]], minlength=len(self.tags))
+
+    def label(self, terms, topn_tags=3, S=1000):
+        """Approximates `Dealer.tag_query` for a question whose keywords tokenize to `terms`."""
+        counts = self.tag_counts(terms)
+        present = np.flatnonzero(counts)
+        if not len(present):
+            return {}
+        scores = np.round(0.1 * (counts[present] + 1) / (counts.sum() + S) / np.maximum(1e-6, self.prior(S)[present]))
+        # Ties are broken like the aggregation buckets `tag_query` sorts: by count, then by tag.
+        order = sorted(range(len(present)), key=lambda i: (-scores[i], -counts[present[i]], self.tags[present[i]]))[:topn_tags]
+        return {self.tags[present[i]].replace(".", "_"): max(1, int(scores[i])) for i in order}
+
+
+class TagVocabularyCache:
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        # (index names, kb ids) -> (built at, vocabulary)
+        self._vocabs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load_rows(self, dataStore, idx_nms, kb_ids):
+        fields = TERM_FIELDS + ["tag_kwd"]
+        rows = {}
+        bs = 1024
+        for p in range(0, TAG_VOCAB_MAX_ROWS + 1, bs):
+            limit = min(bs, TAG_VOCAB_MAX_ROWS + 1 - p)
+            res = dataStore.search(fields, [], {}, [], OrderByExpr(), p, limit, idx_nms, kb_ids)
+            chunks = dataStore.get_fields(res, fields)
+            for id, d in chunks.items():
+                tags = d.get("tag_kwd") or []
+                if isinstance(tags, str):
+                    tags = [t for t in tags.split("###") if t]
+                if tags:
+                    rows[id] = (" ".join(_field_text(d.get(f)) for f in TERM_FIELDS), tags)
+            if len(rows) > TAG_VOCAB_MAX_ROWS:
+                return None
+            if len(chunks) < limit:
+                return list(rows.values())
+        return None
+
+    def get(self, dataStore, idx_nms, kb_ids):
+        """The vocabulary of `kb_ids`, or None when disabled or the knowledge bases are too large or fail to load."""
+        if TAG_VOCAB_MAX_ROWS <= 0 or not kb_ids:
+            return None
+        key = (tuple(sorted(idx_nms)), tuple(sorted(kb_ids)))
+        with self._lock:
+            ent = self._vocabs.get(key)
+            if ent and time.time() - ent[0] < TAG_VOCAB_TTL:
+                self._vocabs.move_to_end(key)
+                return ent[1]
+        try:
+            rows = self._load_rows(dataStore, idx_nms, kb_ids)
+        except Exception as e:
+            logging.warning(f"TagVocabularyCache: fail to load the tag chunks of {kb_ids}: {e}")
+            rows = None
+        vocab = TagVocabulary(rows) if rows is not None else None
+        with self._lock:
+            self._vocabs[key] = (time.time(), vocab)
+            self._vocabs.move_to_end(key)
+            while len(self._vocabs) > self.capacity:
+                self._vocabs.popitem(last=False)
+        return vocab
+
+
+TAG_VOCABULARIES = TagVocabularyCache()
+
+_features = OrderedDict()
+_features_lock = threading.Lock()
+
+
+def decode_tag_features(v):
+    """(tags, weights, L2 norm) of a stored tag feature map, which doc stores return as a dict or its repr/JSON."""
+    if not v:
+        return None
+    key = v if isinstance(v, str) else None
+    if key is not None:
+        with _features_lock:
+            fea = _features.get(key)
+            if fea is not None:
+                _features.move_to_end(key)
+                return fea
+        try:
+            v = json.loads(v)
+        except ValueError:
+            try:
+                v = ast.literal_eval(v)
+            except (ValueError, SyntaxError):
+                return None
+    if not isinstance(v, dict):
+        return None
+    weights = np.array([float(w) for w in v.values()], dtype=np.float64)
+    fea = (list(v.keys()), weights, float(np.sqrt(np.dot(weights, weights))))
+    if key is not None and TAG_FEATURE_CACHE_SIZE > 0:
+        with _features_lock:
+            _features[key] = fea
+            while len(_features) > TAG_FEATURE_CACHE_SIZE:
+                _features.popitem(last=False)
+    return fea
+
+
+def tag_feature_scores(query_rfea, values):
+    """Cosine similarity between the query tags and the stored tag features `values` of every chunk."""
+    scores = np.zeros(len(values), dtype=np.float64)
+    q_tags = {t: i for i, t in enumerate(query_rfea)}
+    q_weights = np.array([float(query_rfea[t]) for t in q_tags], dtype=np.float64)
+    q_norm = np.sqrt(np.dot(q_weights, q_weights))
+    if not q_tags or q_norm == 0:
+        return scores
+
+    rows, ids, weights = [], [], []
+    norms = np.ones(len(values), dtype=np.float64)
+    for i, v in enumerate(values):
+        fea = decode_tag_features(v)
+        if not fea or fea[2] == 0:
+            continue
+        norms[i] = fea[2]
+        for t, w in zip(fea[0], fea[1]):
+            if t in q_tags:
+                rows.append(i)
+                ids.append(q_tags[t])
+                weights.append(w)
+    if rows:
+        dots = np.bincount(np.array(rows), weights=q_weights[np.array(ids)] * np.array(weights), minlength=len(values))
+        scores = dots / norms / q_norm
+    return scores
@@ -0,0 +1,122 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+
+import numpy as np
+
+MAGIC = b"RFTT"
+HEADER = struct.Struct("<4sIII")
+
+
+class TermTable(Mapping):
+    """
+    Read-only term dictionary compiled into a file and memory-mapped, so that every worker
+    shares the same pages instead of holding its own Python dict.
+
+    Layout: header | labels (json) | key offsets (uint32, n + 1) | values (int64, n) | sorted utf-8 keys.
+    Integer values are stored as is; string values are stored as an index into the labels.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._n, labels_len, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a term table")
+        pos = HEADER.size
+        self._labels = json.loads(self._mm[pos:pos + labels_len]) if labels_len else None
+        pos += labels_len
+        self._offsets = np.frombuffer(self._mm, dtype="<u4", count=self._n + 1, offset=pos)
+        pos += 4 * (self._n + 1)
+        self._values = np.frombuffer(self._mm, dtype="<i8", count=self._n, offset=pos)
+        self._keys = pos + 8 * self._n
+
+    @staticmethod
+    def compile(d, path):
+        keys = sorted(k.encode("utf-8") for k in d)
+        labels = None
+        if any(isinstance(v, str) for v in d.values()):
+            labels = sorted(set(d.values()))
+        label_ids = {v: i for i, v in enumerate(labels or [])}
+        values = [d[k.decode("utf-8")] for k in keys]
+        values = np.array([label_ids[v] for v in values] if labels else values, dtype="<i8")
+        offsets = np.zeros(len(keys) + 1, dtype="<u4")
+        offsets[1:] = np.cumsum([len(k) for k in keys])
+        labels_bin = json.dumps(labels).encode("utf-8") if labels else b""
+        blob = b"".join(keys)
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(keys), len(labels_bin), len(blob)))
+            f.write(labels_bin)
+            f.write(offsets.tobytes())
+            f.write(values.tobytes())
+            f.write(blob)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, src, loader):
+        """
+        Term table compiled from `src` with `loader(src) -> dict`, next to it. The table is rebuilt
+        when `src` is newer. Falls back to the loaded dict if the table can't be written or read.
+        """
+        path = src + ".tbl"
+        try:
+            if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(src):
+                cls.compile(loader(src), path)
+            return cls(path)
+        except Exception as e:
+            logging.warning(f"Fail to use the compiled term table {path}: {e}")
+            return loader(src)
+
+    def _find(self, key):
+        k = key.encode("utf-8")
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            s, e = int(self._offsets[mid]), int(self._offsets[mid + 1])
+            cur = self._mm[self._keys + s:self._keys + e]
+            if cur == k:
+                return mid
+            if cur < k:
+                lo = mid + 1
+            else:
+                hi = mid
+        return -1
+
+    def __getitem__(self, key):
+        i = self._find(key) if isinstance(key, str) else -1
+        if i < 0:
+            raise KeyError(key)
+        v = int(self._values[i])
+        return self._labels[v] if self._labels else v
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self._find(key) >= 0
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        for i in range(self._n):
+            s, e = int(self._offsets[i]), int(self._offsets[i + 1])
+            yield self._mm[self._keys + s:self._keys + e].decode("utf-8")
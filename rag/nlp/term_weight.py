@@ -20,9 +20,31 @@ import json
 import re
 import os
 import numpy as np
+from functools import lru_cache
 from rag.nlp import rag_tokenizer
+from rag.nlp.term_table import TermTable
 from common.file_utils import get_project_base_directory
 
+TERM_WEIGHT_CACHE_SIZE = int(os.environ.get("TERM_WEIGHT_CACHE_SIZE", 100000))
+
+NUM_PATTERN = re.compile(r"[0-9,.]{2,}$")
+SHORT_LETTER_PATTERN = re.compile(r"[a-z]{1,2}$")
+NUM_SPACE_PATTERN = re.compile(r"[0-9. -]{2,}$")
+LETTER_PATTERN = re.compile(r"[a-z. -]+$")
+NER_WEIGHTS = {"toxic": 2, "func": 1, "corp": 3, "loca": 3, "sch": 3, "stock": 3, "firstnm": 1}
+
+
+def load_dict(fnm):
+    res = {}
+    with open(fnm, "r") as f:
+        for line in f:
+            arr = line.replace("\n", "").split("\t")
+            if len(arr) < 2:
+                res[arr[0]] = 0
+            else:
+                res[arr[0]] = int(arr[1])
+    return res
+
 
 class Dealer:
     def __init__(self):
@@ -58,37 +80,21 @@ class Dealer:
                                "啥",
                                "相关"])
 
-        def load_dict(fnm):
-            res = {}
-            f = open(fnm, "r")
-            while True:
-                line = f.readline()
-                if not line:
-                    break
-                arr = line.replace("\n", "").split("\t")
-                if len(arr) < 2:
-                    res[arr[0]] = 0
-                else:
-                    res[arr[0]] = int(arr[1])
-
-            c = 0
-            for _, v in res.items():
-                c += v
-            if c == 0:
-                return set(res.keys())
-            return res
-
         fnm = os.path.join(get_project_base_directory(), "rag/res")
         self.ne, self.df = {}, {}
         try:
-            self.ne = json.load(open(os.path.join(fnm, "ner.json"), "r"))
+            self.ne = TermTable.load(os.path.join(fnm, "ner.json"), lambda f: json.load(open(f, "r")))
         except Exception:
             logging.warning("Load ner.json FAIL!")
         try:
-            self.df = load_dict(os.path.join(fnm, "term.freq"))
+            self.df = TermTable.load(os.path.join(fnm, "term.freq"), load_dict)
         except Exception:
             logging.warning("Load term.freq FAIL!")
 
+        # Weights of a token only depend on the token, memoize them per process.
+        self._term_weight = lru_cache(maxsize=TERM_WEIGHT_CACHE_SIZE)(self._term_weight_uncached)
+        self._merged_terms = lru_cache(maxsize=TERM_WEIGHT_CACHE_SIZE)(self._merged_terms_uncached)
+
     def pretoken(self, txt, num=False, stpwd=True):
         patt = [
             r"[~—\t @#%!<>,\.\?\":;'\{\}\[\]_=\(\)\|，。？》•●○↓《；‘’：“”【¥ 】…￥！、·（）×`&\\/「」\\]"
@@ -160,87 +166,74 @@ class Dealer:
                 tks.append(t)
         return tks
 
-    def weights(self, tks, preprocess=True):
-        num_pattern = re.compile(r"[0-9,.]{2,}$")
-        short_letter_pattern = re.compile(r"[a-z]{1,2}$")
-        num_space_pattern = re.compile(r"[0-9. -]{2,}$")
-        letter_pattern = re.compile(r"[a-z. -]+$")
-
-        def ner(t):
-            if num_pattern.match(t):
-                return 2
-            if short_letter_pattern.match(t):
-                return 0.01
-            if not self.ne or t not in self.ne:
-                return 1
-            m = {"toxic": 2, "func": 1, "corp": 3, "loca": 3, "sch": 3, "stock": 3,
-                 "firstnm": 1}
-            return m[self.ne[t]]
-
-        def postag(t):
-            t = rag_tokenizer.tag(t)
-            if t in set(["r", "c", "d"]):
-                return 0.3
-            if t in set(["ns", "nt"]):
-                return 3
-            if t in set(["n"]):
-                return 2
-            if re.match(r"[0-9-]+", t):
-                return 2
+    def _ner_weight(self, t):
+        if NUM_PATTERN.match(t):
+            return 2
+        if SHORT_LETTER_PATTERN.match(t):
+            return 0.01
+        if not self.ne or t not in self.ne:
             return 1
-
-        def freq(t):
-            if num_space_pattern.match(t):
-                return 3
-            s = rag_tokenizer.freq(t)
-            if not s and letter_pattern.match(t):
-                return 300
-            if not s:
+        return NER_WEIGHTS[self.ne[t]]
+
+    @staticmethod
+    def _postag_weight(t):
+        t = rag_tokenizer.tag(t)
+        if t in set(["r", "c", "d"]):
+            return 0.3
+        if t in set(["ns", "nt"]):
+            return 3
+        if t in set(["n"]):
+            return 2
+        if re.match(r"[0-9-]+", t):
+            return 2
+        return 1
+
+    def _freq(self, t):
+        if NUM_SPACE_PATTERN.match(t):
+            return 3
+        s = rag_tokenizer.freq(t)
+        if not s and LETTER_PATTERN.match(t):
+            return 300
+        if not s:
+            s = 0
+
+        if not s and len(t) >= 4:
+            s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
+            if len(s) > 1:
+                s = np.min([self._freq(tt) for tt in s]) / 6.
+            else:
                 s = 0
 
-            if not s and len(t) >= 4:
-                s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
-                if len(s) > 1:
-                    s = np.min([freq(tt) for tt in s]) / 6.
-                else:
-                    s = 0
-
-            return max(s, 10)
-
-        def df(t):
-            if num_space_pattern.match(t):
-                return 5
-            if t in self.df:
-                return self.df[t] + 3
-            elif letter_pattern.match(t):
-                return 300
-            elif len(t) >= 4:
-                s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
-                if len(s) > 1:
-                    return max(3, np.min([df(tt) for tt in s]) / 6.)
+        return max(s, 10)
 
-            return 3
+    def _df(self, t):
+        if NUM_SPACE_PATTERN.match(t):
+            return 5
+        if t in self.df:
+            return self.df[t] + 3
+        elif LETTER_PATTERN.match(t):
+            return 300
+        elif len(t) >= 4:
+            s = [tt for tt in rag_tokenizer.fine_grained_tokenize(t).split() if len(tt) > 1]
+            if len(s) > 1:
+                return max(3, np.min([self._df(tt) for tt in s]) / 6.)
+
+        return 3
+
+    @staticmethod
+    def _idf(s, N):
+        return math.log10(10 + ((N - s + 0.5) / (s + 0.5)))
 
-        def idf(s, N):
-            return math.log10(10 + ((N - s + 0.5) / (s + 0.5)))
-
-        tw = []
-        if not preprocess:
-            idf1 = np.array([idf(freq(t), 10000000) for t in tks])
-            idf2 = np.array([idf(df(t), 1000000000) for t in tks])
-            wts = (0.3 * idf1 + 0.7 * idf2) * \
-                  np.array([ner(t) * postag(t) for t in tks])
-            wts = [s for s in wts]
-            tw = list(zip(tks, wts))
-        else:
-            for tk in tks:
-                tt = self.token_merge(self.pretoken(tk, True))
-                idf1 = np.array([idf(freq(t), 10000000) for t in tt])
-                idf2 = np.array([idf(df(t), 1000000000) for t in tt])
-                wts = (0.3 * idf1 + 0.7 * idf2) * \
-                      np.array([ner(t) * postag(t) for t in tt])
-                wts = [s for s in wts]
-                tw.extend(zip(tt, wts))
+    def _term_weight_uncached(self, t):
+        return (0.3 * self._idf(self._freq(t), 10000000) + 0.7 * self._idf(self._df(t), 1000000000)) * \
+            (self._ner_weight(t) * self._postag_weight(t))
 
+    def _merged_terms_uncached(self, tk):
+        return tuple(self.token_merge(self.pretoken(tk, True)))
+
+    def weights(self, tks, preprocess=True):
+        if preprocess:
+            tks = [t for tk in tks for t in self._merged_terms(tk)]
+        tw = [(t, self._term_weight(t)) for t in tks]
         S = np.sum([s for _, s in tw])
         return [(t, s / S) for t, s in tw]
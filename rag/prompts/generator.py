@@ -254,10 +254,10 @@ async def cross_languages(tenant_id, llm_id, query, languages=[]):
     from api.db.services.llm_service import LLMBundle
     from api.db.services.tenant_llm_service import TenantLLMService
 
-    if llm_id and TenantLLMService.llm_id2llm_type(llm_id) == "image2text":
-        chat_mdl = LLMBundle(tenant_id, LLMType.IMAGE2TEXT, llm_id)
+    if llm_id and await asyncio.to_thread(TenantLLMService.llm_id2llm_type, llm_id) == "image2text":
+        chat_mdl = await asyncio.to_thread(LLMBundle, tenant_id, LLMType.IMAGE2TEXT, llm_id)
     else:
-        chat_mdl = LLMBundle(tenant_id, LLMType.CHAT, llm_id)
+        chat_mdl = await asyncio.to_thread(LLMBundle, tenant_id, LLMType.CHAT, llm_id)
 
     rendered_sys_prompt = PROMPT_JINJA_ENV.from_string(CROSS_LANGUAGES_SYS_PROMPT_TEMPLATE).render()
     rendered_user_prompt = PROMPT_JINJA_ENV.from_string(CROSS_LANGUAGES_USER_PROMPT_TEMPLATE).render(query=query,
@@ -15,25 +15,42 @@
 #
 import asyncio
 import logging
+import os
 import re
+import time
 
 import numpy as np
 import umap
+import xxhash
 from sklearn.mixture import GaussianMixture
 
 from api.db.services.task_service import has_canceled
 from common.connection_utils import timeout
 from common.exceptions import TaskCanceledException
 from common.token_utils import truncate
+from rag.raptor_cluster import RAPTOR_KMEANS_MIN_CHUNKS, normalize, optimal_n_clusters, spherical_kmeans
 from graphrag.utils import (
     chat_limiter,
     get_embed_cache,
+    get_embed_cache_batch,
     get_llm_cache,
     set_embed_cache,
+    set_embed_cache_batch,
     set_llm_cache,
 )
 
 
+# Incremental runs re-summarize a cluster once its membership changed by more than RAPTOR_RESUMMARIZE_RATIO,
+# and rebuild the whole tree when more than RAPTOR_INCREMENTAL_MAX_CHANGE of the leaves changed since its last
+# full build.
+RAPTOR_RESUMMARIZE_RATIO = float(os.environ.get("RAPTOR_RESUMMARIZE_RATIO", 0.2))
+RAPTOR_INCREMENTAL_MAX_CHANGE = float(os.environ.get("RAPTOR_INCREMENTAL_MAX_CHANGE", 0.5))
+
+
+def chunk_key(content):
+    return xxhash.xxh64(content.encode("utf-8")).hexdigest()
+
+
 class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
     def __init__(
         self,
@@ -53,6 +70,9 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
         self._max_token = max_token
         self._max_errors = max(1, max_errors)
         self._error_count = 0
+        self.tree = []
+        # Keys of the leaves of the last full build the tree descends from.
+        self.base = []
 
     @timeout(60 * 20)
     async def _chat(self, system, history, gen_conf):
@@ -89,28 +109,87 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
         await asyncio.to_thread(set_embed_cache, self._embd_model.llm_name, txt, embds)
         return embds
 
-    def _get_optimal_clusters(self, embeddings: np.ndarray, random_state: int, task_id: str = ""):
+    @timeout(60)
+    async def _embedding_encode_batch(self, txts):
+        embds = await asyncio.to_thread(get_embed_cache_batch, self._embd_model.llm_name, txts)
+        missing = [i for i, e in enumerate(embds) if e is None]
+        if missing:
+            vts, _ = await asyncio.to_thread(self._embd_model.encode, [txts[i] for i in missing])
+            if len(vts) != len(missing):
+                raise Exception("Embedding error: ")
+            for i, v in zip(missing, vts):
+                embds[i] = v
+            await asyncio.to_thread(set_embed_cache_batch, self._embd_model.llm_name, [txts[i] for i in missing], vts)
+        return embds
+
+    def _get_optimal_clusters(self, embeddings: np.ndarray, random_state: int, task_id: str = "", method: str = "gmm"):
+        def check_cancel():
+            if task_id and has_canceled(task_id):
+                logging.info(f"Task {task_id} cancelled during get optimal clusters.")
+                raise TaskCanceledException(f"Task {task_id} was cancelled")
+
         max_clusters = min(self._max_cluster, len(embeddings))
-        n_clusters = np.arange(1, max_clusters)
-        bics = []
-        for n in n_clusters:
-            if task_id:
-                if has_canceled(task_id):
-                    logging.info(f"Task {task_id} cancelled during get optimal clusters.")
-                    raise TaskCanceledException(f"Task {task_id} was cancelled")
+        return optimal_n_clusters(embeddings, max_clusters, random_state, method=method, check_cancel=check_cancel)
 
-            gm = GaussianMixture(n_components=n, random_state=random_state)
-            gm.fit(embeddings)
-            bics.append(gm.bic(embeddings))
-        optimal_clusters = n_clusters[np.argmin(bics)]
-        return optimal_clusters
+    def _cluster(self, embeddings, random_state, task_id: str = ""):
+        """Labels of a layer: a Gaussian mixture over its UMAP reduction, or spherical k-means for large layers."""
+        if RAPTOR_KMEANS_MIN_CHUNKS and len(embeddings) >= RAPTOR_KMEANS_MIN_CHUNKS:
+            normalized = normalize(embeddings)
+            n_clusters = self._get_optimal_clusters(normalized, random_state, task_id=task_id, method="kmeans")
+            if n_clusters == 1:
+                return [0 for _ in range(len(normalized))]
+            lbls = spherical_kmeans(normalized, n_clusters, random_state).labels_
+            # Mini-batch k-means may leave a center without members.
+            ids = {c: i for i, c in enumerate(sorted(set(lbls)))}
+            return [ids[c] for c in lbls]
+
+        n_neighbors = int((len(embeddings) - 1) ** 0.8)
+        reduced_embeddings = umap.UMAP(
+            n_neighbors=max(2, n_neighbors),
+            n_components=min(12, len(embeddings) - 2),
+            metric="cosine",
+        ).fit_transform(embeddings)
+        n_clusters = self._get_optimal_clusters(reduced_embeddings, random_state, task_id=task_id)
+        if n_clusters == 1:
+            return [0 for _ in range(len(reduced_embeddings))]
+        gm = GaussianMixture(n_components=n_clusters, random_state=random_state)
+        gm.fit(reduced_embeddings)
+        probs = gm.predict_proba(reduced_embeddings)
+        lbls = [np.where(prob > self._threshold)[0] for prob in probs]
+        return [lbl[0] if isinstance(lbl, np.ndarray) else lbl for lbl in lbls]
+
+    def tree_state(self, chunks):
+        """
+        The tree built by the last call over its returned `chunks`, to be passed back as `tree` later:
+        per layer, the clusters with the keys of their members, their centroid and their summary, and
+        the keys of the leaves of the last full build as `base`.
+        """
+        layers = []
+        for clusters in self.tree:
+            layers.append([
+                {
+                    "members": [chunk_key(chunks[i][0]) for i in ck_idx],
+                    "centroid": np.round(normalize([chunks[i][1] for i in ck_idx]).mean(axis=0), 6).tolist(),
+                    "summary": chunks[sm_idx][0],
+                }
+                for ck_idx, sm_idx in clusters
+            ])
+        return {"dim": len(chunks[0][1]) if chunks else 0, "base": self.base, "layers": layers}
 
-    async def __call__(self, chunks, random_state, callback=None, task_id: str = ""):
+    async def __call__(self, chunks, random_state, callback=None, task_id: str = "", tree=None):
+        """
+        Appends the summaries of the tree built over `chunks` to them. With the `tree` of a previous run, chunks
+        missing from it join the cluster of the closest centroid and only clusters that changed are re-summarized,
+        until the leaves drifted too far from the last full build and the tree is built again.
+        """
         if len(chunks) <= 1:
             return []
         chunks = [(s, a) for s, a in chunks if s and a is not None and len(a) > 0]
         layers = [(0, len(chunks))]
         start, end = 0, len(chunks)
+        # Per layer, (member indexes, summary index) of every cluster.
+        self.tree = []
+        self.base = sorted({chunk_key(s) for s, _ in chunks})
 
         @timeout(60 * 20)
         async def summarize(ck_idx: list[int]):
@@ -146,23 +225,108 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                         cnt,
                     )
                     logging.debug(f"SUM: {cnt}")
+                    return cnt
+            except TaskCanceledException:
+                raise
+            except Exception as exc:
+                on_error(len(ck_idx), exc)
 
-                    if task_id and has_canceled(task_id):
-                        logging.info(f"Task {task_id} cancelled before RAPTOR embedding.")
-                        raise TaskCanceledException(f"Task {task_id} was cancelled")
+        def on_error(cluster_size, exc):
+            self._error_count += 1
+            warn_msg = f"[RAPTOR] Skip cluster ({cluster_size} chunks) due to error: {exc}"
+            logging.warning(warn_msg)
+            if callback:
+                callback(msg=warn_msg)
+            if self._error_count >= self._max_errors:
+                raise RuntimeError(f"RAPTOR aborted after {self._error_count} errors. Last error: {exc}") from exc
 
-                    embds = await self._embedding_encode(cnt)
-                    chunks.append((cnt, embds))
+        async def embed_summaries(clusters, summaries):
+            """Summaries of a layer are embedded together: one cache round trip and one encode call for the misses."""
+            if task_id and has_canceled(task_id):
+                logging.info(f"Task {task_id} cancelled before RAPTOR embedding.")
+                raise TaskCanceledException(f"Task {task_id} was cancelled")
+            done = [(ck_idx, cnt) for ck_idx, cnt in zip(clusters, summaries) if cnt]
+            if not done:
+                return
+            try:
+                embds = await self._embedding_encode_batch([cnt for _, cnt in done])
             except TaskCanceledException:
                 raise
-            except Exception as exc:
-                self._error_count += 1
-                warn_msg = f"[RAPTOR] Skip cluster ({len(ck_idx)} chunks) due to error: {exc}"
-                logging.warning(warn_msg)
-                if callback:
-                    callback(msg=warn_msg)
-                if self._error_count >= self._max_errors:
-                    raise RuntimeError(f"RAPTOR aborted after {self._error_count} errors. Last error: {exc}") from exc
+            except Exception:
+                embds = [None] * len(done)
+                for i, (ck_idx, cnt) in enumerate(done):
+                    try:
+                        embds[i] = await self._embedding_encode(cnt)
+                    except TaskCanceledException:
+                        raise
+                    except Exception as exc:
+                        on_error(len(ck_idx), exc)
+            for (_, cnt), embd in zip(done, embds):
+                if embd is not None:
+                    chunks.append((cnt, embd))
+
+        def changed_leaves(saved):
+            # Measured against the last full build, so that small updates add up to a rebuild.
+            base = set(saved.get("base") or [k for c in saved["layers"][0] for k in c["members"]])
+            return len(set(self.base) ^ base) / max(1, len(base)), sorted(base)
+
+        async def update_layer(saved_layer):
+            nonlocal start, end
+            keys = {chunk_key(chunks[i][0]): i for i in range(start, end)}
+            members = [[keys[k] for k in c["members"] if k in keys] for c in saved_layer]
+            assigned = {i for ck_idx in members for i in ck_idx}
+            new = [i for i in range(start, end) if i not in assigned]
+            if new:
+                centroids = normalize([c["centroid"] for c in saved_layer])
+                sims = normalize([chunks[i][1] for i in new]) @ centroids.T
+                for i, c in zip(new, np.argmax(sims, axis=1)):
+                    members[c].append(i)
+
+            clusters, summaries, tasks = [], [], {}
+            for c, ck_idx in zip(saved_layer, members):
+                if not ck_idx:
+                    continue
+                ck_idx = sorted(ck_idx)
+                old = set(c["members"])
+                diff = len(old ^ {chunk_key(chunks[i][0]) for i in ck_idx}) / max(1, len(old))
+                if diff > RAPTOR_RESUMMARIZE_RATIO or not c.get("summary"):
+                    tasks[len(clusters)] = asyncio.create_task(summarize(ck_idx))
+                clusters.append(ck_idx)
+                summaries.append(c.get("summary"))
+            try:
+                for j, cnt in zip(tasks.keys(), await asyncio.gather(*tasks.values())):
+                    summaries[j] = cnt
+            except Exception:
+                for t in tasks.values():
+                    t.cancel()
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+                raise
+            await embed_summaries(clusters, summaries)
+
+            assert len(chunks) - end == len(clusters), "{} vs. {}".format(len(chunks) - end, len(clusters))
+            self.tree.append(list(zip(clusters, range(end, len(chunks)))))
+            layers.append((end, len(chunks)))
+            msg = "Update layer {}: {} -> {} ({} new, {} re-summarized)".format(
+                len(layers) - 1, end - start, len(chunks) - end, len(new), len(tasks))
+            logging.info(f"RAPTOR {msg}")
+            if callback:
+                callback(msg=msg)
+            start = end
+            end = len(chunks)
+
+        if tree and tree.get("layers") and tree.get("dim") == len(chunks[0][1]):
+            ratio, base = changed_leaves(tree)
+            if ratio <= RAPTOR_INCREMENTAL_MAX_CHANGE:
+                self.base = base
+                for saved_layer in tree["layers"]:
+                    if end - start <= 1 or not saved_layer:
+                        break
+                    if task_id and has_canceled(task_id):
+                        logging.info(f"Task {task_id} cancelled during RAPTOR layer update.")
+                        raise TaskCanceledException(f"Task {task_id} was cancelled")
+                    await update_layer(saved_layer)
+            else:
+                logging.info(f"RAPTOR rebuilds the tree: {ratio:.0%} of the chunks changed.")
 
         labels = []
         while end - start > 1:
@@ -173,7 +337,9 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
 
             embeddings = [embd for _, embd in chunks[start:end]]
             if len(embeddings) == 2:
-                await summarize([start, start + 1])
+                await embed_summaries([[start, start + 1]], [await summarize([start, start + 1])])
+                if len(chunks) > end:
+                    self.tree.append([([start, start + 1], end)])
                 if callback:
                     callback(msg="Cluster one layer: {} -> {}".format(end - start, len(chunks) - end))
                 labels.extend([0, 0])
@@ -182,44 +348,41 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                 end = len(chunks)
                 continue
 
-            n_neighbors = int((len(embeddings) - 1) ** 0.8)
-            reduced_embeddings = umap.UMAP(
-                n_neighbors=max(2, n_neighbors),
-                n_components=min(12, len(embeddings) - 2),
-                metric="cosine",
-            ).fit_transform(embeddings)
-            n_clusters = self._get_optimal_clusters(reduced_embeddings, random_state, task_id=task_id)
-            if n_clusters == 1:
-                lbls = [0 for _ in range(len(reduced_embeddings))]
-            else:
-                gm = GaussianMixture(n_components=n_clusters, random_state=random_state)
-                gm.fit(reduced_embeddings)
-                probs = gm.predict_proba(reduced_embeddings)
-                lbls = [np.where(prob > self._threshold)[0] for prob in probs]
-                lbls = [lbl[0] if isinstance(lbl, np.ndarray) else lbl for lbl in lbls]
+            st = time.perf_counter()
+            lbls = await asyncio.to_thread(self._cluster, embeddings, random_state, task_id)
+            n_clusters = max(lbls) + 1
+            cluster_cost = time.perf_counter() - st
 
             tasks = []
+            clusters = []
             for c in range(n_clusters):
                 ck_idx = [i + start for i in range(len(lbls)) if lbls[i] == c]
                 assert len(ck_idx) > 0
                 if task_id and has_canceled(task_id):
                     logging.info(f"Task {task_id} cancelled before RAPTOR cluster processing.")
                     raise TaskCanceledException(f"Task {task_id} was cancelled")
+                clusters.append(ck_idx)
                 tasks.append(asyncio.create_task(summarize(ck_idx)))
             try:
-                await asyncio.gather(*tasks, return_exceptions=False)
+                summaries = await asyncio.gather(*tasks, return_exceptions=False)
             except Exception as e:
                 logging.error(f"Error in RAPTOR cluster processing: {e}")
                 for t in tasks:
                     t.cancel()
                 await asyncio.gather(*tasks, return_exceptions=True)
                 raise
+            await embed_summaries(clusters, summaries)
+            summary_cost = time.perf_counter() - st - cluster_cost
 
             assert len(chunks) - end == n_clusters, "{} vs. {}".format(len(chunks) - end, n_clusters)
+            self.tree.append(list(zip(clusters, range(end, len(chunks)))))
             labels.extend(lbls)
             layers.append((end, len(chunks)))
+            msg = "Cluster layer {}: {} -> {} (clustering {:.2f}s, summarizing {:.2f}s)".format(
+                len(layers) - 1, end - start, len(chunks) - end, cluster_cost, summary_cost)
+            logging.info(f"RAPTOR {msg}")
             if callback:
-                callback(msg="Cluster one layer: {} -> {}".format(end - start, len(chunks) - end))
+                callback(msg=msg)
             start = end
             end = len(chunks)
 
@@ -0,0 +1,182 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Cluster-count search for RAPTOR layers.
+
+The number of clusters of a layer is the candidate n in [1, max_clusters) with the
+lowest BIC. With RAPTOR_CLUSTER_SEARCH=exhaustive every candidate is fitted, as
+RAPTOR always did. With RAPTOR_CLUSTER_SEARCH=coarse a grid of step ~sqrt(max_clusters)
+is fitted first, stopping once RAPTOR_CLUSTER_PATIENCE grid points in a row fail to
+improve the best BIC. Then the neighbourhood of the best grid point is fitted.
+Either way, candidates are fitted by RAPTOR_CLUSTER_WORKERS processes. The worker
+pool is started once per process with forkserver (spawn where unavailable), never
+by forking the threaded task executor, and the embeddings of a layer are written
+once to a memory-mapped file the workers share instead of being pickled per fit.
+
+Layers of at least RAPTOR_KMEANS_MIN_CHUNKS chunks (0 disables it) skip UMAP and the
+Gaussian mixture. They are clustered with mini-batch k-means on L2-normalized
+embeddings (spherical k-means), scored with the BIC of a spherical Gaussian model.
+"""
+
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.mixture import GaussianMixture
+
+RAPTOR_CLUSTER_SEARCH = os.environ.get("RAPTOR_CLUSTER_SEARCH", "exhaustive")
+RAPTOR_CLUSTER_WORKERS = int(os.environ.get("RAPTOR_CLUSTER_WORKERS", 1))
+RAPTOR_CLUSTER_PATIENCE = int(os.environ.get("RAPTOR_CLUSTER_PATIENCE", 3))
+RAPTOR_KMEANS_MIN_CHUNKS = int(os.environ.get("RAPTOR_KMEANS_MIN_CHUNKS", 0))
+
+_executors = {}
+_executors_lock = threading.Lock()
+# Embeddings a worker process has mapped, by file path.
+_mapped = {}
+
+
+def normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(embeddings, n, random_state):
+    km = MiniBatchKMeans(n_clusters=n, random_state=random_state, batch_size=1024, n_init=3)
+    km.fit(embeddings)
+    return km
+
+
+def kmeans_bic(embeddings, km):
+    """BIC of the spherical Gaussian model with the k-means centers and a shared variance."""
+    n, d = embeddings.shape
+    variance = max(km.inertia_ / (n * d), 1e-12)
+    return n * d * math.log(variance) + km.n_clusters * (d + 1) * math.log(n)
+
+
+def _get_executor(workers):
+    """The process pool of `workers` workers, started on first use and shared by later searches."""
+    with _executors_lock:
+        if workers not in _executors:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executors[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        return _executors[workers]
+
+
+def _discard_executor(workers, executor):
+    with _executors_lock:
+        if _executors.get(workers) is executor:
+            del _executors[workers]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _map_embeddings(path):
+    if path not in _mapped:
+        _mapped.clear()
+        _mapped[path] = np.load(path, mmap_mode="r")
+    return _mapped[path]
+
+
+def _bic(job):
+    method, embeddings, n, random_state = job
+    if isinstance(embeddings, str):
+        embeddings = _map_embeddings(embeddings)
+    if method == "kmeans":
+        return kmeans_bic(embeddings, spherical_kmeans(embeddings, n, random_state))
+    gm = GaussianMixture(n_components=n, random_state=random_state)
+    gm.fit(embeddings)
+    return gm.bic(embeddings)
+
+
+def optimal_n_clusters(embeddings, max_clusters, random_state, method="gmm", search=None, workers=None, check_cancel=None):
+    """
+    The n in [1, max_clusters) with the lowest BIC, the smallest on ties.
+    `method` is "gmm" or "kmeans"; `check_cancel()` is called between rounds of fits.
+    """
+    search = search or RAPTOR_CLUSTER_SEARCH
+    workers = RAPTOR_CLUSTER_WORKERS if workers is None else workers
+    if max_clusters <= 2:
+        return 1
+
+    bics = {}
+    executor = None
+    shared_path = None
+    if workers > 1:
+        try:
+            executor = _get_executor(workers)
+            fd, shared_path = tempfile.mkstemp(suffix=".npy", prefix="raptor_")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.asarray(embeddings))
+        except Exception as e:
+            logging.warning(f"RAPTOR cluster search falls back to a single process: {e}")
+            executor = None
+
+    def fit(ns):
+        nonlocal executor
+        ns = [n for n in ns if n not in bics]
+        if not ns:
+            return
+        if check_cancel:
+            check_cancel()
+        if executor:
+            try:
+                bics.update(zip(ns, executor.map(_bic, [(method, shared_path, n, random_state) for n in ns])))
+                return
+            except BrokenProcessPool as e:
+                logging.warning(f"RAPTOR cluster search falls back to a single process: {e}")
+                _discard_executor(workers, executor)
+                executor = None
+        bics.update(zip(ns, [_bic((method, embeddings, n, random_state)) for n in ns]))
+
+    def best():
+        return min(bics, key=lambda n: (bics[n], n))
+
+    try:
+        if search != "coarse":
+            for i in range(1, max_clusters, max(1, workers)):
+                fit(range(i, min(i + max(1, workers), max_clusters)))
+            return best()
+
+        step = max(1, int(math.sqrt(max_clusters)))
+        grid = list(range(1, max_clusters, step))
+        misses = 0
+        for i in range(0, len(grid), max(1, workers)):
+            round_ns = grid[i: i + max(1, workers)]
+            before = best() if bics else None
+            fit(round_ns)
+            for n in round_ns:
+                if before is None or bics[n] < bics[before]:
+                    before, misses = n, 0
+                else:
+                    misses += 1
+            if misses >= RAPTOR_CLUSTER_PATIENCE:
+                break
+        center = best()
+        fit(range(max(1, center - step + 1), min(max_clusters, center + step)))
+        return best()
+    finally:
+        if shared_path:
+            try:
+                os.remove(shared_path)
+            except OSError:
+                pass
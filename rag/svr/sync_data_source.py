@@ -23,6 +23,7 @@ import time
 start_ts = time.time()
 
 import asyncio
+import concurrent.futures
 import copy
 import faulthandler
 import logging
@@ -34,10 +35,11 @@ import traceback
 from datetime import datetime, timezone
 from typing import Any
 
+import xxhash
 from flask import json
 
 from api.utils.common import hash128
-from api.db.services.connector_service import ConnectorService, SyncLogsService
+from api.db.services.connector_service import ConnectorFingerprints, ConnectorService, SyncLogsService
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from common import settings
 from common.config_utils import show_configs
@@ -71,6 +73,12 @@ from common.versions import get_ragflow_version
 from box_sdk_gen import BoxOAuth, OAuthConfig, AccessToken
 
 MAX_CONCURRENT_TASKS = int(os.environ.get("MAX_CONCURRENT_TASKS", "5"))
+# At most this many syncs of the same source type run at once, 0 for no limit besides MAX_CONCURRENT_TASKS.
+MAX_CONCURRENT_TASKS_PER_SOURCE = int(os.environ.get("MAX_CONCURRENT_TASKS_PER_SOURCE", 0))
+# Document batches a connector thread may fetch ahead of the batches being stored and parsed.
+SYNC_QUEUE_SIZE = int(os.environ.get("SYNC_QUEUE_SIZE", 2))
+SYNC_POLL_INTERVAL = float(os.environ.get("SYNC_POLL_INTERVAL", 1))
+SYNC_REPORT_INTERVAL = float(os.environ.get("SYNC_REPORT_INTERVAL", 60))
 task_limiter = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
 
 
@@ -81,7 +89,7 @@ class SyncBase:
         self.conf = conf
 
     async def __call__(self, task: dict):
-        SyncLogsService.start(task["id"], task["connector_id"])
+        await asyncio.to_thread(SyncLogsService.start, task["id"], task["connector_id"])
 
         async with task_limiter:
             try:
@@ -89,7 +97,7 @@ class SyncBase:
 
             except asyncio.TimeoutError:
                 msg = f"Task timeout after {task['timeout_secs']} seconds"
-                SyncLogsService.update_by_id(task["id"], {"status": TaskStatus.FAIL, "error_msg": msg})
+                await asyncio.to_thread(SyncLogsService.update_by_id, task["id"], {"status": TaskStatus.FAIL, "error_msg": msg})
                 return
 
             except Exception as ex:
@@ -97,84 +105,156 @@ class SyncBase:
                     "".join(traceback.format_exception_only(None, ex)).strip(),
                     "".join(traceback.format_exception(None, ex, ex.__traceback__)).strip(),
                 ])
-                SyncLogsService.update_by_id(task["id"], {
+                await asyncio.to_thread(SyncLogsService.update_by_id, task["id"], {
                     "status": TaskStatus.FAIL,
                     "full_exception_trace": msg,
                     "error_msg": str(ex)
                 })
                 return
 
-        SyncLogsService.schedule(task["connector_id"], task["kb_id"], task["poll_range_start"])
+        await asyncio.to_thread(SyncLogsService.schedule, task["connector_id"], task["kb_id"], task["poll_range_start"])
+
+    @staticmethod
+    def _handoff(loop, queue, stop, item):
+        try:
+            fut = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        except RuntimeError:
+            return
+        while True:
+            try:
+                fut.result(timeout=1)
+                return
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    fut.cancel()
+                    return
+
+    def _produce(self, task, loop, queue, stop):
+        """Connector thread: builds the connector and hands its document batches over to the event loop."""
+        try:
+            for document_batch in asyncio.run(self._generate(task)):
+                if stop.is_set():
+                    return
+                if document_batch:
+                    self._handoff(loop, queue, stop, document_batch)
+        except Exception as e:
+            self._handoff(loop, queue, stop, e)
+        finally:
+            self._handoff(loop, queue, stop, None)
 
     async def _run_task_logic(self, task: dict):
-        document_batch_generator = await self._generate(task)
+        self.fingerprints = ConnectorFingerprints(task["connector_id"], task["kb_id"], f"{self.SOURCE_NAME}/{task['connector_id']}")
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=max(1, SYNC_QUEUE_SIZE))
+        stop = threading.Event()
+        threading.Thread(target=self._produce, args=(task, loop, queue, stop), daemon=True,
+                         name=f"sync_{self.SOURCE_NAME}_{task['connector_id']}").start()
 
         doc_num = 0
         failed_docs = 0
+        doc_bytes = 0
+        st = time.time()
+        next_report = st + SYNC_REPORT_INTERVAL
         next_update = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
         if task["poll_range_start"]:
             next_update = task["poll_range_start"]
 
-        for document_batch in document_batch_generator:
-            if not document_batch:
-                continue
-
-            min_update = min(doc.doc_updated_at for doc in document_batch)
-            max_update = max(doc.doc_updated_at for doc in document_batch)
-            next_update = max(next_update, max_update)
-
-            docs = []
-            for doc in document_batch:
-                d = {
-                    "id": hash128(doc.id),
-                    "connector_id": task["connector_id"],
-                    "source": self.SOURCE_NAME,
-                    "semantic_identifier": doc.semantic_identifier,
-                    "extension": doc.extension,
-                    "size_bytes": doc.size_bytes,
-                    "doc_updated_at": doc.doc_updated_at,
-                    "blob": doc.blob,
-                }
-                if doc.metadata:
-                    d["metadata"] = doc.metadata
-                docs.append(d)
-
-            try:
-                e, kb = KnowledgebaseService.get_by_id(task["kb_id"])
-                err, dids = SyncLogsService.duplicate_and_parse(
-                    kb, docs, task["tenant_id"],
-                    f"{self.SOURCE_NAME}/{task['connector_id']}",
-                    task["auto_parse"]
-                )
-                SyncLogsService.increase_docs(
-                    task["id"], min_update, max_update,
-                    len(docs), "\n".join(err), len(err)
-                )
-
-                doc_num += len(docs)
-
-            except Exception as batch_ex:
-                msg = str(batch_ex)
-                code = getattr(batch_ex, "args", [None])[0]
-
-                if code == 1267 or "collation" in msg.lower():
-                    logging.warning(f"Skipping {len(docs)} document(s) due to collation conflict")
-                else:
-                    logging.error(f"Error processing batch: {msg}")
-
-                failed_docs += len(docs)
-                continue
+        try:
+            while True:
+                document_batch = await queue.get()
+                if document_batch is None:
+                    break
+                if isinstance(document_batch, Exception):
+                    raise document_batch
+
+                min_update = min(doc.doc_updated_at for doc in document_batch)
+                max_update = max(doc.doc_updated_at for doc in document_batch)
+                next_update = max(next_update, max_update)
+
+                doc_bytes += sum(len(doc.blob) if doc.blob else max(doc.size_bytes or 0, 0) for doc in document_batch)
+                try:
+                    doc_num += await asyncio.to_thread(self._store_batch, task, document_batch, min_update, max_update)
+
+                except Exception as batch_ex:
+                    msg = str(batch_ex)
+                    code = getattr(batch_ex, "args", [None])[0]
+
+                    if code == 1267 or "collation" in msg.lower():
+                        logging.warning(f"Skipping {len(document_batch)} document(s) due to collation conflict")
+                    else:
+                        logging.error(f"Error processing batch: {msg}")
+
+                    failed_docs += len(document_batch)
+
+                if time.time() >= next_report:
+                    next_report = time.time() + SYNC_REPORT_INTERVAL
+                    logging.info(f"{self._get_source_prefix()}{self.SOURCE_NAME}/{task['connector_id']} syncing: {self._throughput(doc_num + failed_docs, doc_bytes, time.time() - st)}")
+        finally:
+            stop.set()
+
+        skipped = self.fingerprints.take_skipped()
+        if skipped:
+            # Skipped by the connector after the last batch it handed over.
+            await asyncio.to_thread(SyncLogsService.increase_docs, task["id"], None, None, 0, "", 0, skipped)
 
         prefix = self._get_source_prefix()
+        rate = self._throughput(doc_num + failed_docs, doc_bytes, time.time() - st)
+        unchanged = f", {self.fingerprints.total_skipped} unchanged" if self.fingerprints.total_skipped else ""
         if failed_docs > 0:
-            logging.info(f"{prefix}{doc_num} docs synchronized till {next_update} ({failed_docs} skipped)")
+            logging.info(f"{prefix}{doc_num} docs synchronized till {next_update} ({failed_docs} skipped{unchanged}), {rate}")
         else:
-            logging.info(f"{prefix}{doc_num} docs synchronized till {next_update}")
+            logging.info(f"{prefix}{doc_num} docs synchronized till {next_update}{unchanged}, {rate}")
 
-        SyncLogsService.done(task["id"], task["connector_id"])
+        await asyncio.to_thread(SyncLogsService.done, task["id"], task["connector_id"])
         task["poll_range_start"] = next_update
 
+    def _store_batch(self, task, document_batch, min_update, max_update):
+        """Store and parse the changed documents of a batch, returns how many there were."""
+        docs, fingerprints = [], {}
+        for doc in document_batch:
+            fingerprint = doc.fingerprint
+            if not fingerprint and doc.blob:
+                fingerprint = "xxh128:" + xxhash.xxh128_hexdigest(doc.blob)
+                if self.fingerprints.unchanged(doc.id, fingerprint):
+                    continue
+            fingerprints[doc.id] = fingerprint
+            d = {
+                "id": hash128(doc.id),
+                "connector_id": task["connector_id"],
+                "source": self.SOURCE_NAME,
+                "semantic_identifier": doc.semantic_identifier,
+                "extension": doc.extension,
+                "size_bytes": doc.size_bytes,
+                "doc_updated_at": doc.doc_updated_at,
+                "blob": doc.blob,
+                "open_blob": doc.open_blob,
+            }
+            if doc.metadata:
+                d["metadata"] = doc.metadata
+            docs.append(d)
+
+        err = []
+        if docs:
+            e, kb = KnowledgebaseService.get_by_id(task["kb_id"])
+            err, dids = SyncLogsService.duplicate_and_parse(
+                kb, docs, task["tenant_id"],
+                f"{self.SOURCE_NAME}/{task['connector_id']}",
+                task["auto_parse"]
+            )
+            if not err:
+                self.fingerprints.save(fingerprints)
+        SyncLogsService.increase_docs(
+            task["id"], min_update, max_update,
+            len(docs), "\n".join(err), len(err), self.fingerprints.take_skipped()
+        )
+        return len(docs)
+
+    @staticmethod
+    def _throughput(doc_num, doc_bytes, elapsed):
+        elapsed = max(elapsed, 1e-6)
+        return f"{doc_num / elapsed:.2f} docs/s, {doc_bytes / elapsed / 1024 / 1024:.2f} MB/s over {elapsed:.1f}s"
+
     async def _generate(self, task: dict):
         raise NotImplementedError
 
@@ -194,6 +274,7 @@ class _BlobLikeBase(SyncBase):
             prefix=self.conf.get("prefix", ""),
         )
         self.connector.load_credentials(self.conf["credentials"])
+        self.connector.set_fingerprints(self.fingerprints)
 
         document_batch_generator = (
             self.connector.load_from_state()
@@ -1206,33 +1287,49 @@ func_factory = {
 }
 
 
+# (connector id, kb id) -> (source, asyncio task) of the syncs in progress.
+running_tasks = {}
+
+
+def _on_task_done(key, t):
+    running_tasks.pop(key, None)
+    if not t.cancelled() and t.exception():
+        logging.error(f"Error in sync task {key}: {t.exception()}")
+
+
 async def dispatch_tasks():
-    while True:
-        try:
-            list(SyncLogsService.list_sync_tasks()[0])
-            break
-        except Exception as e:
-            logging.warning(f"DB is not ready yet: {e}")
-            await asyncio.sleep(3)
+    """
+    Start the due sync tasks that fit in MAX_CONCURRENT_TASKS and MAX_CONCURRENT_TASKS_PER_SOURCE.
+    Every task is rescheduled on its own as it finishes; the others keep running meanwhile.
+    """
+    try:
+        due_tasks = (await asyncio.to_thread(SyncLogsService.list_sync_tasks))[0]
+    except Exception as e:
+        logging.warning(f"DB is not ready yet: {e}")
+        await asyncio.sleep(3)
+        return
+
+    per_source = {}
+    for source, _ in running_tasks.values():
+        per_source[source] = per_source.get(source, 0) + 1
 
-    tasks = []
-    for task in SyncLogsService.list_sync_tasks()[0]:
+    for task in due_tasks:
+        if len(running_tasks) >= MAX_CONCURRENT_TASKS:
+            break
+        key = (task["connector_id"], task["kb_id"])
+        if key in running_tasks:
+            continue
+        if 0 < MAX_CONCURRENT_TASKS_PER_SOURCE <= per_source.get(task["source"], 0):
+            continue
         if task["poll_range_start"]:
             task["poll_range_start"] = task["poll_range_start"].astimezone(timezone.utc)
         if task["poll_range_end"]:
             task["poll_range_end"] = task["poll_range_end"].astimezone(timezone.utc)
         func = func_factory[task["source"]](task["config"])
-        tasks.append(asyncio.create_task(func(task)))
-
-    try:
-        await asyncio.gather(*tasks, return_exceptions=False)
-    except Exception as e:
-        logging.error(f"Error in dispatch_tasks: {e}")
-        for t in tasks:
-            t.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
-        raise
-    await asyncio.sleep(1)
+        t = asyncio.create_task(func(task))
+        running_tasks[key] = (task["source"], t)
+        per_source[task["source"]] = per_source.get(task["source"], 0) + 1
+        t.add_done_callback(lambda t, key=key: _on_task_done(key, t))
 
 
 stop_event = threading.Event()
@@ -1272,6 +1369,7 @@ async def main():
     logging.info(f"RAGFlow data sync is ready after {time.time() - start_ts}s initialization.")
     while not stop_event.is_set():
         await dispatch_tasks()
+        await asyncio.sleep(SYNC_POLL_INTERVAL)
     logging.error("BUG!!! You should not reach here!!!")
 
 
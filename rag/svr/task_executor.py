@@ -33,7 +33,10 @@ from api.db.joint_services.memory_message_service import handle_save_to_memory_t
 from common.connection_utils import timeout
 from common.metadata_utils import update_metadata_to, metadata_schema
 from rag.utils.base64_image import image2id
+from rag.utils.parse_cache import PARSE_CACHE_ENABLED, content_hash, is_cacheable, parse_cache_key, get_cached_chunks, \
+    set_cached_chunks, get_cached_embeddings, set_cached_embeddings
 from rag.utils.raptor_utils import should_skip_raptor, get_skip_reason
+from rag.utils.embedding_batcher import encode_batched, model_key
 from common.log_utils import init_root_logger
 from common.config_utils import show_configs
 from graphrag.general.index import run_graphrag_for_kb
@@ -58,7 +61,8 @@ from peewee import DoesNotExist
 from common.constants import LLMType, ParserType, PipelineTaskType
 from api.db.services.document_service import DocumentService
 from api.db.services.llm_service import LLMBundle
-from api.db.services.task_service import TaskService, has_canceled, CANVAS_DEBUG_DOC_ID, GRAPH_RAPTOR_FAKE_DOC_ID
+from api.db.services.task_service import TaskService, has_canceled, CANVAS_DEBUG_DOC_ID, GRAPH_RAPTOR_FAKE_DOC_ID, \
+    INCREMENTAL_REINDEX, RAPTOR_TREE_DOC_ID, raptor_tree_id
 from api.db.services.file2document_service import File2DocumentService
 from common.versions import get_ragflow_version
 from api.db.db_models import close_connection
@@ -124,6 +128,26 @@ embed_limiter = asyncio.Semaphore(MAX_CONCURRENT_CHUNK_BUILDERS)
 minio_limiter = asyncio.Semaphore(MAX_CONCURRENT_MINIO)
 kg_limiter = asyncio.Semaphore(2)
 WORKER_HEARTBEAT_TIMEOUT = int(os.environ.get('WORKER_HEARTBEAT_TIMEOUT', '120'))
+
+# Progress of a task is written at most every PROGRESS_FLUSH_INTERVAL seconds, messages in between
+# being appended at once with the highest progress, at the end of the interval at the latest. Failures, cancellation
+# and completion are written right away. Updates left buffered are written by a single flusher thread.
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get('PROGRESS_FLUSH_INTERVAL', '1'))
+# task id -> {"last_flush", "msgs", "prog", "write_lock"}
+_pending_progress = {}
+_progress_lock = threading.Lock()
+_progress_buffered = threading.Condition(_progress_lock)
+_progress_flusher_started = False
+
+# With CHUNK_PIPELINE_BATCH_SIZE > 0, parsed chunks flow through enrichment, embedding and indexing in batches
+# of that size, each stage running up to its number of workers, with at most CHUNK_PIPELINE_QUEUE_SIZE
+# batches waiting in front of it. 0 runs every stage over the whole document before the next one.
+CHUNK_PIPELINE_BATCH_SIZE = int(os.environ.get('CHUNK_PIPELINE_BATCH_SIZE', '0'))
+CHUNK_PIPELINE_QUEUE_SIZE = int(os.environ.get('CHUNK_PIPELINE_QUEUE_SIZE', '2'))
+CHUNK_PIPELINE_ENRICH_WORKERS = int(os.environ.get('CHUNK_PIPELINE_ENRICH_WORKERS', '2'))
+CHUNK_PIPELINE_EMBED_WORKERS = int(os.environ.get('CHUNK_PIPELINE_EMBED_WORKERS', '2'))
+CHUNK_PIPELINE_INDEX_WORKERS = int(os.environ.get('CHUNK_PIPELINE_INDEX_WORKERS', '1'))
+CHUNK_PIPELINE_REPORT_INTERVAL = int(os.environ.get('CHUNK_PIPELINE_REPORT_INTERVAL', '10'))
 stop_event = threading.Event()
 
 
@@ -134,6 +158,92 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
+def _merged_progress(msgs, prog):
+    if not msgs and prog is None:
+        return None
+    d = {"progress_msg": "\n".join(msgs)}
+    if prog is not None:
+        d["progress"] = prog
+    return d
+
+
+def _write_progress(task_id, d, caller):
+    try:
+        TaskService.update_progress(task_id, d)
+        close_connection()
+    except DoesNotExist:
+        logging.warning(f"{caller}({task_id}) got exception DoesNotExist")
+    except Exception as e:
+        logging.exception(f"{caller}({task_id}) got exception: {e}")
+
+
+def _take_progress(task_id, pending, due_only, caller):
+    """
+    Writes the buffered updates of the task, merged. Taking them and writing them happen under the task's
+    write lock, so a write never lands after one of updates buffered later.
+    """
+    with pending["write_lock"]:
+        with _progress_lock:
+            now = time.monotonic()
+            if due_only and now - pending["last_flush"] < PROGRESS_FLUSH_INTERVAL:
+                return
+            d = _merged_progress(pending["msgs"], pending["prog"])
+            pending["last_flush"], pending["msgs"], pending["prog"] = now, [], None
+        if d:
+            _write_progress(task_id, d, caller)
+
+
+def _flush_progress_forever():
+    while True:
+        with _progress_lock:
+            now = time.monotonic()
+            due, wait = [], None
+            for task_id, pending in _pending_progress.items():
+                if not pending["msgs"] and pending["prog"] is None:
+                    continue
+                remaining = pending["last_flush"] + PROGRESS_FLUSH_INTERVAL - now
+                if remaining <= 0:
+                    due.append((task_id, pending))
+                else:
+                    wait = remaining if wait is None else min(wait, remaining)
+            if not due:
+                _progress_buffered.wait(wait)
+                continue
+        for task_id, pending in due:
+            _take_progress(task_id, pending, True, "flush_progress")
+
+
+def _coalesce_progress(task_id, prog, msg, force):
+    """
+    Buffers an update of the task and writes the buffered ones when they are due.
+    Updates left buffered are written by the flusher thread at the end of the interval.
+    """
+    global _progress_flusher_started
+    with _progress_lock:
+        pending = _pending_progress.get(task_id)
+        if pending is None:
+            pending = {"last_flush": 0., "msgs": [], "prog": None, "write_lock": threading.Lock()}
+            _pending_progress[task_id] = pending
+        if msg:
+            pending["msgs"].append(msg)
+        if prog is not None and (pending["prog"] is None or prog < 0 or prog > pending["prog"]):
+            pending["prog"] = prog
+        if not force and time.monotonic() - pending["last_flush"] < PROGRESS_FLUSH_INTERVAL:
+            if not _progress_flusher_started:
+                threading.Thread(target=_flush_progress_forever, name="progress_flusher", daemon=True).start()
+                _progress_flusher_started = True
+            _progress_buffered.notify()
+            return
+    _take_progress(task_id, pending, False, "set_progress")
+
+
+def flush_progress(task_id):
+    with _progress_lock:
+        pending = _pending_progress.pop(task_id, None)
+    if pending:
+        _take_progress(task_id, pending, False, "flush_progress")
+
+
 def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing..."):
     try:
         if prog is not None and prog < 0:
@@ -150,13 +260,8 @@ def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing...
                     msg = f"Page({from_page + 1}~{to_page + 1}): " + msg
         if msg:
             msg = datetime.now().strftime("%H:%M:%S") + " " + msg
-        d = {"progress_msg": msg}
-        if prog is not None:
-            d["progress"] = prog
-
-        TaskService.update_progress(task_id, d)
+        _coalesce_progress(task_id, prog, msg, force=prog is not None and (prog < 0 or prog >= 1))
 
-        close_connection()
         if cancel:
             raise TaskCanceledException(msg)
         logging.info(f"set_progress({task_id}), progress: {prog}, progress_msg: {msg}")
@@ -234,8 +339,68 @@ async def get_storage_binary(bucket, name):
     return await asyncio.to_thread(settings.STORAGE_IMPL.get, bucket, name)
 
 
+def chunk_id(content, doc_id):
+    return xxhash.xxh64((content + str(doc_id)).encode("utf-8", "surrogatepass")).hexdigest()
+
+
+async def diff_previous_chunks(task, cks, progress_callback):
+    """
+    Leaves out the chunks the previous version of the document still has in the doc store, matched by id,
+    i.e. by content, so they keep their vectors and enrichment. Records on `task` the kept ids and those of
+    the previous version, to be deleted by `finish_incremental_reindex` once the new chunks are indexed.
+    """
+    prev_ids = set(task["chunk_ids"].split())
+    stored = await asyncio.to_thread(settings.retriever.chunk_list, task["doc_id"], task["tenant_id"],
+                                     [str(task["kb_id"])], max_count=10 ** 6, fields=["doc_id"])
+    stored_ids = {d["id"] for d in stored} & prev_ids
+
+    kept, new = {}, []
+    for ck in cks:
+        cid = chunk_id(ck["content_with_weight"], task["doc_id"])
+        if cid in stored_ids:
+            kept[cid] = num_tokens_from_string(ck["content_with_weight"])
+        else:
+            new.append(ck)
+    task["kept_chunk_ids"] = list(kept)
+    task["kept_token_num"] = sum(kept.values())
+    task["prev_chunk_ids"] = list(prev_ids)
+    progress_callback(msg="{} chunks unchanged since the previous version, {} to index.".format(len(kept), len(new)))
+    return new
+
+
+async def finish_incremental_reindex(task, chunks):
+    """Deletes the chunks of the previous version that are gone and returns the number and tokens of kept chunks."""
+    kept = task["kept_chunk_ids"]
+    new_ids = list(dict.fromkeys(ck["id"] for ck in chunks))
+    stale = list(set(task["prev_chunk_ids"]) - set(kept) - set(new_ids))
+    if stale:
+        await asyncio.to_thread(settings.docStoreConn.delete, {"id": stale}, search.index_name(task["tenant_id"]),
+                                task["kb_id"])
+        await asyncio.gather(*[delete_image(task["kb_id"], cid) for cid in stale], return_exceptions=True)
+    TaskService.update_chunk_ids(task["id"], " ".join(kept + new_ids))
+    logging.info("Incremental re-index of {}: {} kept, {} indexed, {} deleted".format(
+        task["name"], len(kept), len(new_ids), len(stale)))
+    return len(kept), task.get("kept_token_num", 0)
+
+
+async def finish_without_chunks(task, progress_callback):
+    if "kept_chunk_ids" in task:
+        kept, kept_tokens = await finish_incremental_reindex(task, [])
+        DocumentService.increment_chunk_num(task["doc_id"], task["kb_id"], kept_tokens, kept, 0)
+        progress_callback(1., msg=f"No chunk of {task['name']} changed")
+        return
+    progress_callback(1., msg=f"No chunk built from {task['name']}")
+
+
 @timeout(60 * 80, 1)
 async def build_chunks(task, progress_callback):
+    docs = await parse_chunks(task, progress_callback)
+    if not docs:
+        return docs
+    return await enrich_chunks(task, docs, progress_callback)
+
+
+async def parse_chunks(task, progress_callback):
     if task["size"] > settings.DOC_MAXIMUM_SIZE:
         set_progress(task["id"], prog=-1, msg="File size exceeds( <= %dMb )" %
                                               (int(settings.DOC_MAXIMUM_SIZE / 1024 / 1024)))
@@ -260,20 +425,34 @@ async def build_chunks(task, progress_callback):
         logging.exception("Chunking {}/{} got exception".format(task["location"], task["name"]))
         raise
 
+    cache_key = None
+    cks = None
+    if PARSE_CACHE_ENABLED and is_cacheable(task["parser_id"]):
+        cache_key = parse_cache_key(await asyncio.to_thread(content_hash, binary), task["name"], task["parser_id"],
+                                    task["parser_config"], task["from_page"], task["to_page"], task["language"],
+                                    task.get("img2txt_id"), task.get("asr_id"))
+        cks = await asyncio.to_thread(get_cached_chunks, cache_key)
+        if cks is not None:
+            progress_callback(msg="Reused {} parsed chunks from the parse cache.".format(len(cks)))
+            logging.info("Chunking {}/{} hit parse cache {}".format(task["location"], task["name"], cache_key))
+
     try:
-        async with chunk_limiter:
-            cks = await asyncio.to_thread(
-                chunker.chunk,
-                task["name"],
-                binary=binary,
-                from_page=task["from_page"],
-                to_page=task["to_page"],
-                lang=task["language"],
-                callback=progress_callback,
-                kb_id=task["kb_id"],
-                parser_config=task["parser_config"],
-                tenant_id=task["tenant_id"],
-            )
+        if cks is None:
+            async with chunk_limiter:
+                cks = await asyncio.to_thread(
+                    chunker.chunk,
+                    task["name"],
+                    binary=binary,
+                    from_page=task["from_page"],
+                    to_page=task["to_page"],
+                    lang=task["language"],
+                    callback=progress_callback,
+                    kb_id=task["kb_id"],
+                    parser_config=task["parser_config"],
+                    tenant_id=task["tenant_id"],
+                )
+            if cache_key and cks:
+                await asyncio.to_thread(set_cached_chunks, cache_key, cks)
         logging.info("Chunking({}) {}/{} done".format(timer() - st, task["location"], task["name"]))
     except TaskCanceledException:
         raise
@@ -282,6 +461,11 @@ async def build_chunks(task, progress_callback):
         logging.exception("Chunking {}/{} got exception".format(task["location"], task["name"]))
         raise
 
+    if INCREMENTAL_REINDEX and task.get("chunk_ids") and not task["parser_config"].get("toc_extraction", False):
+        cks = await diff_previous_chunks(task, cks, progress_callback)
+        if not cks:
+            return []
+
     docs = []
     doc = {
         "doc_id": task["doc_id"],
@@ -296,8 +480,7 @@ async def build_chunks(task, progress_callback):
         try:
             d = copy.deepcopy(document)
             d.update(chunk)
-            d["id"] = xxhash.xxh64(
-                (chunk["content_with_weight"] + str(d["doc_id"])).encode("utf-8", "surrogatepass")).hexdigest()
+            d["id"] = chunk_id(chunk["content_with_weight"], d["doc_id"])
             d["create_time"] = str(datetime.now()).replace("T", " ")[:19]
             d["create_timestamp_flt"] = datetime.now().timestamp()
 
@@ -331,10 +514,34 @@ async def build_chunks(task, progress_callback):
 
     el = timer() - st
     logging.info("MINIO PUT({}) cost {:.3f} s".format(task["name"], el))
+    return docs
+
+
+def enrich_steps(task):
+    """(start message, completion label) of the enrichment steps configured for the task, in order."""
+    parser_config = task["parser_config"]
+    steps = [
+        (parser_config.get("auto_keywords", 0), "Start to generate keywords for every chunk ...", "Keywords generation"),
+        (parser_config.get("auto_questions", 0), "Start to generate questions for every chunk ...", "Question generation"),
+        (parser_config.get("enable_metadata", False) and parser_config.get("metadata"),
+         "Start to generate meta-data for every chunk ...", "Meta-data generation"),
+        (task["kb_parser_config"].get("tag_kb_ids", []), "Start to tag for every chunk ...", "Tagging"),
+    ]
+    return [(start, label) for on, start, label in steps if on]
+
+
+async def enrich_chunks(task, docs, progress_callback, announce=True):
+    """
+    LLM keywords, questions, metadata and tags of `docs`, as configured. None if the task got canceled.
+    With `announce` off, the start and completion of every step are left to the caller.
+    """
+    def say(msg):
+        if announce:
+            progress_callback(msg=msg)
 
     if task["parser_config"].get("auto_keywords", 0):
         st = timer()
-        progress_callback(msg="Start to generate keywords for every chunk ...")
+        say("Start to generate keywords for every chunk ...")
         chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
         async def doc_keyword_extraction(chat_mdl, d, topn):
@@ -363,11 +570,11 @@ async def build_chunks(task, progress_callback):
                 t.cancel()
             await asyncio.gather(*tasks, return_exceptions=True)
             raise
-        progress_callback(msg="Keywords generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
+        say("Keywords generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     if task["parser_config"].get("auto_questions", 0):
         st = timer()
-        progress_callback(msg="Start to generate questions for every chunk ...")
+        say("Start to generate questions for every chunk ...")
         chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
         async def doc_question_proposal(chat_mdl, d, topn):
@@ -395,11 +602,11 @@ async def build_chunks(task, progress_callback):
                 t.cancel()
             await asyncio.gather(*tasks, return_exceptions=True)
             raise
-        progress_callback(msg="Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
+        say("Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     if task["parser_config"].get("enable_metadata", False) and task["parser_config"].get("metadata"):
         st = timer()
-        progress_callback(msg="Start to generate meta-data for every chunk ...")
+        say("Start to generate meta-data for every chunk ...")
         chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
 
         async def gen_metadata_task(chat_mdl, d):
@@ -440,10 +647,10 @@ async def build_chunks(task, progress_callback):
                     doc.meta_fields = json.loads(doc.meta_fields)
                 metadata = update_metadata_to(metadata, doc.meta_fields)
                 DocumentService.update_by_id(task["doc_id"], {"meta_fields": metadata})
-        progress_callback(msg="Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
+        say("Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     if task["kb_parser_config"].get("tag_kb_ids", []):
-        progress_callback(msg="Start to tag for every chunk ...")
+        say("Start to tag for every chunk ...")
         kb_ids = task["kb_parser_config"]["tag_kb_ids"]
         tenant_id = task["tenant_id"]
         topn_tags = task["kb_parser_config"].get("topn_tags", 3)
@@ -505,7 +712,7 @@ async def build_chunks(task, progress_callback):
                 t.cancel()
             await asyncio.gather(*tasks, return_exceptions=True)
             raise
-        progress_callback(msg="Tagging {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
+        say("Tagging {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
 
     return docs
 
@@ -586,16 +793,20 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
         nonlocal mdl
         return mdl.encode([truncate(c, mdl.max_length - 10) for c in txts])
 
-    cnts_ = np.array([])
-    for i in range(0, len(cnts), settings.EMBEDDING_BATCH_SIZE):
-        async with embed_limiter:
-            vts, c = await asyncio.to_thread(batch_encode, cnts[i: i + settings.EMBEDDING_BATCH_SIZE])
-        if len(cnts_) == 0:
-            cnts_ = vts
-        else:
-            cnts_ = np.concatenate((cnts_, vts), axis=0)
+    mdl_key = model_key(mdl)
+    # Factory, model name and base URL: vectors of the parse cache are shared across tenants.
+    cache_mdl_name = "\x00".join(map(str, mdl_key[1:]))
+    cached = None
+    if PARSE_CACHE_ENABLED:
+        cached = await asyncio.to_thread(get_cached_embeddings, cache_mdl_name, cnts)
+    if cached is not None:
+        cnts_ = cached
+    else:
+        cnts_, c = await encode_batched(mdl_key, cnts, batch_encode, mdl.max_length - 10,
+                                        lambda r: callback(prog=0.7 + 0.2 * r, msg=""), limiter=embed_limiter)
         tk_count += c
-        callback(prog=0.7 + 0.2 * (i + 1) / len(cnts), msg="")
+        if PARSE_CACHE_ENABLED and len(cnts_) == len(cnts):
+            await asyncio.to_thread(set_cached_embeddings, cache_mdl_name, cnts, cnts_)
     cnts = cnts_
     filename_embd_weight = parser_config.get("filename_embd_weight", 0.1)  # due to the db support none value
     if not filename_embd_weight:
@@ -758,16 +969,36 @@ async def run_dataflow(task: dict):
 
 @timeout(3600)
 async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_size, callback=None, doc_ids=[]):
+    """
+    The summaries to insert and their token count. With RAPTOR_INCREMENTAL, also the trees to save with
+    `save_raptor_trees` once the summaries are stored: (doc id, tree, ids of the stored summaries it drops).
+    """
     fake_doc_id = GRAPH_RAPTOR_FAKE_DOC_ID
 
     raptor_config = kb_parser_config.get("raptor", {})
     vctr_nm = "q_%d_vec" % vector_size
 
     res = []
+    trees = []
     tk_count = 0
     max_errors = int(os.environ.get("RAPTOR_MAX_ERRORS", 3))
+    incremental = int(os.environ.get("RAPTOR_INCREMENTAL", 0))
+    idxnm = search.index_name(row["tenant_id"])
+    kb_id = str(row["kb_id"])
+
+    def summary_id(content):
+        return xxhash.xxh64((content + str(fake_doc_id)).encode("utf-8")).hexdigest()
 
-    async def generate(chunks, did):
+    async def load_tree(did):
+        try:
+            d = await asyncio.to_thread(settings.docStoreConn.get, raptor_tree_id(did), idxnm, [kb_id])
+            return json.loads(d["content_with_weight"]) if d else None
+        except Exception as e:
+            logging.warning(f"Fail to load the RAPTOR tree of {did}, rebuilding it: {e}")
+            return None
+
+    async def generate(chunks, did, stored_ids):
+        """`stored_ids` are the summaries of `did` in the doc store, those the new tree keeps are not inserted again."""
         nonlocal tk_count, res
         raptor = Raptor(
             raptor_config.get("max_cluster", 64),
@@ -779,7 +1010,12 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
             max_errors=max_errors,
         )
         original_length = len(chunks)
-        chunks = await raptor(chunks, kb_parser_config["raptor"]["random_seed"], callback, row["id"])
+        old_tree = await load_tree(did) if incremental else None
+        chunks = await raptor(chunks, kb_parser_config["raptor"]["random_seed"], callback, row["id"], tree=old_tree)
+        if incremental:
+            new_ids = {summary_id(content) for content, _ in chunks[original_length:]}
+            # Also drops the summaries of a previous non-incremental build or of a rebuilt tree.
+            trees.append((did, raptor.tree_state(chunks), sorted(stored_ids - new_ids)))
         doc = {
             "doc_id": did,
             "kb_id": [str(row["kb_id"])],
@@ -791,8 +1027,10 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
             doc[PAGERANK_FLD] = int(row["pagerank"])
 
         for content, vctr in chunks[original_length:]:
+            if summary_id(content) in stored_ids:
+                continue
             d = copy.deepcopy(doc)
-            d["id"] = xxhash.xxh64((content + str(fake_doc_id)).encode("utf-8")).hexdigest()
+            d["id"] = summary_id(content)
             d["create_time"] = str(datetime.now()).replace("T", " ")[:19]
             d["create_timestamp_flt"] = datetime.now().timestamp()
             d[vctr_nm] = vctr.tolist()
@@ -805,11 +1043,18 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
     if raptor_config.get("scope", "file") == "file":
         for x, doc_id in enumerate(doc_ids):
             chunks = []
+            stored_ids = set()
             for d in settings.retriever.chunk_list(doc_id, row["tenant_id"], [str(row["kb_id"])],
-                                                   fields=["content_with_weight", vctr_nm],
+                                                   fields=["content_with_weight", vctr_nm, "raptor_kwd"],
                                                    sort_by_position=True):
+                # Trees of earlier versions were stored as chunks of their document.
+                if d.get("raptor_kwd") == "tree":
+                    continue
+                if incremental and d.get("raptor_kwd") == "raptor":
+                    stored_ids.add(d["id"])
+                    continue
                 chunks.append((d["content_with_weight"], np.array(d[vctr_nm])))
-            await generate(chunks, doc_id)
+            await generate(chunks, doc_id, stored_ids)
             callback(prog=(x + 1.) / len(doc_ids))
     else:
         chunks = []
@@ -819,9 +1064,37 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
                                                    sort_by_position=True):
                 chunks.append((d["content_with_weight"], np.array(d[vctr_nm])))
 
-        await generate(chunks, fake_doc_id)
+        stored_ids = set()
+        if incremental:
+            stored_ids = {d["id"] for d in settings.retriever.chunk_list(fake_doc_id, row["tenant_id"], [str(row["kb_id"])],
+                                                                          fields=["raptor_kwd"])
+                          if d.get("raptor_kwd") == "raptor"}
+        await generate(chunks, fake_doc_id, stored_ids)
 
-    return res, tk_count
+    return res, tk_count, trees
+
+
+async def save_raptor_trees(row, trees):
+    """
+    Saves the trees of an incremental RAPTOR run after its summaries were inserted, and deletes the summaries
+    the trees dropped. Returns the number of deleted summaries.
+    """
+    idxnm = search.index_name(row["tenant_id"])
+    kb_id = str(row["kb_id"])
+    removed = 0
+    for did, tree, stale_ids in trees:
+        await asyncio.to_thread(settings.docStoreConn.insert, [{
+            "id": raptor_tree_id(did),
+            "doc_id": RAPTOR_TREE_DOC_ID,
+            "kb_id": [kb_id],
+            "raptor_kwd": "tree",
+            "available_int": 0,
+            "content_with_weight": json.dumps(tree, ensure_ascii=False),
+        }], idxnm, kb_id)
+        if stale_ids:
+            await asyncio.to_thread(settings.docStoreConn.delete, {"id": stale_ids}, idxnm, kb_id)
+            removed += len(stale_ids)
+    return removed
 
 
 async def delete_image(kb_id, chunk_id):
@@ -845,15 +1118,11 @@ async def insert_es(task_id, task_tenant_id, task_dataset_id, chunks, progress_c
         if id in mother_ids:
             continue
         mother_ids.add(id)
-        mom_ck = copy.deepcopy(ck)
+        # Mothers only keep a few fields of their first chunk, there is no need to copy the whole chunk.
+        mom_ck = {fld: ck[fld] for fld in ["doc_id", "docnm_kwd", "kb_id", "position_int"] if fld in ck}
         mom_ck["id"] = id
         mom_ck["content_with_weight"] = mom
         mom_ck["available_int"] = 0
-        flds = list(mom_ck.keys())
-        for fld in flds:
-            if fld not in ["id", "content_with_weight", "doc_id", "docnm_kwd", "kb_id", "available_int",
-                           "position_int"]:
-                del mom_ck[fld]
         mothers.append(mom_ck)
 
     for b in range(0, len(mothers), settings.DOC_BULK_SIZE):
@@ -877,10 +1146,9 @@ async def insert_es(task_id, task_tenant_id, task_dataset_id, chunks, progress_c
             error_message = f"Insert chunk error: {doc_store_result}, please check log file and Elasticsearch/Infinity status!"
             progress_callback(-1, msg=error_message)
             raise Exception(error_message)
-        chunk_ids = [chunk["id"] for chunk in chunks[:b + settings.DOC_BULK_SIZE]]
-        chunk_ids_str = " ".join(chunk_ids)
+        chunk_ids = [chunk["id"] for chunk in chunks[b:b + settings.DOC_BULK_SIZE]]
         try:
-            TaskService.update_chunk_ids(task_id, chunk_ids_str)
+            TaskService.append_chunk_ids(task_id, chunk_ids)
         except DoesNotExist:
             logging.warning(f"do_handle_task update_chunk_ids failed since task {task_id} is unknown.")
             doc_store_result = await asyncio.to_thread(settings.docStoreConn.delete, {"id": chunk_ids},
@@ -901,6 +1169,132 @@ async def insert_es(task_id, task_tenant_id, task_dataset_id, chunks, progress_c
     return True
 
 
+@timeout(60 * 60 * 2, 1)
+async def run_chunk_pipeline(task, embedding_model, progress_callback):
+    """
+    Parses the document, then streams its chunks in batches through enrichment, embedding and indexing.
+    Returns the indexed chunks, the embedding tokens and the vector size, or None if the task got canceled.
+    """
+    docs = await parse_chunks(task, progress_callback)
+    if not docs:
+        return docs, 0, 0
+
+    task_id = task["id"]
+    total = len(docs)
+    token_count, vector_size = 0, 0
+    indexed = []
+    # stage -> [chunks, busy seconds]
+    metrics = {"enrich": [0, 0.], "embed": [0, 0.], "index": [0, 0.]}
+    started = last_report = timer()
+
+    def report():
+        elapsed = timer() - started
+        stats = ", ".join("{} {}/{} ({:.1f}/s busy, {:.1f}/s overall)".format(
+            n, m[0], total, m[0] / m[1] if m[1] else 0., m[0] / elapsed if elapsed else 0.) for n, m in metrics.items())
+        progress_callback(msg="Pipeline: " + stats)
+
+    async def enrich(batch):
+        batch = await enrich_chunks(task, batch, progress_callback, announce=False)
+        if batch is None:
+            raise TaskCanceledException(f"Task {task_id} was cancelled")
+        return batch
+
+    async def embed(batch):
+        nonlocal token_count, vector_size
+        tk, vector_size = await embedding(batch, embedding_model, task["parser_config"], lambda prog=None, msg="": None)
+        token_count += tk
+        return batch
+
+    def index_callback(prog=None, msg=""):
+        if prog is not None and prog < 0:
+            progress_callback(prog, msg=msg)
+
+    async def index(batch):
+        nonlocal last_report
+        if not await insert_es(task_id, task["tenant_id"], task["kb_id"], batch, index_callback):
+            if has_canceled(task_id):
+                raise TaskCanceledException(f"Task {task_id} was cancelled")
+            raise Exception(f"Fail to index the chunks of task {task_id}")
+        indexed.extend(batch)
+        if timer() - last_report >= CHUNK_PIPELINE_REPORT_INTERVAL:
+            last_report = timer()
+            report()
+        return batch
+
+    async def stage(name, fn, inbox, outbox, workers):
+        async def worker():
+            while True:
+                batch = await inbox.get()
+                if batch is None:
+                    await inbox.put(None)
+                    return
+                if has_canceled(task_id):
+                    raise TaskCanceledException(f"Task {task_id} was cancelled")
+                st = timer()
+                batch = await fn(batch)
+                metrics[name][0] += len(batch)
+                metrics[name][1] += timer() - st
+                # Every stage moves the document along, so progress keeps going up while enrichment is slow.
+                progress_callback(prog=0.1 + 0.8 * sum(m[0] for m in metrics.values()) / (len(metrics) * total), msg="")
+                if outbox is not None:
+                    await outbox.put(batch)
+
+        await asyncio.gather(*[worker() for _ in range(max(1, workers))])
+        if outbox is not None:
+            await outbox.put(None)
+
+    async def feed(outbox):
+        for b in range(0, total, CHUNK_PIPELINE_BATCH_SIZE):
+            await outbox.put(docs[b:b + CHUNK_PIPELINE_BATCH_SIZE])
+        await outbox.put(None)
+
+    steps = enrich_steps(task)
+    for start, _ in steps:
+        progress_callback(msg=start)
+
+    to_enrich, to_embed, to_index = [asyncio.Queue(maxsize=max(1, CHUNK_PIPELINE_QUEUE_SIZE)) for _ in range(3)]
+    tasks = [
+        asyncio.create_task(feed(to_enrich)),
+        asyncio.create_task(stage("enrich", enrich, to_enrich, to_embed, CHUNK_PIPELINE_ENRICH_WORKERS)),
+        asyncio.create_task(stage("embed", embed, to_embed, to_index, CHUNK_PIPELINE_EMBED_WORKERS)),
+        asyncio.create_task(stage("index", index, to_index, None, CHUNK_PIPELINE_INDEX_WORKERS)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except TaskCanceledException:
+        progress_callback(-1, msg="Task has been canceled.")
+        return None
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if steps:
+        progress_callback(msg="{} {} chunks completed in {:.2f}s".format(
+            ", ".join(label for _, label in steps), total, metrics["enrich"][1]))
+    report()
+    return indexed, token_count, vector_size
+
+
+async def remove_canceled_chunks(task, doc_id):
+    """Deletes the chunks of `doc_id` a canceled task already wrote to the doc store."""
+    try:
+        exists = await asyncio.to_thread(
+            settings.docStoreConn.index_exist,
+            search.index_name(task["tenant_id"]),
+            task["kb_id"],
+        )
+        if exists:
+            await asyncio.to_thread(
+                settings.docStoreConn.delete,
+                {"doc_id": doc_id},
+                search.index_name(task["tenant_id"]),
+                task["kb_id"],
+            )
+    except Exception as e:
+        logging.exception(
+            f"Remove doc({doc_id}) from docStore failed when task({task['id']}) canceled, exception: {e}")
+
+
 @timeout(60 * 60 * 3, 1)
 async def do_handle_task(task):
     task_type = task.get("task_type", "")
@@ -927,6 +1321,8 @@ async def do_handle_task(task):
     task_parser_config = task["parser_config"]
     task_start_ts = timer()
     toc_thread = None
+    indexed = False
+    raptor_trees = []
     executor = concurrent.futures.ThreadPoolExecutor()
 
     # prepare the progress callback function
@@ -1001,7 +1397,7 @@ async def do_handle_task(task):
         chat_model = LLMBundle(task_tenant_id, LLMType.CHAT, llm_name=task_llm_id, lang=task_language)
         # run RAPTOR
         async with kg_limiter:
-            chunks, token_count = await run_raptor_for_kb(
+            chunks, token_count, raptor_trees = await run_raptor_for_kb(
                 row=task,
                 kb_parser_config=kb_parser_config,
                 chat_mdl=chat_model,
@@ -1065,13 +1461,29 @@ async def do_handle_task(task):
         progress_callback(1, "place holder")
         pass
         return
+    elif CHUNK_PIPELINE_BATCH_SIZE > 0:
+        # Standard chunking methods, streamed from stage to stage
+        start_ts = timer()
+        res = await run_chunk_pipeline(task, embedding_model, progress_callback)
+        if res is None:
+            # Batches indexed before the cancellation are already in the doc store.
+            await remove_canceled_chunks(task, task_doc_id)
+            return
+        chunks, token_count, vector_size = res
+        indexed = True
+        logging.info("Pipeline of document {}: {:.2f}s".format(task_document_name, timer() - start_ts))
+        if not chunks:
+            await finish_without_chunks(task, progress_callback)
+            return
+        if task["parser_id"].lower() == "naive" and task["parser_config"].get("toc_extraction", False):
+            toc_thread = executor.submit(build_TOC, task, chunks, progress_callback)
     else:
         # Standard chunking methods
         start_ts = timer()
         chunks = await build_chunks(task, progress_callback)
         logging.info("Build document {}: {:.2f}s".format(task_document_name, timer() - start_ts))
         if not chunks:
-            progress_callback(1., msg=f"No chunk built from {task_document_name}")
+            await finish_without_chunks(task, progress_callback)
             return
         progress_callback(msg="Generate {} chunks".format(len(chunks)))
         start_ts = timer()
@@ -1099,7 +1511,7 @@ async def do_handle_task(task):
         return bool(insert_result)
 
     try:
-        if not await _maybe_insert_es(chunks):
+        if not indexed and not await _maybe_insert_es(chunks):
             return
 
         logging.info(
@@ -1108,6 +1520,17 @@ async def do_handle_task(task):
             )
         )
 
+        if "kept_chunk_ids" in task:
+            kept, kept_tokens = await finish_incremental_reindex(task, chunks)
+            chunk_count += kept
+            token_count += kept_tokens
+
+        if raptor_trees:
+            if has_canceled(task_id):
+                progress_callback(-1, msg="Task has been canceled.")
+                return
+            chunk_count -= await save_raptor_trees(task, raptor_trees)
+
         DocumentService.increment_chunk_num(task_doc_id, task_dataset_id, token_count, chunk_count, 0)
 
         progress_callback(msg="Indexing done ({:.2f}s).".format(timer() - start_ts))
@@ -1133,22 +1556,7 @@ async def do_handle_task(task):
 
     finally:
         if has_canceled(task_id):
-            try:
-                exists = await asyncio.to_thread(
-                    settings.docStoreConn.index_exist,
-                    search.index_name(task_tenant_id),
-                    task_dataset_id,
-                )
-                if exists:
-                    await asyncio.to_thread(
-                        settings.docStoreConn.delete,
-                        {"doc_id": task_doc_id},
-                        search.index_name(task_tenant_id),
-                        task_dataset_id,
-                    )
-            except Exception as e:
-                logging.exception(
-                    f"Remove doc({task_doc_id}) from docStore failed when task({task_id}) canceled, exception: {e}")
+            await remove_canceled_chunks(task, task_doc_id)
 
 
 async def handle_task():
@@ -1183,6 +1591,7 @@ async def handle_task():
             pass
         logging.exception(f"handle_task got exception for task {json.dumps(task)}")
     finally:
+        flush_progress(task_id)
         task_document_ids = []
         if task_type in ["graphrag", "raptor", "mindmap"]:
             task_document_ids = task["doc_ids"]
@@ -0,0 +1,65 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Micro benchmark of the RAPTOR cluster-count search on synthetic Gaussian blobs,
+comparing the exhaustive search with the coarse-to-fine one.
+
+    python rag/t_raptor_cluster.py --chunks 2000 --blobs 20
+    python rag/t_raptor_cluster.py --chunks 20000 --workers 8 --method kmeans
+"""
+
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../')))
+
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+
+from rag.raptor_cluster import normalize, optimal_n_clusters
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(0, 5, (args.blobs, args.dim))
+    embeddings = centers[rng.integers(0, args.blobs, args.chunks)] + rng.normal(0, 0.5, (args.chunks, args.dim))
+    if args.method == "kmeans":
+        embeddings = normalize(embeddings)
+
+    for search in ["exhaustive", "coarse"]:
+        st = timer()
+        n = optimal_n_clusters(embeddings, args.max_cluster, args.seed, method=args.method, search=search, workers=args.workers)
+        print(f"{search}: {n} clusters for {args.chunks} chunks in {timer() - st:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", help="Number of chunks in the layer. Default: 2000", type=int, default=2000)
+    parser.add_argument("--blobs", help="Number of generated clusters. Default: 20", type=int, default=20)
+    parser.add_argument("--dim", help="Dimension of the (reduced) embeddings. Default: 12", type=int, default=12)
+    parser.add_argument("--max_cluster", help="RAPTOR max_cluster. Default: 64", type=int, default=64)
+    parser.add_argument("--method", help="gmm or kmeans. Default: gmm", default="gmm")
+    parser.add_argument("--workers", help="Processes fitting candidates. Default: 1", type=int, default=1)
+    parser.add_argument("--seed", help="Random seed. Default: 0", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,150 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Token-budgeted embedding of chunk texts.
+
+Texts are deduplicated (within the call and, through a process-local LRU, across
+tasks), packed into batches bounded by a token budget as well as by
+EMBEDDING_BATCH_SIZE, and encoded with up to EMBEDDING_MAX_INFLIGHT batches in
+flight per embedding model. Models are told apart by tenant, factory, name and
+base URL, so same-named models of different providers never share vectors.
+Vectors land in a matrix allocated once.
+"""
+
+import asyncio
+import os
+from collections import OrderedDict
+
+import numpy as np
+import xxhash
+
+from common import settings
+from common.token_utils import num_tokens_from_string
+
+EMBEDDING_BATCH_TOKENS = int(os.environ.get("EMBEDDING_BATCH_TOKENS", "8192"))
+EMBEDDING_MAX_INFLIGHT = int(os.environ.get("EMBEDDING_MAX_INFLIGHT", "2"))
+EMBEDDING_DEDUP_CACHE_SIZE = int(os.environ.get("EMBEDDING_DEDUP_CACHE_SIZE", "4096"))
+
+_provider_limiters = {}
+_recent_vectors = OrderedDict()
+
+
+def model_key(mdl):
+    """Identity of the embedding model behind an LLMBundle."""
+    return (getattr(mdl, "tenant_id", ""), getattr(mdl, "llm_factory", ""), mdl.llm_name, getattr(mdl, "api_base", ""))
+
+
+def _provider_limiter(mdl_key):
+    if mdl_key not in _provider_limiters:
+        _provider_limiters[mdl_key] = asyncio.Semaphore(EMBEDDING_MAX_INFLIGHT)
+    return _provider_limiters[mdl_key]
+
+
+def _recent_key(mdl_key, txt):
+    return mdl_key, xxhash.xxh128_hexdigest(txt.encode("utf-8"))
+
+
+def _get_recent(key):
+    v = _recent_vectors.get(key)
+    if v is not None:
+        _recent_vectors.move_to_end(key)
+    return v
+
+
+def _put_recent(key, v):
+    if EMBEDDING_DEDUP_CACHE_SIZE <= 0:
+        return
+    _recent_vectors[key] = v
+    _recent_vectors.move_to_end(key)
+    while len(_recent_vectors) > EMBEDDING_DEDUP_CACHE_SIZE:
+        _recent_vectors.popitem(last=False)
+
+
+def pack_batches(token_counts, max_tokens, max_items):
+    """Consecutive index batches holding at most `max_items` items and, unless a single item exceeds it, `max_tokens` tokens."""
+    batches, cur, cur_tokens = [], [], 0
+    for i, n in enumerate(token_counts):
+        if cur and (len(cur) >= max_items or cur_tokens + n > max_tokens):
+            batches.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+async def encode_batched(mdl_key, texts, encode, max_length=None, callback=None, limiter=None):
+    """
+    Embeds `texts` with the blocking `encode(list[str]) -> (np.ndarray, token_count)`, `mdl_key`
+    being the `model_key` of the model. Returns the vectors in the order of `texts` and the consumed tokens.
+    `callback(ratio)` is called as batches complete. Every batch also holds `limiter`, if given, while encoding.
+    """
+    if not texts:
+        return np.array([]), 0
+
+    uniq = {}
+    inverse = np.array([uniq.setdefault(t, len(uniq)) for t in texts], dtype=np.int64)
+    uniq = list(uniq)
+    vects = None
+
+    def put(js, vts):
+        nonlocal vects
+        if vects is None:
+            vects = np.empty((len(uniq), len(vts[0])), dtype=np.asarray(vts).dtype)
+        vects[js] = vts
+
+    todo = []
+    for j, t in enumerate(uniq):
+        v = _get_recent(_recent_key(mdl_key, t))
+        if v is None:
+            todo.append(j)
+        else:
+            put([j], [v])
+
+    token_counts = await asyncio.to_thread(
+        lambda: [min(num_tokens_from_string(uniq[j]), max_length or EMBEDDING_BATCH_TOKENS) for j in todo])
+    batches = [[todo[i] for i in b] for b in pack_batches(token_counts, EMBEDDING_BATCH_TOKENS, settings.EMBEDDING_BATCH_SIZE)]
+
+    provider_limiter = _provider_limiter(mdl_key)
+    tk_count, done = 0, 0
+
+    async def run(js):
+        nonlocal tk_count, done
+        async with provider_limiter:
+            if limiter is None:
+                vts, c = await asyncio.to_thread(encode, [uniq[j] for j in js])
+            else:
+                async with limiter:
+                    vts, c = await asyncio.to_thread(encode, [uniq[j] for j in js])
+        put(js, vts)
+        for j, v in zip(js, vts):
+            _put_recent(_recent_key(mdl_key, uniq[j]), np.array(v))
+        tk_count += c
+        done += len(js)
+        if callback:
+            callback(done / len(todo))
+
+    tasks = [asyncio.create_task(run(b)) for b in batches]
+    try:
+        await asyncio.gather(*tasks)
+    except Exception:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    return vects[inverse], tk_count
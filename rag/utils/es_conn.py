@@ -16,19 +16,98 @@
 
 import re
 import json
+import math
+import os
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
 
 import copy
+import numpy as np
 from elasticsearch_dsl import UpdateByQuery, Q, Search
 from elastic_transport import ConnectionTimeout
 from common.decorator import singleton
-from common.doc_store.doc_store_base import MatchTextExpr, OrderByExpr, MatchExpr, MatchDenseExpr, FusionExpr
+from common.doc_store.doc_store_base import MatchTextExpr, OrderByExpr, MatchExpr, MatchDenseExpr, FusionExpr, \
+    DOC_STORE_SLIM_SEARCH, VECTOR_SIMILARITY_FLD
 from common.doc_store.es_conn_base import ESConnectionBase
 from common.float_utils import get_float
 from common.constants import PAGERANK_FLD, TAG_FLD
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
 ATTEMPT_TIME = 2
 
+# Bulk requests of an insert are cut at ES_BULK_MAX_BYTES and up to ES_BULK_CONCURRENCY of them are in flight.
+ES_BULK_MAX_BYTES = int(os.environ.get("ES_BULK_MAX_BYTES", 10 * 1024 * 1024))
+ES_BULK_CONCURRENCY = int(os.environ.get("ES_BULK_CONCURRENCY", 1))
+
+# Single-valued keyword and integer fields read from doc values by slim searches.
+DOCVALUE_FIELDS = {"doc_id", "kb_id", "img_id", "docnm_kwd", "mom_id", "doc_type_kwd", "knowledge_graph_kwd", "available_int"}
+
+COSINE_SIMILARITY_SCRIPT = """
+if (doc[params.field].size() == 0) { return 0.0; }
+float[] v = doc[params.field].vectorValue;
+double dot = 0.0;
+for (int i = 0; i < v.length; ++i) { dot += v[i] * (double) params.qv[i]; }
+double n = doc[params.field].magnitude * params.qn;
+return n == 0 ? 0.0 : dot / n;
+"""
+
+
+def _json_default(o):
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def ndjson_line(obj) -> bytes:
+    """`obj` as one line of a bulk request body, NumPy arrays are encoded by orjson as they are."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_json_default,
+                                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            # e.g. lone surrogates, which orjson refuses
+            pass
+    return (json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default) + "\n").encode("utf-8", "surrogatepass")
+
+
+def bulk_bodies(documents: list[dict], index_name: str, knowledgebase_id: str = None, max_bytes: int = None) -> list[tuple[int, bytes]]:
+    """
+    (document count, NDJSON body) of the bulk requests indexing `documents`, cut at `max_bytes` (ES_BULK_MAX_BYTES).
+    Documents are serialized straight to NDJSON, the chunks of the caller are neither copied nor modified.
+    """
+    max_bytes = ES_BULK_MAX_BYTES if max_bytes is None else max_bytes
+    bulks = []
+    lines, size = [], 0
+    for d in documents:
+        assert "_id" not in d
+        assert "id" in d
+        doc = {k: v for k, v in d.items() if k != "id"}
+        doc["kb_id"] = knowledgebase_id
+        op = ndjson_line({"index": {"_index": index_name, "_id": d["id"]}}) + ndjson_line(doc)
+        if lines and size + len(op) > max_bytes:
+            bulks.append((len(lines), b"".join(lines)))
+            lines, size = [], 0
+        lines.append(op)
+        size += len(op)
+    if lines:
+        bulks.append((len(lines), b"".join(lines)))
+    return bulks
+
 
 @singleton
 class ESConnection(ESConnectionBase):
@@ -69,6 +148,9 @@ class ESConnection(ESConnectionBase):
                 continue
             if not v:
                 continue
+            if k == "id":
+                bool_query.filter.append(Q("ids", values=v if isinstance(v, list) else [v]))
+                continue
             if isinstance(v, list):
                 bool_query.filter.append(Q("terms", **{k: v}))
             elif isinstance(v, str) or isinstance(v, int):
@@ -79,6 +161,7 @@ class ESConnection(ESConnectionBase):
 
         s = Search()
         vector_similarity_weight = 0.5
+        script_fields = {}
         for m in match_expressions:
             if isinstance(m, FusionExpr) and m.method == "weighted_sum" and "weights" in m.fusion_params:
                 assert len(match_expressions) == 3 and isinstance(match_expressions[0], MatchTextExpr) and isinstance(
@@ -110,6 +193,11 @@ class ESConnection(ESConnectionBase):
                           filter=bool_query.to_dict(),
                           similarity=similarity,
                           )
+                if m.extra_options.get(VECTOR_SIMILARITY_FLD):
+                    qv = [float(v) for v in m.embedding_data]
+                    script_fields[VECTOR_SIMILARITY_FLD] = {"script": {
+                        "source": COSINE_SIMILARITY_SCRIPT,
+                        "params": {"field": m.vector_column_name, "qv": qv, "qn": math.sqrt(sum(v * v for v in qv))}}}
 
         if bool_query and rank_feature:
             for fld, sc in rank_feature.items():
@@ -141,6 +229,21 @@ class ESConnection(ESConnectionBase):
 
         if limit > 0:
             s = s[offset:offset + limit]
+        source, track_total_hits = True, True
+        if DOC_STORE_SLIM_SEARCH:
+            if script_fields:
+                s = s.script_fields(**script_fields)
+            if select_fields:
+                fields = set(select_fields) - {"id", "_score", VECTOR_SIMILARITY_FLD}
+                if highlight_fields:
+                    fields.add("content_with_weight")
+                docvalue_fields = sorted(fields & DOCVALUE_FIELDS)
+                if docvalue_fields:
+                    s = s.extra(docvalue_fields=docvalue_fields)
+                source = sorted(fields - DOCVALUE_FIELDS) or False
+            if match_expressions:
+                # Relevance searches only tell whether there are hits, the default bound is exact enough.
+                track_total_hits = None
         q = s.to_dict()
         self.logger.debug(f"ESConnection.search {str(index_names)} query: " + json.dumps(q))
 
@@ -151,8 +254,8 @@ class ESConnection(ESConnectionBase):
                                      body=q,
                                      timeout="600s",
                                      # search_type="dfs_query_then_fetch",
-                                     track_total_hits=True,
-                                     _source=True)
+                                     track_total_hits=track_total_hits,
+                                     _source=source)
                 if str(res.get("timed_out", "")).lower() == "true":
                     raise Exception("Es Timeout.")
                 self.logger.debug(f"ESConnection.search {str(index_names)} res: " + str(res))
@@ -170,23 +273,24 @@ class ESConnection(ESConnectionBase):
 
     def insert(self, documents: list[dict], index_name: str, knowledgebase_id: str = None) -> list[str]:
         # Refers to https://www.elastic.co/guide/en/elasticsearch/reference/current/docs-bulk.html
-        operations = []
-        for d in documents:
-            assert "_id" not in d
-            assert "id" in d
-            d_copy = copy.deepcopy(d)
-            d_copy["kb_id"] = knowledgebase_id
-            meta_id = d_copy.pop("id", "")
-            operations.append(
-                {"index": {"_index": index_name, "_id": meta_id}})
-            operations.append(d_copy)
+        bulks = bulk_bodies(documents, index_name, knowledgebase_id)
+        if len(bulks) > 1 and ES_BULK_CONCURRENCY > 1:
+            with ThreadPoolExecutor(max_workers=min(ES_BULK_CONCURRENCY, len(bulks))) as executor:
+                results = list(executor.map(lambda b: self._bulk(index_name, *b), bulks))
+        else:
+            results = [self._bulk(index_name, *b) for b in bulks]
+        return [e for r in results for e in r]
 
+    def _bulk(self, index_name: str, doc_count: int, body: bytes) -> list[str]:
         res = []
         for _ in range(ATTEMPT_TIME):
             try:
                 res = []
-                r = self.es.bulk(index=index_name, operations=operations,
+                st = time.perf_counter()
+                r = self.es.bulk(index=index_name, operations=body,
                                  refresh=False, timeout="60s")
+                self.logger.debug(f"ESConnection.insert {index_name}: {doc_count} documents, {len(body)} bytes "
+                                  f"in {(time.perf_counter() - st) * 1000:.1f}ms")
                 if re.search(r"False", str(r["errors"]), re.IGNORECASE):
                     return res
 
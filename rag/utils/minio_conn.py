@@ -139,6 +139,28 @@ class RAGFlowMinio:
                 self.__open__()
                 time.sleep(1)
 
+    @use_default_bucket
+    @use_prefix_path
+    def put_stream(self, bucket, fnm, open_stream, tenant_id=None):
+        """Multipart upload of the file-like `open_stream()` returns, reopened on every attempt."""
+        for i in range(3):
+            try:
+                if not self.bucket and not self.conn.bucket_exists(bucket):
+                    self.conn.make_bucket(bucket)
+
+                stream = open_stream()
+                try:
+                    return self.conn.put_object(bucket, fnm, stream, -1, part_size=16 * 1024 * 1024)
+                finally:
+                    if hasattr(stream, "close"):
+                        stream.close()
+            except Exception:
+                logging.exception(f"Fail to put {bucket}/{fnm}:")
+                if i == 2:
+                    raise
+                self.__open__()
+                time.sleep(1)
+
     @use_default_bucket
     @use_prefix_path
     def rm(self, bucket, fnm, tenant_id=None):
@@ -27,7 +27,7 @@ from opensearchpy import ConnectionTimeout
 from common.decorator import singleton
 from common.file_utils import get_project_base_directory
 from common.doc_store.doc_store_base import DocStoreConnection, MatchExpr, OrderByExpr, MatchTextExpr, MatchDenseExpr, \
-    FusionExpr
+    FusionExpr, DOC_STORE_SLIM_SEARCH
 from rag.nlp import is_english, rag_tokenizer
 from common.constants import PAGERANK_FLD, TAG_FLD
 from common import settings
@@ -245,14 +245,24 @@ class OSConnection(DocStoreConnection):
             del q["query"]
             q["query"] = {"knn": knn_query}
 
+        source, track_total_hits = True, True
+        if DOC_STORE_SLIM_SEARCH:
+            if selectFields:
+                fields = set(selectFields) - {"id", "_score"}
+                if highlightFields:
+                    fields.add("content_with_weight")
+                source = sorted(fields) or True
+            if matchExprs:
+                track_total_hits = None
+
         for i in range(ATTEMPT_TIME):
             try:
                 res = self.os.search(index=indexNames,
                                      body=q,
                                      timeout=600,
                                      # search_type="dfs_query_then_fetch",
-                                     track_total_hits=True,
-                                     _source=True)
+                                     track_total_hits=track_total_hits,
+                                     _source=source)
                 if str(res.get("timed_out", "")).lower() == "true":
                     raise Exception("OpenSearch Timeout.")
                 logger.debug(f"OSConnection.search {str(indexNames)} res: " + str(res))
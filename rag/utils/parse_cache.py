@@ -0,0 +1,205 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Content-addressed cache of parser output and chunk embeddings.
+
+Parsing (OCR, layout recognition, table structure) only depends on the file
+content, its name, the chunking configuration and the default vision and
+speech-to-text models, not on which document, knowledge base or tenant it
+belongs to. Entries are therefore keyed by a hash of those inputs and kept in
+object storage, so the same file uploaded into several knowledge bases is only
+parsed and embedded once.
+
+Entries are tracked in a Redis sorted set by last use. Those unused for
+PARSE_CACHE_TTL seconds, and the least recently used beyond
+PARSE_CACHE_MAX_ENTRIES, are removed from the bucket as new entries are stored.
+
+Parsers with side effects besides their chunks are not cached: the table and
+resume parsers record the field map of the knowledge base while chunking.
+"""
+
+import base64
+import json
+import logging
+import os
+import time
+import zlib
+from io import BytesIO
+
+import numpy as np
+import xxhash
+
+from common import settings
+from rag.utils.redis_conn import REDIS_CONN
+
+PARSE_CACHE_ENABLED = int(os.environ.get("PARSE_CACHE_ENABLED", "0"))
+PARSE_CACHE_BUCKET = os.environ.get("PARSE_CACHE_BUCKET", "ragflow-parse-cache")
+PARSE_CACHE_TTL = int(os.environ.get("PARSE_CACHE_TTL", 7 * 24 * 3600))
+PARSE_CACHE_MAX_ENTRIES = int(os.environ.get("PARSE_CACHE_MAX_ENTRIES", 100000))
+# Sorted set of the stored entries, scored by their last use.
+PARSE_CACHE_INDEX = "parse_cache:entries"
+
+# Their chunker updates the knowledge base, which a cache hit would skip.
+PARSE_CACHE_EXCLUDED_PARSERS = {"table", "resume"}
+
+# Only affects post-parse stages, so it must not split cache entries.
+_NON_PARSING_CONFIG_KEYS = {"raptor", "graphrag", "auto_keywords", "auto_questions", "enable_metadata", "metadata",
+                            "tag_kb_ids", "topn_tags", "filename_embd_weight"}
+
+
+def content_hash(binary: bytes) -> str:
+    return xxhash.xxh3_128_hexdigest(binary or b"")
+
+
+def is_cacheable(parser_id: str) -> bool:
+    return str(parser_id).lower() not in PARSE_CACHE_EXCLUDED_PARSERS
+
+
+def parse_cache_key(binary_hash: str, name: str, parser_id: str, parser_config: dict, from_page: int,
+                    to_page: int, lang: str, img2txt_id: str = "", asr_id: str = "") -> str:
+    """`img2txt_id` and `asr_id` are the tenant's default models, which picture, audio and figure parsing use."""
+    hasher = xxhash.xxh3_128()
+    hasher.update(binary_hash.encode("utf-8"))
+    hasher.update(str(name).encode("utf-8", "surrogatepass"))
+    hasher.update(str(parser_id).lower().encode("utf-8"))
+    conf = {k: v for k, v in (parser_config or {}).items() if k not in _NON_PARSING_CONFIG_KEYS}
+    hasher.update(json.dumps(conf, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    for v in [from_page, to_page, lang, img2txt_id, asr_id]:
+        hasher.update(str(v or "").encode("utf-8"))
+        hasher.update(b"\x00")
+    return hasher.hexdigest()
+
+
+def embedding_cache_key(mdl_name: str, texts: list[str]) -> str:
+    hasher = xxhash.xxh3_128()
+    hasher.update(str(mdl_name).encode("utf-8"))
+    for t in texts:
+        hasher.update(str(t).encode("utf-8", "surrogatepass"))
+        hasher.update(b"\x00")
+    return hasher.hexdigest()
+
+
+def _json_default(o):
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, bytes):
+        return base64.b64encode(o).decode("ascii")
+    raise TypeError(f"Object of type {type(o).__name__} is not cacheable")
+
+
+def _image_to_bytes(img):
+    if isinstance(img, bytes):
+        return img
+    with BytesIO() as buf:
+        if img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        img.save(buf, format="JPEG")
+        return buf.getvalue()
+
+
+def _evict():
+    """Removes the entries unused for PARSE_CACHE_TTL seconds and the least recently used beyond PARSE_CACHE_MAX_ENTRIES."""
+    expire_before = time.time() - PARSE_CACHE_TTL
+    names = list(REDIS_CONN.zrangebyscore(PARSE_CACHE_INDEX, 0, expire_before) or [])
+    if names:
+        REDIS_CONN.zremrangebyscore(PARSE_CACHE_INDEX, 0, expire_before)
+    overflow = REDIS_CONN.zcount(PARSE_CACHE_INDEX, 0, float("inf")) - PARSE_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        names.extend(n for n, _ in REDIS_CONN.zpopmin(PARSE_CACHE_INDEX, overflow) or [])
+    for name in names:
+        name = name.decode("utf-8") if isinstance(name, bytes) else name
+        try:
+            settings.STORAGE_IMPL.rm(PARSE_CACHE_BUCKET, name)
+        except Exception as e:
+            logging.warning(f"Parse cache: fail to remove {name}: {e}")
+
+
+def _load(name: str):
+    try:
+        if not settings.STORAGE_IMPL.obj_exist(PARSE_CACHE_BUCKET, name):
+            return None
+        bin = settings.STORAGE_IMPL.get(PARSE_CACHE_BUCKET, name)
+    except Exception:
+        logging.exception(f"Parse cache: fail to load {name}")
+        return None
+    REDIS_CONN.zadd(PARSE_CACHE_INDEX, name, time.time())
+    return bin
+
+
+def _store(name: str, binary: bytes):
+    try:
+        settings.STORAGE_IMPL.put(PARSE_CACHE_BUCKET, name, binary)
+    except Exception:
+        logging.exception(f"Parse cache: fail to store {name}")
+        return
+    REDIS_CONN.zadd(PARSE_CACHE_INDEX, name, time.time())
+    _evict()
+
+
+def get_cached_chunks(key: str) -> list[dict] | None:
+    bin = _load(f"chunks/{key}")
+    if not bin:
+        return None
+    try:
+        chunks = json.loads(zlib.decompress(bin))
+    except Exception:
+        logging.exception(f"Parse cache: corrupted entry {key}")
+        return None
+    for ck in chunks:
+        if ck.get("image"):
+            ck["image"] = base64.b64decode(ck["image"])
+    return chunks
+
+
+def set_cached_chunks(key: str, chunks: list[dict]):
+    """
+    Chunks are stored as produced by the chunker, before any document
+    specific field is attached. Images are kept as JPEG bytes, which
+    `image2id` accepts as well as PIL images.
+    """
+    payload = []
+    try:
+        for ck in chunks:
+            ck = dict(ck)
+            if ck.get("image") is not None:
+                ck["image"] = base64.b64encode(_image_to_bytes(ck["image"])).decode("ascii")
+            payload.append(ck)
+        bin = zlib.compress(json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8"))
+    except Exception as e:
+        logging.warning(f"Parse cache: skip caching {key}: {e}")
+        return
+    _store(f"chunks/{key}", bin)
+
+
+def get_cached_embeddings(mdl_name: str, texts: list[str]) -> np.ndarray | None:
+    bin = _load(f"embeddings/{embedding_cache_key(mdl_name, texts)}")
+    if not bin:
+        return None
+    try:
+        vects = np.load(BytesIO(bin), allow_pickle=False)
+    except Exception:
+        return None
+    if vects.ndim != 2 or vects.shape[0] != len(texts):
+        return None
+    return vects
+
+
+def set_cached_embeddings(mdl_name: str, texts: list[str], vects: np.ndarray):
+    with BytesIO() as buf:
+        np.save(buf, np.asarray(vects, dtype=np.float32), allow_pickle=False)
+        _store(f"embeddings/{embedding_cache_key(mdl_name, texts)}", buf.getvalue())
@@ -113,6 +113,7 @@ class RedisDB:
 
     def __init__(self):
         self.REDIS = None
+        self.REDIS_BIN = None
         self.config = REDIS
         self.__open__()
 
@@ -138,6 +139,8 @@ class RedisDB:
                 conn_params["password"] = password
 
             self.REDIS = redis.StrictRedis(**conn_params)
+            # Same server, without response decoding, for values which are raw bytes.
+            self.REDIS_BIN = redis.StrictRedis(**{**conn_params, "decode_responses": False})
 
             self.register_scripts()
         except Exception as e:
@@ -188,6 +191,48 @@ class RedisDB:
             logging.warning("RedisDB.get " + str(k) + " got exception: " + str(e))
             self.__open__()
 
+    def get_bin(self, k):
+        if not self.REDIS_BIN:
+            return None
+        try:
+            return self.REDIS_BIN.get(k)
+        except Exception as e:
+            logging.warning("RedisDB.get_bin " + str(k) + " got exception: " + str(e))
+            self.__open__()
+
+    def set_bin(self, k, v: bytes, exp=3600):
+        try:
+            self.REDIS_BIN.set(k, v, exp)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.set_bin " + str(k) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def mget_bin(self, keys: list[str]) -> list:
+        if not self.REDIS_BIN or not keys:
+            return [None] * len(keys)
+        try:
+            return self.REDIS_BIN.mget(keys)
+        except Exception as e:
+            logging.warning("RedisDB.mget_bin " + str(len(keys)) + " keys got exception: " + str(e))
+            self.__open__()
+        return [None] * len(keys)
+
+    def mset_bin(self, mapping: dict, exp=3600):
+        if not mapping:
+            return True
+        try:
+            pipe = self.REDIS_BIN.pipeline(transaction=False)
+            for k, v in mapping.items():
+                pipe.set(k, v, exp)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.mset_bin " + str(len(mapping)) + " keys got exception: " + str(e))
+            self.__open__()
+        return False
+
     def set_obj(self, k, obj, exp=3600):
         try:
             self.REDIS.set(k, json.dumps(obj, ensure_ascii=False), exp)
@@ -235,6 +280,23 @@ class RedisDB:
             self.__open__()
         return None
 
+    def hget(self, key: str, field: str):
+        try:
+            return self.REDIS.hget(key, field)
+        except Exception as e:
+            logging.warning("RedisDB.hget " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return None
+
+    def hset(self, key: str, mapping: dict):
+        try:
+            self.REDIS.hset(key, mapping=mapping)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.hset " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
     def zadd(self, key: str, member: str, score: float):
         try:
             self.REDIS.zadd(key, {member: score})
@@ -146,6 +146,28 @@ class RAGFlowS3:
                 self.__open__()
                 time.sleep(1)
 
+    @use_prefix_path
+    @use_default_bucket
+    def put_stream(self, bucket, fnm, open_stream, *args, **kwargs):
+        """Multipart upload of the file-like `open_stream()` returns, reopened on every attempt."""
+        for i in range(3):
+            try:
+                if not self.bucket_exists(bucket):
+                    self.conn[0].create_bucket(Bucket=bucket)
+                    logging.info(f"create bucket {bucket} ********")
+                stream = open_stream()
+                try:
+                    return self.conn[0].upload_fileobj(stream, bucket, fnm)
+                finally:
+                    if hasattr(stream, "close"):
+                        stream.close()
+            except Exception:
+                logging.exception(f"Fail put {bucket}/{fnm}")
+                if i == 2:
+                    raise
+                self.__open__()
+                time.sleep(1)
+
     @use_prefix_path
     @use_default_bucket
     def rm(self, bucket, fnm, *args, **kwargs):
@@ -0,0 +1,198 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests checking that tag vocabularies and sparse tag feature scoring agree with the search-based tagging.
+"""
+
+import json
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import rag.nlp.tag_vocabulary as tag_vocabulary
+from rag.nlp.search import Dealer
+from rag.nlp.tag_vocabulary import TagVocabulary, TagVocabularyCache, decode_tag_features, tag_feature_scores
+
+# (chunk terms, tags) of a tag knowledge base
+TAG_ROWS = [
+    ("invoice payment due", ["finance", "billing"]),
+    ("payment refund card", ["finance", "refund"]),
+    ("refund policy return", ["refund", "policy"]),
+    ("password reset login", ["account"]),
+    ("login two factor", ["account", "security"]),
+    ("security breach report", ["security"]),
+    ("invoice tax vat", ["finance", "tax"]),
+    ("shipping delay parcel", ["shipping"]),
+    ("parcel return label", ["shipping", "refund"]),
+    ("card declined payment", ["billing", "finance"]),
+]
+
+
+class FakeTagStore:
+    """Doc store answering the tag_kwd aggregation searches of `Dealer` over TAG_ROWS."""
+
+    def search(self, selectFields, highlightFields, condition, matchExprs, orderBy, offset, limit, indexNames,
+               knowledgebaseIds, aggFields=None):
+        terms = matchExprs[0] if matchExprs else None
+        return [tags for txt, tags in TAG_ROWS if terms is None or terms & set(txt.split())]
+
+    def get_aggregation(self, res, fieldnm):
+        counts = Counter(t for tags in res for t in set(tags))
+        return sorted(counts.items(), key=lambda x: (-x[1], x[0]))
+
+
+class FakeQueryer:
+    def question(self, question, min_match=0.0):
+        terms = set(question.split())
+        return terms, sorted(terms)
+
+
+@pytest.fixture
+def dealer():
+    dealer = Dealer.__new__(Dealer)
+    dealer.dataStore = FakeTagStore()
+    dealer.qryr = FakeQueryer()
+    return dealer
+
+
+def legacy_rank_feature_scores(query_rfea, values):
+    """Scoring of `Dealer._rank_feature_scores` before tag features were decoded once and scored as sparse vectors."""
+    rank_fea = []
+    q_denor = np.sqrt(np.sum([s * s for t, s in query_rfea.items()]))
+    for v in values:
+        nor, denor = 0, 0
+        if not v:
+            rank_fea.append(0)
+            continue
+        for t, sc in eval(v).items():
+            if t in query_rfea:
+                nor += query_rfea[t] * sc
+            denor += sc * sc
+        if denor == 0:
+            rank_fea.append(0)
+        else:
+            rank_fea.append(nor / np.sqrt(denor) / q_denor)
+    return np.array(rank_fea)
+
+
+class TestTagVocabularyLabel:
+    """Test labelling a question from the vocabulary against the aggregation search"""
+
+    @pytest.mark.parametrize("question", [
+        "payment",
+        "refund return",
+        "login security",
+        "invoice card payment parcel",
+        "password",
+        "unrelated words",
+    ])
+    @pytest.mark.parametrize("topn_tags", [1, 3, 10])
+    @pytest.mark.parametrize("S", [1000, 5])
+    def test_same_tags_as_tag_query(self, dealer, question, topn_tags, S):
+        all_tags = dealer.all_tags_in_portion("tenant", ["kb"], S)
+        expected = dealer.tag_query(question, "tenant", ["kb"], all_tags, topn_tags, S)
+        assert TagVocabulary(TAG_ROWS).label(set(question.split()), topn_tags, S) == expected
+
+    def test_prior_matches_all_tags_in_portion(self, dealer):
+        vocab = TagVocabulary(TAG_ROWS)
+        all_tags = dealer.all_tags_in_portion("tenant", ["kb"], 1000)
+        assert dict(zip(vocab.tags, vocab.prior(1000))) == pytest.approx(all_tags)
+
+    def test_tags_with_dots(self):
+        vocab = TagVocabulary([("a b", ["v1.2"]), ("b c", ["v1.2", "x"])])
+        assert set(vocab.label({"a"})) == {"v1_2"}
+
+    def test_empty_vocabulary(self):
+        assert TagVocabulary([]).label({"payment"}) == {}
+
+
+class PagedTagStore:
+    """Doc store paging through `n` tag chunks within a result window."""
+
+    def __init__(self, n, fail=False):
+        self.n, self.fail, self.searches = n, fail, 0
+
+    def search(self, selectFields, highlightFields, condition, matchExprs, orderBy, offset, limit, indexNames,
+               knowledgebaseIds, aggFields=None):
+        self.searches += 1
+        if self.fail:
+            raise Exception("search failed")
+        assert offset + limit <= tag_vocabulary.MAX_RESULT_WINDOW
+        return list(range(offset, min(offset + limit, self.n)))
+
+    def get_fields(self, res, fields):
+        return {f"chunk{i}": {"content_ltks": f"term{i}", "important_kwd": ["kwd"], "tag_kwd": ["tag"]} for i in res}
+
+
+class TestTagVocabularyCache:
+    """Test loading vocabularies from the doc store"""
+
+    @pytest.mark.parametrize("n,loaded", [(100, True), (9999, True), (10000, False), (50000, False)])
+    def test_stays_within_result_window(self, monkeypatch, n, loaded):
+        monkeypatch.setattr(tag_vocabulary, "TAG_VOCAB_MAX_ROWS", 9999)
+        vocab = TagVocabularyCache().get(PagedTagStore(n), ["idx"], ["kb"])
+        assert (vocab is not None) == loaded
+        if loaded:
+            assert vocab.n_rows == n
+            assert vocab.label({"kwd"}) == {"tag": 1}
+
+    def test_failure_is_cached(self, monkeypatch):
+        monkeypatch.setattr(tag_vocabulary, "TAG_VOCAB_MAX_ROWS", 100)
+        store, cache = PagedTagStore(10, fail=True), TagVocabularyCache()
+        assert cache.get(store, ["idx"], ["kb"]) is None
+        assert cache.get(store, ["idx"], ["kb"]) is None
+        assert store.searches == 1
+
+
+class TestTagFeatureScores:
+    """Test sparse tag feature scoring against the per-chunk eval loop it replaced"""
+
+    VALUES = [
+        "{'finance': 3, 'billing': 1}",
+        json.dumps({"refund": 2, "policy": 5}),
+        "{'account': 4}",
+        None,
+        "",
+        "{'finance': 0}",
+        "{'finance': 1.5, 'tax': 2, 'refund': 1}",
+        "{'finance': 3, 'billing': 1}",
+    ]
+
+    @pytest.mark.parametrize("query_rfea", [
+        {"finance": 2},
+        {"finance": 1, "refund": 3},
+        {"account": 1, "security": 2, "shipping": 7},
+        {"nothing": 1},
+    ])
+    def test_same_scores_as_legacy(self, query_rfea):
+        np.testing.assert_allclose(tag_feature_scores(query_rfea, self.VALUES),
+                                   legacy_rank_feature_scores(query_rfea, self.VALUES))
+
+    def test_dict_values_score_like_their_repr(self):
+        query_rfea = {"finance": 1, "refund": 3}
+        values = [{"finance": 3, "billing": 1}, {"refund": 2, "policy": 5}]
+        np.testing.assert_allclose(tag_feature_scores(query_rfea, values),
+                                   tag_feature_scores(query_rfea, [str(v) for v in values]))
+
+    def test_no_query_tags(self):
+        np.testing.assert_array_equal(tag_feature_scores({}, self.VALUES), np.zeros(len(self.VALUES)))
+
+    @pytest.mark.parametrize("value", ["not a dict", "[1, 2]", "{'a': "])
+    def test_undecodable_values(self, value):
+        assert decode_tag_features(value) is None
+        assert tag_feature_scores({"a": 1}, [value])[0] == 0
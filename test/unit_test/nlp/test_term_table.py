@@ -0,0 +1,157 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for memory-mapped term tables and the term weight lookups going through them.
+"""
+
+import json
+import os
+
+import pytest
+
+from common.file_utils import get_project_base_directory
+from rag.nlp.term_table import TermTable
+from rag.nlp.term_weight import Dealer, load_dict
+
+FREQS = {"ab": 3, "abc": 0, "a": 7, "中国": 120, "中": 5, "über": 2, "zz top": 42}
+NER = {"google": "corp", "sql": "func", "beijing": "loca", "张": "firstnm"}
+
+
+def compiled(d, tmp_path, name="table"):
+    path = str(tmp_path / f"{name}.tbl")
+    TermTable.compile(d, path)
+    return TermTable(path)
+
+
+class TestTermTableLookup:
+    """Test lookups in a compiled table"""
+
+    @pytest.mark.parametrize("d", [FREQS, NER], ids=["int values", "str values"])
+    def test_same_items_as_dict(self, tmp_path, d):
+        table = compiled(d, tmp_path)
+        assert len(table) == len(d)
+        assert dict(table) == d
+        for k, v in d.items():
+            assert k in table
+            assert table[k] == v
+            assert table.get(k) == v
+
+    def test_keys_are_sorted_by_utf8(self, tmp_path):
+        assert list(compiled(FREQS, tmp_path)) == sorted(FREQS, key=lambda k: k.encode("utf-8"))
+
+    @pytest.mark.parametrize("key", ["", "b", "abcd", "ä", "中华", "zz", "zz top ", 1, None])
+    def test_missing_keys(self, tmp_path, key):
+        table = compiled(FREQS, tmp_path)
+        assert key not in table
+        assert table.get(key, "missing") == "missing"
+        with pytest.raises(KeyError):
+            table[key]
+
+    def test_empty_table(self, tmp_path):
+        table = compiled({}, tmp_path)
+        assert len(table) == 0
+        assert "a" not in table
+        assert list(table) == []
+
+    def test_not_a_term_table(self, tmp_path):
+        path = tmp_path / "bogus.tbl"
+        path.write_bytes(b"\0" * 64)
+        with pytest.raises(ValueError):
+            TermTable(str(path))
+
+    def test_shipped_ner_dictionary(self, tmp_path):
+        with open(os.path.join(get_project_base_directory(), "rag/res/ner.json")) as f:
+            ner = json.load(f)
+        table = compiled(ner, tmp_path, "ner")
+        assert len(table) == len(ner)
+        assert all(table[k] == v for k, v in ner.items())
+
+
+class TestTermTableLoad:
+    """Test compiling a table next to its source"""
+
+    @staticmethod
+    def write_freqs(path, d):
+        path.write_text("".join(f"{k}\t{v}\n" for k, v in d.items()), encoding="utf-8")
+
+    def test_compiled_next_to_source(self, tmp_path):
+        src = tmp_path / "term.freq"
+        self.write_freqs(src, {"ab": 3, "中国": 120})
+        table = TermTable.load(str(src), load_dict)
+        assert isinstance(table, TermTable)
+        assert os.path.exists(f"{src}.tbl")
+        assert dict(table) == {"ab": 3, "中国": 120}
+
+    def test_rebuilt_when_source_is_newer(self, tmp_path):
+        src = tmp_path / "term.freq"
+        self.write_freqs(src, {"ab": 3})
+        TermTable.load(str(src), load_dict)
+        self.write_freqs(src, {"ab": 4, "cd": 1})
+        tbl_mtime = os.path.getmtime(f"{src}.tbl")
+        os.utime(src, (tbl_mtime + 10, tbl_mtime + 10))
+        assert dict(TermTable.load(str(src), load_dict)) == {"ab": 4, "cd": 1}
+
+    def test_falls_back_to_dict(self, tmp_path, monkeypatch):
+        src = tmp_path / "term.freq"
+        self.write_freqs(src, {"ab": 3})
+
+        def fail(d, path):
+            raise OSError("read-only file system")
+
+        monkeypatch.setattr(TermTable, "compile", staticmethod(fail))
+        table = TermTable.load(str(src), load_dict)
+        assert type(table) is dict
+        assert table == {"ab": 3}
+
+
+class TestTermWeightLookups:
+    """Test that tokenization helpers give the same answers over a compiled table and over a dict"""
+
+    @pytest.fixture(params=["dict", "table"])
+    def dealer(self, request, tmp_path):
+        dealer = Dealer.__new__(Dealer)
+        dealer.stop_words = set()
+        dealer.ne = dict(NER) if request.param == "dict" else compiled(NER, tmp_path, "ner")
+        return dealer
+
+    @pytest.mark.parametrize("txt,expected", [
+        ("google  cloud", ["google cloud"]),
+        ("use sql server", ["use", "sql", "server"]),
+        ("中国 google\tbeijing", ["中国", "google beijing"]),
+        ("", []),
+    ])
+    def test_split(self, dealer, txt, expected):
+        assert dealer.split(txt) == expected
+
+    @pytest.mark.parametrize("t,expected", [
+        ("google", "corp"),
+        ("张", "firstnm"),
+        ("unknown", None),
+    ])
+    def test_ner(self, dealer, t, expected):
+        assert dealer.ner(t) == expected
+
+    @pytest.mark.parametrize("t,expected", [
+        ("google", 3),
+        ("sql", 1),
+        ("张", 1),
+        ("12.5", 2),
+        ("ab", 0.01),
+        ("unknown", 1),
+    ])
+    def test_ner_weight(self, dealer, t, expected):
+        assert dealer._ner_weight(t) == expected
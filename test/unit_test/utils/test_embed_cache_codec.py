@@ -0,0 +1,87 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the binary embedding cache codec.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+import graphrag.utils as graph_utils
+from graphrag.utils import EMBED_CACHE_MAGIC, decode_embed_cache, encode_embed_cache
+
+HEADER_SIZE = 9  # magic, dtype code, dimension
+
+
+@pytest.fixture
+def vector():
+    return np.random.default_rng(0).standard_normal(768).astype(np.float32)
+
+
+class TestEmbedCacheRoundTrip:
+    """Test encoding and decoding of cached vectors"""
+
+    def test_float32_is_lossless(self, vector):
+        bin = encode_embed_cache(vector, dtype_code=0)
+        assert bin[:len(EMBED_CACHE_MAGIC)] == EMBED_CACHE_MAGIC
+        assert len(bin) == HEADER_SIZE + 4 * len(vector)
+        decoded = decode_embed_cache(bin)
+        assert decoded.dtype == np.float32
+        np.testing.assert_array_equal(decoded, vector)
+
+    def test_float16_is_close(self, vector):
+        bin = encode_embed_cache(vector, dtype_code=1)
+        assert len(bin) == HEADER_SIZE + 2 * len(vector)
+        decoded = decode_embed_cache(bin)
+        assert decoded.dtype == np.float32
+        assert decoded.shape == vector.shape
+        np.testing.assert_allclose(decoded, vector, rtol=1e-3, atol=1e-3)
+
+    @pytest.mark.parametrize("dtype_code", [0, 1])
+    def test_default_dtype_follows_setting(self, monkeypatch, vector, dtype_code):
+        monkeypatch.setattr(graph_utils, "EMBED_CACHE_DTYPE", dtype_code)
+        assert encode_embed_cache(vector) == encode_embed_cache(vector, dtype_code=dtype_code)
+
+    @pytest.mark.parametrize("value", [
+        [0.5, -1.25, 3.0],
+        np.array([[0.5, -1.25, 3.0]]),
+        np.array([0.5, -1.25, 3.0], dtype=np.float64),
+    ])
+    def test_input_is_flattened_to_a_vector(self, value):
+        np.testing.assert_array_equal(decode_embed_cache(encode_embed_cache(value, dtype_code=0)), [0.5, -1.25, 3.0])
+
+    def test_decoded_vector_is_writable(self, vector):
+        decoded = decode_embed_cache(encode_embed_cache(vector, dtype_code=0))
+        decoded[0] = 42.
+        assert decoded[0] == 42.
+
+
+class TestEmbedCacheLegacy:
+    """Test entries written before the binary format"""
+
+    def test_json_list_is_decoded(self, vector):
+        legacy = json.dumps(vector.tolist()).encode("utf-8")
+        np.testing.assert_allclose(decode_embed_cache(legacy), vector)
+
+    def test_json_str_is_decoded(self):
+        np.testing.assert_array_equal(decode_embed_cache("[1.0, 2.0]"), [1.0, 2.0])
+
+    @pytest.mark.parametrize("value", [None, b"", ""])
+    def test_missing_entry(self, value):
+        assert decode_embed_cache(value) is None
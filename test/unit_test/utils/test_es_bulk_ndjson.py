@@ -0,0 +1,133 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the NDJSON bodies of Elasticsearch bulk inserts.
+"""
+
+import copy
+import json
+
+import numpy as np
+import pytest
+
+elastic_transport = pytest.importorskip("elastic_transport")
+
+from elastic_transport import NdjsonSerializer, SerializerCollection  # noqa: E402
+
+import rag.utils.es_conn as es_conn  # noqa: E402
+from rag.utils.es_conn import bulk_bodies, ndjson_line  # noqa: E402
+
+INDEX = "ragflow_tenant"
+KB_ID = "kb0"
+
+
+def chunk(i, **extra):
+    d = {
+        "id": f"chunk{i}",
+        "doc_id": "doc0",
+        "docnm_kwd": "报告 \"final\" .pdf",
+        "title_tks": "报告 final pdf",
+        "content_with_weight": f"Line {i}\twith \\ backslash, quotes \" and   separators — 中文内容 😀",
+        "content_ltks": "line with backslash quot and separ 中文 内容",
+        "important_kwd": ["alpha", "βeta"],
+        "page_num_int": [1, 2],
+        "position_int": [[1, 10, 200, 30, 40]],
+        "top_int": [30],
+        "available_int": 1,
+        "create_timestamp_flt": 1760000000.123456,
+        "tag_feas": {"finance": 3, "tax": 1},
+        "q_4_vec": [0.125, -0.5, 0.3333333333333333, 0.10000000149011612],
+    }
+    d.update(extra)
+    return d
+
+
+def legacy_body(documents, index_name, knowledgebase_id):
+    """Bulk body of `ESConnection.insert` before it serialized documents itself: operations encoded by the transport."""
+    operations = []
+    for d in documents:
+        d_copy = copy.deepcopy(d)
+        d_copy["kb_id"] = knowledgebase_id
+        meta_id = d_copy.pop("id", "")
+        operations.append({"index": {"_index": index_name, "_id": meta_id}})
+        operations.append(d_copy)
+    return NdjsonSerializer().dumps(operations)
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        if es_conn.orjson is None:
+            pytest.skip("orjson is not installed")
+    else:
+        monkeypatch.setattr(es_conn, "orjson", None)
+    return request.param
+
+
+class TestNdjsonBody:
+    """Test that bulk bodies are what the transport used to produce"""
+
+    def test_byte_identical_to_legacy(self, encoder):
+        documents = [chunk(i) for i in range(5)]
+        bulks = bulk_bodies(documents, INDEX, KB_ID)
+        assert [n for n, _ in bulks] == [5]
+        assert bulks[0][1] == legacy_body(documents, INDEX, KB_ID)
+
+    def test_documents_are_left_untouched(self, encoder):
+        documents = [chunk(i) for i in range(3)]
+        before = copy.deepcopy(documents)
+        bulk_bodies(documents, INDEX, KB_ID)
+        assert documents == before
+
+    def test_split_by_size(self, encoder):
+        documents = [chunk(i) for i in range(10)]
+        op_size = len(ndjson_line({"index": {"_index": INDEX, "_id": "chunk0"}})) + len(ndjson_line({**chunk(0), "kb_id": KB_ID}))
+        bulks = bulk_bodies(documents, INDEX, KB_ID, max_bytes=3 * op_size + 1)
+        assert [n for n, _ in bulks] == [3, 3, 3, 1]
+        assert b"".join(b for _, b in bulks) == legacy_body(documents, INDEX, KB_ID)
+
+    def test_oversized_document_gets_its_own_request(self, encoder):
+        bulks = bulk_bodies([chunk(0), chunk(1)], INDEX, KB_ID, max_bytes=1)
+        assert [n for n, _ in bulks] == [1, 1]
+
+    def test_numpy_vectors(self, encoder):
+        vec = np.array([0.125, -0.5, 0.3333333333333333], dtype=np.float64)
+        assert ndjson_line({"v": vec, "n": np.int64(3), "f": np.float64(0.25)}) == ndjson_line({"v": vec.tolist(), "n": 3, "f": 0.25})
+
+    def test_exponent_floats_parse_the_same(self, encoder):
+        d = chunk(0, q_4_vec=[1e-05, 3.2e-07, 1e16, -2.5e-300])
+        body = bulk_bodies([d], INDEX, KB_ID)[0][1]
+        legacy = legacy_body([d], INDEX, KB_ID)
+        assert [json.loads(line) for line in body.splitlines()] == [json.loads(line) for line in legacy.splitlines()]
+        if encoder == "json":
+            assert body == legacy
+
+    def test_lone_surrogates(self, encoder):
+        d = chunk(0, content_with_weight="broken \ud800 text")
+        assert bulk_bodies([d], INDEX, KB_ID)[0][1] == legacy_body([d], INDEX, KB_ID)
+
+
+class TestTransportPassthrough:
+    """Test that the transport sends the serialized body as it is"""
+
+    def test_ndjson_serializer_keeps_bytes(self):
+        body = bulk_bodies([chunk(i) for i in range(3)], INDEX, KB_ID)[0][1]
+        assert NdjsonSerializer().dumps(body) == body
+
+    def test_serializer_collection_keeps_bytes(self):
+        body = bulk_bodies([chunk(i) for i in range(3)], INDEX, KB_ID)[0][1]
+        assert SerializerCollection().dumps(body, mimetype="application/x-ndjson") == body